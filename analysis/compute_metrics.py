@@ -1,10 +1,25 @@
 # analysis/compute_metrics.py
-import argparse, glob, os, math, json
+import argparse, glob, os, sys, math, json, hashlib, time
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from collections import Counter
-from sklearn.metrics import confusion_matrix
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from common import profiling
+
+
+def pyplot():
+    """延迟导入 matplotlib（无界面后端），只在真正出图时才付出导入开销"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+def confusion_matrix(yt, yp, n_classes):
+    cm = np.zeros((n_classes, n_classes))
+    np.add.at(cm, (yt, yp), 1)
+    return cm
+
+# 分析逻辑（指标定义/输出格式）变化时递增，使旧缓存全部失效
+ANALYSIS_VERSION = 1
 
 def itr_bits_per_min(P, N, T):
     P = max(1e-9, min(1-1e-9, float(P)))
@@ -39,7 +54,7 @@ def compute_idle_fp_rate(df):
     return float(idle_fp_rate)
 
 def compute_per_freq_stats(df_trial):
-    """按频率计算统计信息"""
+    """按频率计算统计信息（一次 groupby 完成，不再逐频率过滤）"""
     if len(df_trial) == 0:
         return {}
     
@@ -49,31 +64,26 @@ def compute_per_freq_stats(df_trial):
     if not mask.any():
         return stats
     
-    for freq in df_trial.loc[mask, "true"].unique():
-        freq_mask = df_trial["true"] == freq
-        freq_data = df_trial[freq_mask]
-        
-        if len(freq_data) == 0:
-            continue
-            
-        # 准确率
-        acc = float(np.mean(freq_data["true"] == freq_data["pred"]))
-        
-        # 延迟统计
-        lats = freq_data["lat_first"].dropna().values
-        lat_median = float(np.median(lats)) if len(lats) > 0 else np.nan
-        lat_mean = float(np.mean(lats)) if len(lats) > 0 else np.nan
-        
+    # 只统计在有效 trial 中出现过的频率，顺序与出现顺序一致
+    freqs = pd.unique(df_trial.loc[mask, "true"])
+    d = df_trial[df_trial["true"].isin(freqs)]
+    g = d.assign(_hit=(d["true"] == d["pred"]).astype(float)).groupby("true", sort=False)
+    acc = g["_hit"].mean()
+    n = g.size()
+    lat_median = g["lat_first"].median()
+    lat_mean = g["lat_first"].mean()
+    
+    for freq in freqs:
         stats[freq] = {
-            "accuracy": acc,
-            "latency_median": lat_median,
-            "latency_mean": lat_mean,
-            "n_trials": len(freq_data)
+            "accuracy": float(acc[freq]),
+            "latency_median": float(lat_median[freq]),
+            "latency_mean": float(lat_mean[freq]),
+            "n_trials": int(n[freq])
         }
     
     return stats
 
-def plot_per_freq_acc(per_freq_stats, out_path, title="Per-frequency Accuracy"):
+def plot_per_freq_acc(per_freq_stats, out_path, title="Per-frequency Accuracy", dpi=200):
     """绘制各频率准确率条形图"""
     if not per_freq_stats:
         return
@@ -81,12 +91,13 @@ def plot_per_freq_acc(per_freq_stats, out_path, title="Per-frequency Accuracy"):
     freqs = sorted(per_freq_stats.keys())
     accs = [per_freq_stats[f]["accuracy"] for f in freqs]
     
+    plt = pyplot()
     fig = plt.figure(figsize=(8, 5))
     plt.bar(range(len(freqs)), accs, alpha=0.7)
     plt.xlabel("Frequency (Hz)")
     plt.ylabel("Trial Accuracy")
     plt.title(title)
-    plt.xticks(range(len(freqs)), [f"{f:.0f}" for f in freqs])
+    plt.xticks(range(len(freqs)), [f"{f:g}" for f in freqs])
     plt.ylim(0, 1.1)
     
     # 添加数值标签
@@ -95,24 +106,35 @@ def plot_per_freq_acc(per_freq_stats, out_path, title="Per-frequency Accuracy"):
     
     plt.grid(True, alpha=0.3)
     plt.tight_layout()
-    fig.savefig(out_path, dpi=200)
+    fig.savefig(out_path, dpi=dpi)
     plt.close(fig)
 
+def group_mode(df, key, col):
+    """按 key 分组求 col 的众数；平票时取组内最先出现的值（与 Counter.most_common 一致）"""
+    d = df[[key, col]].dropna(subset=[col])
+    if len(d) == 0:
+        return pd.Series(dtype=float)
+    d = d.assign(_pos=np.arange(len(d)))
+    cnt = d.groupby([key, col], sort=False)["_pos"].agg(["size", "min"]).reset_index()
+    cnt = cnt.sort_values(["size", "min"], ascending=[False, True], kind="mergesort")
+    return cnt.drop_duplicates(subset=key).set_index(key)[col]
+
 def trial_aggregate(df):
     if "lsl_trial_start" not in df.columns:
         return pd.DataFrame(columns=["trial_id","true","pred","lat_first"])
-    df2 = df.dropna(subset=["lsl_trial_start"]).copy()
-    rows = []
-    for tid, g in df2.groupby("lsl_trial_start"):
-        true_vals = g["true_freq"].dropna().values
-        true = Counter(true_vals).most_common(1)[0][0] if len(true_vals) else np.nan
-        pred_vals = g["pred_freq"].dropna().values
-        pred = Counter(pred_vals).most_common(1)[0][0] if len(pred_vals) else np.nan
-        lat_first = g["latency_sec"].dropna().min() if "latency_sec" in g else np.nan
-        rows.append({"trial_id": tid, "true": true, "pred": pred, "lat_first": lat_first})
-    return pd.DataFrame(rows)
-
-def plot_confmat(cm, classes, out_path, title="Confusion (trial)"):
+    df2 = df.dropna(subset=["lsl_trial_start"])
+    tids = pd.Index(np.sort(df2["lsl_trial_start"].unique()), name="trial_id")
+    out = pd.DataFrame(index=tids)
+    out["true"] = group_mode(df2, "lsl_trial_start", "true_freq").reindex(tids)
+    out["pred"] = group_mode(df2, "lsl_trial_start", "pred_freq").reindex(tids)
+    if "latency_sec" in df2.columns:
+        out["lat_first"] = df2.groupby("lsl_trial_start")["latency_sec"].min().reindex(tids)
+    else:
+        out["lat_first"] = np.nan
+    return out.reset_index()
+
+def plot_confmat(cm, classes, out_path, title="Confusion (trial)", dpi=200):
+    plt = pyplot()
     fig = plt.figure()
     plt.imshow(cm, interpolation="nearest")
     plt.title(title); plt.xlabel("Predicted"); plt.ylabel("True")
@@ -121,15 +143,90 @@ def plot_confmat(cm, classes, out_path, title="Confusion (trial)"):
     for i in range(len(classes)):
         for j in range(len(classes)):
             plt.text(j, i, f"{cm[i,j]:.2f}", ha="center", va="center")
-    plt.tight_layout(); fig.savefig(out_path, dpi=200); plt.close(fig)
+    plt.tight_layout(); fig.savefig(out_path, dpi=dpi); plt.close(fig)
 
-def latency_hist(latencies, out_path):
+def latency_hist(latencies, out_path, dpi=200):
+    plt = pyplot()
     fig = plt.figure()
     plt.hist(latencies, bins=20)
     plt.xlabel("First-decision latency (s)"); plt.ylabel("Count"); plt.grid(True, alpha=0.3)
-    plt.tight_layout(); fig.savefig(out_path, dpi=200); plt.close(fig)
+    plt.tight_layout(); fig.savefig(out_path, dpi=dpi); plt.close(fig)
+
+def excel_engine():
+    """优先使用更快的 xlsxwriter，未安装时退回 openpyxl"""
+    try:
+        import xlsxwriter  # noqa: F401
+        return "xlsxwriter"
+    except ImportError:
+        return "openpyxl"
+
+def parquet_available():
+    for mod in ("pyarrow", "fastparquet"):
+        try:
+            __import__(mod)
+            return True
+        except ImportError:
+            continue
+    return False
+
+def metrics_output_path(run_dir, fmt):
+    """各输出格式的主文件（用于判断该 run 的结果是否已存在）"""
+    if fmt == "xlsx":
+        return os.path.join(run_dir, "metrics.xlsx")
+    return os.path.join(run_dir, f"metrics_summary.{fmt}")
+
+def write_tables(run_dir, tables, fmt="xlsx"):
+    """写出单 run 的各张表；xlsx 为一个多 sheet 文件，csv/parquet 为每表一个 metrics_<表名> 文件"""
+    if fmt == "xlsx":
+        with pd.ExcelWriter(os.path.join(run_dir, "metrics.xlsx"), engine=excel_engine()) as xw:
+            for name, t in tables.items():
+                t.to_excel(xw, index=False, sheet_name=name)
+    elif fmt == "csv":
+        for name, t in tables.items():
+            t.to_csv(os.path.join(run_dir, f"metrics_{name}.csv"), index=False, encoding="utf-8")
+    elif fmt == "parquet":
+        for name, t in tables.items():
+            t.to_parquet(os.path.join(run_dir, f"metrics_{name}.parquet"), index=False)
+    else:
+        raise ValueError(f"unknown output format: {fmt}")
+
+FIGURES = ("confmat.png", "latency_hist.png", "per_freq.png")
+
+def render_plots(run_dir, run_name, df_trial, classes, per_freq_stats=None, dpi=200):
+    """图：混淆矩阵 & 延迟直方图 & 分频率准确率；返回实际写出的图片文件名"""
+    written = []
+    mask = (~df_trial["true"].isna()) & (~df_trial["pred"].isna())
+    if mask.any():
+        # map labels
+        lbl2idx = {c:i for i,c in enumerate(classes)}
+        yt = np.array([lbl2idx.get(float(v), -1) for v in df_trial.loc[mask,"true"].values])
+        yp = np.array([lbl2idx.get(float(v), -1) for v in df_trial.loc[mask,"pred"].values])
+        ok = (yt>=0)&(yp>=0)
+        if np.any(ok):
+            cm = confusion_matrix(yt[ok], yp[ok], len(classes))
+            cm = cm / np.maximum(cm.sum(axis=1, keepdims=True), 1e-9)
+            plot_confmat(cm, classes, os.path.join(run_dir, "confmat.png"), title=f"Confusion (trial) {run_name}", dpi=dpi)
+            written.append("confmat.png")
+    lats = df_trial["lat_first"].dropna().values if "lat_first" in df_trial else np.array([])
+    if lats.size:
+        latency_hist(lats, os.path.join(run_dir, "latency_hist.png"), dpi=dpi)
+        written.append("latency_hist.png")
+    
+    # 绘制分频率准确率图
+    if per_freq_stats is None:
+        per_freq_stats = compute_per_freq_stats(df_trial)
+    if per_freq_stats:
+        plot_per_freq_acc(per_freq_stats, os.path.join(run_dir, "per_freq.png"), title=f"Per-frequency Accuracy - {run_name}", dpi=dpi)
+        written.append("per_freq.png")
+    return written
+
+def plot_run(csv_path, classes, dpi=200):
+    """只出图（当场出图 / 后台出图进程 / 进程池共用）：从 latency.csv 重新做 trial 聚合后绘图；返回写出的图片文件名"""
+    run_dir = os.path.dirname(os.path.abspath(csv_path))
+    df_trial = trial_aggregate(read_csv(csv_path))
+    return render_plots(run_dir, os.path.basename(run_dir), df_trial, classes, dpi=dpi)
 
-def one_run(csv_path, classes, selection_time):
+def one_run(csv_path, classes, selection_time, fmt="xlsx", plots=True, dpi=200, raw=True):
     run_dir = os.path.dirname(os.path.abspath(csv_path))
     run_name = os.path.basename(run_dir)
     df = read_csv(csv_path)
@@ -166,67 +263,188 @@ def one_run(csv_path, classes, selection_time):
     # 分频率统计
     per_freq_stats = compute_per_freq_stats(df_trial)
 
-    # 保存单 run 结果
-    xlsx = os.path.join(run_dir, "metrics.xlsx")
-    with pd.ExcelWriter(xlsx, engine="openpyxl") as xw:
-        df.to_excel(xw, index=False, sheet_name="raw")
-        df_trial.to_excel(xw, index=False, sheet_name="trial_level")
-        
-        # 汇总表增加新指标
-        summary_data = {
-            "run": run_name, "method": method, "window_s": window,
-            "acc_window": acc_win, "lat_mean_window": lat_mean_win, "lat_median_window": lat_med_win, "itr_window": itr_win,
-            "acc_trial": acc_trial, "lat_mean_trial": lat_mean_trial, "lat_median_trial": lat_median_trial, "itr_trial": itr_trial,
-            "idle_fp_rate": idle_fp_rate
-        }
-        
-        # 添加分频率统计
-        for freq, stats in per_freq_stats.items():
-            summary_data[f"acc_freq_{freq:.0f}"] = stats["accuracy"]
-            summary_data[f"lat_median_freq_{freq:.0f}"] = stats["latency_median"]
-        
-        pd.DataFrame([summary_data]).to_excel(xw, index=False, sheet_name="summary")
-        
-        # 分频率详情表
-        if per_freq_stats:
-            per_freq_df = pd.DataFrame([
-                {"frequency": freq, **stats} for freq, stats in per_freq_stats.items()
-            ])
-            per_freq_df.to_excel(xw, index=False, sheet_name="per_frequency")
-
-    # 图：混淆矩阵 & 延迟直方图
-    if mask.any():
-        # map labels
-        lbl2idx = {c:i for i,c in enumerate(classes)}
-        yt = np.array([lbl2idx.get(float(v), -1) for v in df_trial.loc[mask,"true"].values])
-        yp = np.array([lbl2idx.get(float(v), -1) for v in df_trial.loc[mask,"pred"].values])
-        ok = (yt>=0)&(yp>=0)
-        if np.any(ok):
-            cm = confusion_matrix(yt[ok], yp[ok], labels=list(range(len(classes)))).astype(float)
-            cm = cm / np.maximum(cm.sum(axis=1, keepdims=True), 1e-9)
-            plot_confmat(cm, classes, os.path.join(run_dir, "confmat.png"), title=f"Confusion (trial) {run_name}")
-    if lats.size:
-        latency_hist(lats, os.path.join(run_dir, "latency_hist.png"))
-    
-    # 绘制分频率准确率图
-    if per_freq_stats:
-        plot_per_freq_acc(per_freq_stats, os.path.join(run_dir, "per_freq.png"), title=f"Per-frequency Accuracy - {run_name}")
-
-    # 返回汇总行（包含新指标）
-    result = {
-        "run": run_name, "dir": run_dir, "method": method, "window_s": window,
+    # 汇总表增加新指标
+    summary_data = {
+        "run": run_name, "method": method, "window_s": window,
         "acc_window": acc_win, "lat_mean_window": lat_mean_win, "lat_median_window": lat_med_win, "itr_window": itr_win,
         "acc_trial": acc_trial, "lat_mean_trial": lat_mean_trial, "lat_median_trial": lat_median_trial, "itr_trial": itr_trial,
         "idle_fp_rate": idle_fp_rate
     }
     
-    # 添加分频率统计到汇总
+    # 添加分频率统计
     for freq, stats in per_freq_stats.items():
-        result[f"acc_freq_{freq:.0f}"] = stats["accuracy"]
-        result[f"lat_median_freq_{freq:.0f}"] = stats["latency_median"]
-    
+        summary_data[f"acc_freq_{freq:g}"] = stats["accuracy"]
+        summary_data[f"lat_median_freq_{freq:g}"] = stats["latency_median"]
+
+    # 保存单 run 结果
+    tables = {}
+    if raw:
+        tables["raw"] = df
+    tables["trial_level"] = df_trial
+    tables["summary"] = pd.DataFrame([summary_data])
+    # 分频率详情表
+    if per_freq_stats:
+        tables["per_frequency"] = pd.DataFrame([
+            {"frequency": freq, **stats} for freq, stats in per_freq_stats.items()
+        ])
+    if fmt:  # fmt=None 只计算、不写单 run 文件（run_catalog.py --analyse 默认如此）
+        write_tables(run_dir, tables, fmt)
+
+    if plots:
+        render_plots(run_dir, run_name, df_trial, classes, per_freq_stats, dpi=dpi)
+
+    # 返回汇总行（包含新指标）
+    result = {"run": run_name, "dir": run_dir, **summary_data}
     return result
 
+def spawn_plot_worker(paths, args):
+    """后台出图：启动一个独立进程渲染图片，当前进程立即返回（指标已写出）"""
+    import subprocess, sys, tempfile
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", prefix="plots_", delete=False, encoding="utf-8") as f:
+        f.write("\n".join(os.path.abspath(p) for p in paths))
+        list_path = f.name
+    cmd = [sys.executable, os.path.abspath(__file__), "--plots_only", list_path,
+           "--classes", args.classes, "--dpi", str(args.dpi), "--jobs", str(args.jobs)]
+    kw = {"stdin": subprocess.DEVNULL, "stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL, "close_fds": True}
+    if os.name == "nt":
+        kw["creationflags"] = getattr(subprocess, "CREATE_NO_WINDOW", 0) | getattr(subprocess, "CREATE_NEW_PROCESS_GROUP", 0)
+    else:
+        kw["start_new_session"] = True
+    subprocess.Popen(cmd, **kw)
+    print(f"Plots deferred to background worker ({len(paths)} run(s))")
+
+def plots_only(list_path, classes, dpi, jobs):
+    """--plots_only 入口：读取待出图的 csv 列表并逐个（或并行）渲染"""
+    with open(list_path, "r", encoding="utf-8") as f:
+        paths = [l.strip() for l in f if l.strip()]
+    try:
+        os.remove(list_path)
+    except OSError:
+        pass
+    jobs = min(jobs if jobs > 0 else (os.cpu_count() or 1), max(1, len(paths)))
+    if jobs <= 1:
+        for p in paths:
+            try:
+                plot_run(p, classes, dpi)
+            except Exception as e:
+                print("  WARN plot failed:", p, e)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as ex:
+        futs = {ex.submit(plot_run, p, classes, dpi): p for p in paths}
+        for fut in as_completed(futs):
+            try:
+                fut.result()
+            except Exception as e:
+                print("  WARN plot failed:", futs[fut], e)
+
+def file_fingerprint(path, prev=None):
+    """文件指纹：size/mtime 未变时沿用上次的哈希，否则重新计算 sha1"""
+    if not os.path.isfile(path):
+        return None
+    st = os.stat(path)
+    fp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if prev and prev.get("size") == fp["size"] and prev.get("mtime_ns") == fp["mtime_ns"] and prev.get("sha1"):
+        fp["sha1"] = prev["sha1"]
+        return fp
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    fp["sha1"] = h.hexdigest()
+    return fp
+
+def run_fingerprint(csv_path, classes, selection_time, prev=None):
+    """一个 run 的指纹：latency.csv + meta.json + 分析版本与参数"""
+    run_dir = os.path.dirname(os.path.abspath(csv_path))
+    prev = prev or {}
+    return {
+        "version": ANALYSIS_VERSION,
+        "classes": list(classes),
+        "selection_time": selection_time,
+        "csv": file_fingerprint(csv_path, prev.get("csv")),
+        "meta": file_fingerprint(os.path.join(run_dir, "meta.json"), prev.get("meta")),
+    }
+
+def same_fingerprint(a, b):
+    """比较指纹；文件只比较 size+sha1（mtime 变化但内容不变仍视为命中）"""
+    if not a or not b:
+        return False
+    for k in ("version", "classes", "selection_time"):
+        if a.get(k) != b.get(k):
+            return False
+    for k in ("csv", "meta"):
+        fa, fb = a.get(k), b.get(k)
+        if (fa is None) != (fb is None):
+            return False
+        if fa is not None and (fa["size"] != fb["size"] or fa["sha1"] != fb["sha1"]):
+            return False
+    return True
+
+def run_outputs(args):
+    """本次要求的单 run 输出（格式 / 是否含 raw 表 / 是否出图及分辨率），与指纹一起记进缓存"""
+    plots = args.plots != "off"
+    return {"format": args.format, "raw": not args.no_raw, "plots": plots, "dpi": args.dpi if plots else None}
+
+def outputs_cover(entry, want, run_dir):
+    """上次写出的文件是否覆盖本次的要求：格式相同、本次要的 raw 表上次也写了；要图时图须按相同 dpi 画好"""
+    prev = entry.get("outputs")
+    if not prev or prev.get("format") != want["format"] or not os.path.isfile(metrics_output_path(run_dir, want["format"])):
+        return False
+    if want["raw"] and not prev.get("raw"):
+        return False
+    return not want["plots"] or figures_done(entry, run_dir, want["dpi"])
+
+def figures_done(entry, run_dir, dpi):
+    """图是否已按 dpi 画好：出图成功时记下的文件（后台出图时未知，按全部三张图算）都存在，且晚于该缓存条目写入"""
+    prev = entry.get("outputs") or {}
+    if not prev.get("plots") or prev.get("dpi") != dpi or "since" not in entry:
+        return False
+    figures = entry.get("figures")
+    figures = FIGURES if figures is None else figures
+    for name in figures:
+        path = os.path.join(run_dir, name)
+        if not os.path.isfile(path) or os.path.getmtime(path) < entry["since"]:
+            return False
+    return True
+
+def load_cache(cache_path):
+    if not cache_path or not os.path.isfile(cache_path):
+        return {}
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache.get("runs", {}) if isinstance(cache, dict) else {}
+    except Exception as e:
+        print("  WARN cache unreadable, ignored:", e)
+        return {}
+
+def save_cache(cache_path, runs):
+    os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+    tmp = cache_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": ANALYSIS_VERSION, "runs": runs}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, cache_path)
+
+def update_catalog(db_path, paths, results, todo, classes, selection_time):
+    """把本次处理的 run（以及目录里还缺指标的缓存命中 run）写入 SQLite 运行目录（analysis/run_catalog.py）"""
+    import run_catalog
+    con = run_catalog.connect(db_path)
+    n = 0
+    try:
+        for p in paths:
+            if p not in results:
+                continue
+            run_dir = os.path.dirname(os.path.abspath(p))
+            if p not in todo and run_catalog.has_metrics(con, run_dir, ANALYSIS_VERSION):
+                continue
+            run_catalog.index_run(con, run_dir)
+            run_catalog.record_metrics(con, results[p], trial_aggregate(read_csv(p)), classes, selection_time, ANALYSIS_VERSION)
+            n += 1
+        con.commit()
+    finally:
+        con.close()
+    print(f"Catalogue: {n} run(s) indexed into {db_path}")
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--csv", nargs="*", help="one or more csv paths")
@@ -234,10 +452,29 @@ def main():
     ap.add_argument("--classes", type=str, default="10,12,15,20")
     ap.add_argument("--selection_time", type=float, default=3.0, help="per-trial selection time (s) for ITR")
     ap.add_argument("--batch_out", type=str, default=r"C:\Users\23842\Desktop\bci\data\logs\batch_summary.xlsx")
+    ap.add_argument("--jobs", type=int, default=0, help="parallel worker processes for multiple runs; 0 = cpu count, 1 = sequential")
+    ap.add_argument("--cache", type=str, default=None, help="analysis cache file; default metrics_cache.json next to --batch_out")
+    ap.add_argument("--force", action="store_true", help="ignore the cache and recompute every run")
+    ap.add_argument("--format", type=str, default="xlsx", choices=["xlsx", "csv", "parquet"], help="per-run metrics output backend")
+    ap.add_argument("--no_raw", action="store_true", help="do not copy the raw latency frame into the metrics output")
+    ap.add_argument("--plots", type=str, default="now", choices=["now", "defer", "off"],
+                    help="now = render figures in this run; defer = background worker process; off = no figures")
+    ap.add_argument("--dpi", type=int, default=200, help="figure resolution")
+    ap.add_argument("--catalog", type=str, default=None, help="SQLite run catalogue to index analysed runs into (see analysis/run_catalog.py)")
+    ap.add_argument("--plots_only", type=str, default=None, help=argparse.SUPPRESS)
+    profiling.add_profile_args(ap)
     args = ap.parse_args()
 
     classes = [float(x) for x in args.classes.split(",")]
 
+    if args.plots_only:
+        plots_only(args.plots_only, classes, args.dpi, args.jobs)
+        return
+
+    if args.format == "parquet" and not parquet_available():
+        print("WARN: parquet backend needs pyarrow or fastparquet; falling back to csv")
+        args.format = "csv"
+
     paths = []
     if args.glob: paths += glob.glob(args.glob, recursive=True)
     if args.csv:  paths += args.csv
@@ -245,20 +482,121 @@ def main():
     if not paths:
         print("No CSV found. Use --glob or --csv."); return
 
-    rows = []
-    for p in sorted(set(paths)):
-        print("Processing:", p)
-        try:
-            rows.append(one_run(p, classes, args.selection_time))
-        except Exception as e:
-            print("  WARN failed:", e)
-
-    if len(rows) >= 1:
-        df = pd.DataFrame(rows)
-        os.makedirs(os.path.dirname(args.batch_out), exist_ok=True)
-        with pd.ExcelWriter(args.batch_out, engine="openpyxl") as xw:
-            df.to_excel(xw, index=False, sheet_name="summary")
-        print("Batch summary saved to:", args.batch_out)
+    paths = sorted(set(paths))
+
+    # --profile：单个 run 时结果写进该 run 目录（与 meta.json 同级），多个 run 时写在 --batch_out 旁边
+    prof, ex, plot_futs = None, None, {}
+    try:
+        prof = profiling.start(args.profile)
+        if prof is not None and args.jobs != 1 and len(paths) > 1:
+            print("NOTE: --profile only covers this process; use --jobs 1 to include the per-run analysis")
+
+        # 增量缓存：latency.csv / meta.json / 分析参数都未变化的 run 直接复用上次的汇总行
+        cache_path = args.cache or os.path.join(os.path.dirname(args.batch_out), "metrics_cache.json")
+        cache = load_cache(cache_path)
+        fingerprints, results, todo = {}, {}, []
+        outputs = run_outputs(args)
+        dirty = False
+        for p in paths:
+            key = os.path.abspath(p)
+            entry = cache.get(key, {})
+            fingerprints[p] = run_fingerprint(p, classes, args.selection_time, prev=entry.get("fingerprint"))
+            if not args.force and outputs_cover(entry, outputs, os.path.dirname(key)) and same_fingerprint(entry.get("fingerprint"), fingerprints[p]):
+                results[p] = entry["row"]
+                if entry["fingerprint"] != fingerprints[p]:
+                    # 内容未变但 mtime 变了：记下新 mtime，下次免去重算哈希
+                    entry["fingerprint"] = fingerprints[p]
+                    dirty = True
+            else:
+                todo.append(p)
+        if results:
+            print(f"Cache: {len(results)} unchanged run(s) reused, {len(todo)} to process")
+
+        jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+        jobs = min(jobs, max(1, len(todo)))
+
+        # 多个 run 用进程池并行处理；单个 run 失败只影响自身
+        # 出图与指标计算分离：指标先算完写出，图片在同一进程池/后台进程中随后渲染
+        run_kw = {"fmt": args.format, "plots": False, "dpi": args.dpi, "raw": not args.no_raw}
+        plot_inline = args.plots == "now"
+        since = time.time()  # 此后写出的图才算本次的结果（后台出图时据此判断图是否已画好）
+        figures = {}         # 当场出图成功的 run -> 写出的图片文件名
+        ex = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+        if ex is None:
+            for p in todo:
+                print("Processing:", p)
+                try:
+                    results[p] = one_run(p, classes, args.selection_time, **run_kw)
+                except Exception as e:
+                    print("  WARN failed:", e)
+                    continue
+                if plot_inline:
+                    try:
+                        figures[p] = plot_run(p, classes, args.dpi)
+                    except Exception as e:
+                        print("  WARN plot failed:", e)
+        else:
+            print(f"Processing {len(todo)} runs with {jobs} workers...")
+            futs = {ex.submit(one_run, p, classes, args.selection_time, **run_kw): p for p in todo}
+            for fut in as_completed(futs):
+                p = futs[fut]
+                try:
+                    results[p] = fut.result()
+                    print("Processed:", p)
+                    if plot_inline:
+                        plot_futs[ex.submit(plot_run, p, classes, args.dpi)] = p
+                except Exception as e:
+                    print("  WARN failed:", p, e)
+        rows = [results[p] for p in paths if p in results]
+
+        if args.catalog and rows:
+            try:
+                update_catalog(args.catalog, paths, results, todo, classes, args.selection_time)
+            except Exception as e:
+                print("  WARN failed to update catalogue:", e)
+
+        if len(rows) >= 1:
+            df = pd.DataFrame(rows)
+            os.makedirs(os.path.dirname(args.batch_out), exist_ok=True)
+            with pd.ExcelWriter(args.batch_out, engine=excel_engine()) as xw:
+                df.to_excel(xw, index=False, sheet_name="summary")
+            print("Batch summary saved to:", args.batch_out)
+
+        done = [p for p in todo if p in results]
+        if args.plots == "defer" and done:
+            spawn_plot_worker(done, args)
+        for fut in as_completed(plot_futs):
+            try:
+                figures[plot_futs[fut]] = fut.result()
+            except Exception as e:
+                print("  WARN plot failed:", plot_futs[fut], e)
+
+        # 缓存在出图结束后再写：当场出图只有成功的 run 记为已出图；后台出图的图片文件名未知，下次按文件是否已生成判断
+        if todo or dirty:
+            for p in todo:
+                key = os.path.abspath(p)
+                if p not in results:
+                    cache.pop(key, None)
+                    continue
+                entry = {"fingerprint": fingerprints[p], "outputs": outputs, "since": since, "row": results[p]}
+                if plot_inline:
+                    if p in figures:
+                        entry["figures"] = figures[p]
+                    else:
+                        entry["outputs"] = dict(outputs, plots=False, dpi=None)
+                cache[key] = entry
+            try:
+                save_cache(cache_path, cache)
+            except Exception as e:
+                print("  WARN failed to save cache:", e)
+    finally:
+        if ex is not None:
+            ex.shutdown(wait=True)
+        if prof is not None:
+            prof_dir = os.path.dirname(os.path.abspath(paths[0] if len(paths) == 1 else args.batch_out))
+            summary = prof.stop(prof_dir, prefix="profile_metrics")  # 与解码器的 profile.* 区分
+            profiling.write_summary(prof_dir, summary, "profile_metrics.json")
+            print(f"[PROFILE] {summary['mode']}: " + ", ".join(summary["files"] + ["profile_metrics.json"]) + f" -> {prof_dir}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
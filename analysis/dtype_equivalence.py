@@ -0,0 +1,175 @@
+# analysis/dtype_equivalence.py
+# float32 / float64 数值等价性检查：同一段录制数据按解码器的打分流程逐窗各算一遍，比较分数与判决。
+# 两种精度用同一个典型相关求解器（--cca_solver），差别只来自精度。
+import argparse, os, sys, json, time
+import numpy as np
+
+# 解码器模块按 online/ 下的平铺名导入，它们又依赖仓库根目录下的 common 包，两处都要在路径上
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path[:0] = [os.path.join(ROOT, "online"), ROOT]
+import online_cca, online_fbcca, online_trca  # noqa: E402
+from sliding_cca import SlidingFBCCA  # noqa: E402
+import precision  # noqa: E402
+
+def load_recording(path, fs=None):
+    """读取录制数据 -> (X (n, C), fs)。支持 .npy / .csv（数值列，忽略时间戳列）/ .xdf（需要 pyxdf）"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".xdf":
+        try:
+            import pyxdf
+        except ImportError:
+            raise SystemExit("读取 .xdf 需要 pyxdf：pip install pyxdf")
+        streams, _ = pyxdf.load_xdf(path)
+        eeg = [s for s in streams if s["info"]["type"][0].lower() == "eeg"]
+        if not eeg:
+            raise SystemExit(f"{path} 中没有 EEG 流")
+        return np.asarray(eeg[0]["time_series"], dtype=float), float(eeg[0]["info"]["nominal_srate"][0])
+    if ext == ".npy":
+        X = np.load(path)
+    elif ext == ".csv":
+        import pandas as pd
+        df = pd.read_csv(path).select_dtypes("number")
+        X = df[[c for c in df.columns if "time" not in str(c).lower()]].to_numpy(dtype=float)
+    else:
+        raise SystemExit(f"不支持的文件类型: {ext}")
+    if not fs:
+        raise SystemExit("--fs is required for .npy / .csv recordings")
+    return np.asarray(X, dtype=float), float(fs)
+
+def synth_recording(fs, freqs, n_ch=8, trial_s=4.0, snr=0.5, seed=0):
+    """合成数据：各目标依次刺激 trial_s 秒，正弦（含二次谐波）+ 白噪声"""
+    rng = np.random.default_rng(seed)
+    n = int(trial_s * fs)
+    t = np.arange(n) / fs
+    parts = []
+    for f in freqs:
+        gain = rng.uniform(0.5, 1.0, n_ch)
+        s = np.sin(2*np.pi*f*t + rng.uniform(0, 2*np.pi)) + 0.5*np.sin(4*np.pi*f*t + rng.uniform(0, 2*np.pi))
+        parts.append(snr * s[:, None] * gain + rng.standard_normal((n, n_ch)))
+    return np.vstack(parts)
+
+def score_windows(X, fs, freqs, win, hop, notch, method, dtype, trca=None, solver="sklearn"):
+    """按解码器的打分流程逐窗打分；返回 (scores (n_win, K), 每窗耗时 ms)"""
+    ends = list(range(win, len(X) + 1, hop))
+    out = np.zeros((len(ends), len(freqs)))
+    t_ms = np.zeros(len(ends))
+    if method == "cca":
+        refs = online_cca.make_ref(fs, win, freqs, dtype=dtype); cca = precision.make_cca(solver)
+        for i, e in enumerate(ends):
+            t0 = time.perf_counter()
+            segf = online_cca.apply_filter(X[e-win:e].astype(dtype), fs, notch=notch)
+            out[i] = [online_cca.score_one(segf, fs, f, refs[f], cca) for f in freqs]
+            t_ms[i] = (time.perf_counter() - t0) * 1000
+    elif method == "fbcca":
+        refs = online_fbcca.make_ref(fs, win, freqs, dtype=dtype); cca = precision.make_cca(solver)
+        for i, e in enumerate(ends):
+            t0 = time.perf_counter()
+            seg = online_fbcca.apply_filter(X[e-win:e].astype(dtype), fs, notch=notch)
+            out[i] = [online_fbcca.fbcca_score(seg, fs, refs[f], cca, online_fbcca.FB_BANDS) for f in freqs]
+            t_ms[i] = (time.perf_counter() - t0) * 1000
+    elif method == "fbcca_inc":
+        inc = SlidingFBCCA(fs, X.shape[1], freqs, win, online_fbcca.FB_BANDS, notch=notch, dtype=dtype)
+        inc.update(X[:win-hop].astype(dtype))
+        for i, e in enumerate(ends):
+            t0 = time.perf_counter()
+            inc.update(X[e-hop:e].astype(dtype))
+            out[i] = inc.scores()
+            t_ms[i] = (time.perf_counter() - t0) * 1000
+    elif method == "trca":
+        bands = online_trca.trca_bands(fs); weights = [w for _, _, w in bands]; pad = int(0.2 * fs)
+        T, W = trca["T"].astype(dtype), trca["W"].astype(dtype)
+        L = min(win, T.shape[2])
+        for i, e in enumerate(ends):
+            if e - L - pad < 0:
+                out[i] = np.nan; continue
+            t0 = time.perf_counter()
+            xb = online_trca.fb_filter(X[e-L-pad:e].astype(dtype), fs, notch, bands, pad)
+            out[i] = online_trca.trca_scores(xb, T, W, 0, weights)
+            t_ms[i] = (time.perf_counter() - t0) * 1000
+    else:
+        raise ValueError(method)
+    return out, t_ms
+
+def compare(s64, s32, t64, t32):
+    ok = ~np.isnan(s64).any(axis=1)
+    s64, s32 = s64[ok], s32[ok]
+    d64, d32 = s64.argmax(axis=1), s32.argmax(axis=1)
+    srt = np.sort(s64, axis=1)
+    # 判决不一致的窗里，float64 下第一、二名本来就很接近的算作“平局翻转”
+    tie = (d64 != d32) & ((srt[:, -1] - srt[:, -2]) < 1e-3)
+    return {
+        "windows": int(ok.sum()),
+        "decision_agree": round(float((d64 == d32).mean()), 6) if ok.any() else None,
+        "flips": int((d64 != d32).sum()),
+        "flips_near_tie": int(tie.sum()),
+        "max_abs_score_diff": float(np.abs(s64 - s32).max()) if ok.any() else None,
+        "max_rel_r1_diff": float((np.abs(s64.max(axis=1) - s32.max(axis=1)) / np.maximum(np.abs(s64.max(axis=1)), 1e-12)).max()) if ok.any() else None,
+        "ms_per_window_f64": round(float(np.median(t64)), 3),
+        "ms_per_window_f32": round(float(np.median(t32)), 3),
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="compare float32 vs float64 decoder scores/decisions on recorded data")
+    ap.add_argument("--data", type=str, default=None, help="录制数据 .npy/.csv/.xdf（样本 × 通道）；不给时用合成数据")
+    ap.add_argument("--fs", type=float, default=0.0, help="采样率（.npy/.csv 必填；合成数据默认 250）")
+    ap.add_argument("--chs", type=str, default="", help="使用的通道索引（逗号分隔）")
+    ap.add_argument("--freqs", type=str, default="10,12,15,20")
+    ap.add_argument("--window", type=float, default=1.0)
+    ap.add_argument("--hop", type=float, default=0.1, help="窗口步进（秒）")
+    ap.add_argument("--notch", type=float, default=50.0)
+    ap.add_argument("--methods", type=str, default="cca,fbcca,fbcca_inc", help="cca / fbcca / fbcca_inc / trca（trca 需要 --trca_model）")
+    ap.add_argument("--trca_model", type=str, default=None, help="online_trca 保存的 trca_model.npz")
+    ap.add_argument("--cca_solver", choices=precision.SOLVERS, default="sklearn", help="两种精度共用的典型相关求解器（与解码器的 --cca_solver 相同）")
+    ap.add_argument("--max_windows", type=int, default=0, help="最多比较多少个窗（0=全部）")
+    ap.add_argument("--min_agree", type=float, default=0.99, help="任一方法判决一致率低于该值时返回非零退出码")
+    ap.add_argument("--out", type=str, default=None, help="结果 JSON 路径")
+    args = ap.parse_args()
+
+    freqs = [float(f) for f in args.freqs.split(",")]
+    if args.data:
+        X, fs = load_recording(args.data, args.fs)
+    else:
+        fs = args.fs or 250.0
+        X = synth_recording(fs, freqs)
+        print(f"No --data given; using {X.shape[0]/fs:.0f}s of synthetic SSVEP ({X.shape[1]} channels)")
+    if args.chs:
+        X = X[:, [int(c) for c in args.chs.split(",")]]
+    fs_i = int(round(fs))
+    win, hop = int(args.window * fs_i), max(1, int(args.hop * fs_i))
+    if args.max_windows > 0:
+        X = X[:win + hop*(args.max_windows-1)]
+
+    trca = None
+    methods = [m.strip() for m in args.methods.split(",") if m.strip()]
+    if "trca" in methods:
+        if not args.trca_model:
+            raise SystemExit("--methods trca needs --trca_model")
+        trca = online_trca.load_model(args.trca_model)
+        if int(trca["fs"]) != fs_i or [float(f) for f in trca["freqs"]] != freqs:
+            raise SystemExit(f"model was fitted for fs={int(trca['fs'])}, freqs={trca['freqs'].tolist()}")
+        if trca["chs"].size and not args.chs:
+            X = X[:, trca["chs"].astype(int)]
+
+    report = {"data": args.data or "synthetic", "cca_solver": args.cca_solver, "fs": fs_i, "n_ch": X.shape[1], "window_s": args.window, "hop_s": args.hop, "methods": {}}
+    worst = 1.0
+    for m in methods:
+        s64, t64 = score_windows(X, fs_i, freqs, win, hop, args.notch, m, np.float64, trca, args.cca_solver)
+        s32, t32 = score_windows(X, fs_i, freqs, win, hop, args.notch, m, np.float32, trca, args.cca_solver)
+        r = compare(s64, s32, t64, t32)
+        report["methods"][m] = r
+        worst = min(worst, r["decision_agree"] if r["decision_agree"] is not None else 1.0)
+        print(f"[{m:9s}] windows={r['windows']} agree={r['decision_agree']} flips={r['flips']} (near-tie {r['flips_near_tie']}) "
+              f"max|Δscore|={r['max_abs_score_diff']:.2e} max rel Δr1={r['max_rel_r1_diff']:.2e} "
+              f"ms/win f64={r['ms_per_window_f64']} f32={r['ms_per_window_f32']}")
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print("Report saved to:", args.out)
+    if worst < args.min_agree:
+        print(f"FAIL: decision agreement {worst:.4f} < {args.min_agree}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
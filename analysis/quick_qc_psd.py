@@ -1,70 +1,165 @@
 # analysis/quick_qc_psd.py
-import argparse, os, json, numpy as np, matplotlib.pyplot as plt
+import argparse, json, time, numpy as np
 from pylsl import StreamInlet
 try:
     from pylsl.stream import resolve_stream
 except:
     from pylsl import resolve_stream
-from scipy.signal import welch
+from scipy.signal import get_window
 from pathlib import Path
+from common import profiling
+from common.ssvep_snr import qc_targets, snr_weights
 
-def band_power(f, Pxx, f0, bw=0.5):
-    m = (f>=f0-bw) & (f<=f0+bw)
-    return np.trapz(Pxx[m], f[m]) if np.any(m) else 0.0
+class StreamingWelch:
+    """逐块累积的 Welch PSD（hann 窗、50% 重叠、去均值，与 scipy.signal.welch 的 density 定标一致）。
 
-def neighbor_power(f, Pxx, f0, inner=0.5, outer=2.0):
-    m = ((f>=f0-outer)&(f<=f0-inner)) | ((f>=f0+inner)&(f<=f0+outer))
-    return np.trapz(Pxx[m], f[m]) if np.any(m) else 1e-12
+    数据按块送入 update()，凑满一个分段就计算其谱并累加；只保留不足一个分段的尾巴。
+    max_segments>0 时只保留最近 max_segments 个分段的谱（滚动平均），内存恒定，可整场实验运行。
+    """
+    def __init__(self, fs, n_ch, nperseg=1024, noverlap=None, max_segments=0):
+        self.fs = fs
+        self.n_ch = n_ch
+        self.nperseg = int(nperseg)
+        noverlap = self.nperseg // 2 if noverlap is None else int(noverlap)
+        self.step = self.nperseg - noverlap
+        self.win = get_window("hann", self.nperseg)
+        self.scale = 1.0 / (fs * (self.win**2).sum())
+        self.f = np.fft.rfftfreq(self.nperseg, 1.0/fs)
+        self.tail = np.zeros((0, n_ch))
+        self.sum = np.zeros((len(self.f), n_ch))
+        self.count = 0      # 当前参与平均的分段数
+        self.total = 0      # 累计处理的分段数
+        self.ring = np.zeros((max_segments, len(self.f), n_ch)) if max_segments > 0 else None
+        self.pos = 0        # 环形缓冲下一个写入位置
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--dur", type=float, default=15.0)
-    ap.add_argument("--freqs", type=str, default="10,12,15,20")
-    ap.add_argument("--out", type=str, default="data/logs/qc")
-    ap.add_argument("--topk", type=int, default=4)
-    args = ap.parse_args()
+    def _segment_psd(self, segs):
+        # segs: (nseg, nperseg, n_ch)
+        segs = segs - segs.mean(axis=1, keepdims=True)
+        X = np.fft.rfft(segs * self.win[None, :, None], axis=1)
+        P = (X.real**2 + X.imag**2) * self.scale
+        if self.nperseg % 2 == 0:
+            P[:, 1:-1, :] *= 2
+        else:
+            P[:, 1:, :] *= 2
+        return P
+
+    def update(self, x):
+        """送入新数据块 x: (n, n_ch)；返回本次新增的分段数"""
+        buf = np.vstack([self.tail, np.asarray(x, dtype=float)]) if len(self.tail) else np.asarray(x, dtype=float)
+        nseg = 0 if len(buf) < self.nperseg else (len(buf) - self.nperseg) // self.step + 1
+        if nseg:
+            starts = np.arange(nseg) * self.step
+            segs = np.lib.stride_tricks.sliding_window_view(buf, self.nperseg, axis=0)[starts]  # (nseg, n_ch, nperseg)
+            P = self._segment_psd(segs.transpose(0, 2, 1))
+            if self.ring is None:
+                self.sum += P.sum(axis=0)
+                self.count += nseg
+            else:
+                K = self.ring.shape[0]
+                for p in P[-K:]:  # 更早的分段本来也会被挤出窗口
+                    if self.count == K:
+                        self.sum -= self.ring[self.pos]
+                    else:
+                        self.count += 1
+                    self.ring[self.pos] = p
+                    self.sum += p
+                    self.pos = (self.pos + 1) % K
+                    if self.pos == 0:
+                        self.sum = self.ring.sum(axis=0)  # 每转一圈重算一次，消除累计舍入误差
+            self.total += nseg
+        self.tail = buf[nseg*self.step:].copy()
+        return nseg
 
+    def psd(self):
+        """当前平均谱 (f, P)，P 形状 (n_freq, n_ch)"""
+        return self.f, self.sum / max(self.count, 1)
+
+def snr_matrix(P, fs, nperseg, targets):
+    """所有通道 × 目标的带内/邻带功率比，一次矩阵乘完成；返回 (n_ch, n_targets)"""
+    W_sig, W_nb = snr_weights(fs, nperseg, targets)
+    return ((W_sig @ P) / np.maximum(W_nb @ P, 1e-12)).T
+
+def snr_scores(P, fs, nperseg, freqs):
+    """每通道 SNR 分数（各目标功率比的加权和）及完整的 通道×目标 SNR 矩阵"""
+    targets = qc_targets(freqs)
+    M = snr_matrix(P, fs, nperseg, targets)
+    return M @ np.array([w for _, w in targets]), M
+
+def run_qc(args):
+    """采集并计算 QC，写出 selected_chs.txt / qc.json / qc_report.png；数据不足一段时返回 None"""
+    continuous = args.dur <= 0
     print("Resolving EEG stream...")
     eeg = resolve_stream('type','EEG')
     if not eeg: raise RuntimeError("No EEG stream found.")
-    inlet = StreamInlet(eeg[0], max_buflen=int(args.dur)+2)
+    inlet = StreamInlet(eeg[0], max_buflen=10 if continuous else int(args.dur)+2)
     fs = int(round(inlet.info().nominal_srate()))
     n_ch = inlet.info().channel_count()
-    n = int(args.dur * fs)
-    print(f"EEG fs={fs}Hz, n_ch={n_ch}, capture {args.dur}s")
-
-    data = []
-    while len(data) < n:
-        chunk, _ = inlet.pull_chunk(timeout=0.2)
-        if chunk: data.extend(chunk)
-    X = np.asarray(data)[:n, :]  # (n, n_ch)
-    X = X - X.mean(axis=0, keepdims=True)
+    n = 0 if continuous else int(args.dur * fs)
+    print(f"EEG fs={fs}Hz, n_ch={n_ch}, capture {'until Ctrl+C' if continuous else f'{args.dur}s'}")
 
     freqs = [float(x) for x in args.freqs.split(",")]
-    # Welch
-    f, P = welch(X, fs=fs, nperseg=min(1024, n), axis=0)
+    nperseg = args.nperseg if continuous else min(args.nperseg, n)
+    step = nperseg - nperseg // 2
+    max_segments = max(1, int((args.span*fs - nperseg) // step) + 1) if args.span > 0 else 0
+    acc = StreamingWelch(fs, n_ch, nperseg=nperseg, max_segments=max_segments)
+
+    outdir = Path(args.out)
+    outdir.mkdir(parents=True, exist_ok=True)
+    rolling = None
+    if args.interval > 0:
+        rolling = open(outdir/"qc_rolling.csv", "w", encoding="utf-8")
+        rolling.write("t_s,wall_time," + ",".join(f"ch{i}" for i in range(n_ch)) + ",topk\n")
+
+    n_seen = 0
+    next_report = args.interval
+    try:
+        while continuous or n_seen < n:
+            chunk, _ = inlet.pull_chunk(timeout=0.2)
+            if not chunk: continue
+            x = np.asarray(chunk)
+            if not continuous:
+                x = x[:n - n_seen]
+            acc.update(x)
+            n_seen += x.shape[0]
+
+            # 滚动 SNR 报告
+            if rolling and n_seen / fs >= next_report and acc.count:
+                f, P = acc.psd()
+                scores, _ = snr_scores(P, fs, nperseg, freqs)
+                top = np.argsort(scores)[::-1][:args.topk].tolist()
+                t_s = n_seen / fs
+                print(f"[QC t={t_s:.1f}s] top{args.topk}={top} scores=" + ",".join(f"{v:.2f}" for v in scores))
+                rolling.write(f"{t_s:.3f},{time.time():.3f}," + ",".join(f"{v:.6g}" for v in scores) + "," + " ".join(map(str, top)) + "\n")
+                rolling.flush()
+                next_report += args.interval
+    except KeyboardInterrupt:
+        print("Stopping QC...")
+    finally:
+        if rolling:
+            rolling.close()
+
+    if not acc.count:
+        print("QC aborted: not enough data for one Welch segment."); return None
+    f, P = acc.psd()
 
     # SNR per channel
-    ch_scores = np.zeros(n_ch, dtype=float)
-    for ch in range(n_ch):
-        score = 0.0
-        for f0, w in [(f_,1.0) for f_ in freqs] + [(2*f_,0.5) for f_ in freqs]:
-            p_sig = band_power(f, P[:,ch], f0, bw=0.5)
-            p_nb  = neighbor_power(f, P[:,ch], f0, inner=0.5, outer=2.0)
-            score += w * (p_sig / max(p_nb, 1e-12))
-        ch_scores[ch] = score
+    ch_scores, snr = snr_scores(P, fs, nperseg, freqs)
 
     order = np.argsort(ch_scores)[::-1]
     topk = order[:args.topk].tolist()
 
-    outdir = Path(args.out)
-    outdir.mkdir(parents=True, exist_ok=True)
     # save selected channels
     (outdir/"selected_chs.txt").write_text(",".join(map(str, topk)), encoding="utf-8")
-    # save json
-    json.dump({"fs":fs,"n_ch":n_ch,"scores":ch_scores.tolist(),"order":order.tolist(),"topk":topk},
-              open(outdir/"qc.json","w",encoding="utf-8"), ensure_ascii=False, indent=2)
-    # plot
+    # save json（snr[ch][i] 对应 targets[i]）
+    targets = qc_targets(freqs)
+    qc = {"fs":fs,"n_ch":n_ch,"dur_s":n_seen/fs,"n_segments":acc.count,"scores":ch_scores.tolist(),"order":order.tolist(),"topk":topk,
+          "targets":[{"freq":f0,"weight":w} for f0, w in targets],
+          "snr":snr.tolist()}
+    json.dump(qc, open(outdir/"qc.json","w",encoding="utf-8"), ensure_ascii=False, indent=2)
+    # plot（无界面后端，且只在出图时导入 matplotlib）
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
     plt.figure()
     plt.bar(np.arange(n_ch), ch_scores)
     plt.xlabel("Channel index"); plt.ylabel("SNR score")
@@ -73,6 +168,37 @@ def main():
     plt.savefig(outdir/"qc_report.png", dpi=200)
     plt.close()
     print("QC done. Selected channels:", topk)
+    return qc
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dur", type=float, default=15.0, help="capture seconds; <=0 runs until Ctrl+C (whole-session monitoring)")
+    ap.add_argument("--freqs", type=str, default="10,12,15,20")
+    ap.add_argument("--out", type=str, default="data/logs/qc")
+    ap.add_argument("--topk", type=int, default=4)
+    ap.add_argument("--nperseg", type=int, default=1024, help="Welch segment length (samples)")
+    ap.add_argument("--interval", type=float, default=0.0, help="report rolling SNR scores every N seconds of data (0 = only at the end)")
+    ap.add_argument("--span", type=float, default=0.0, help="rolling average over the last N seconds (0 = average everything since start)")
+    profiling.add_profile_args(ap)
+    args = ap.parse_args()
+    qc, prof = None, None
+    try:
+        prof = profiling.start(args.profile)  # 结果写进 --out（与 qc.json 同级），摘要记入 qc.json
+        qc = run_qc(args)
+    finally:
+        # 出错或中途退出也要停掉剖析，已采到的统计照样写出
+        if prof is not None:
+            outdir = Path(args.out)
+            outdir.mkdir(parents=True, exist_ok=True)
+            summary = prof.stop(str(outdir))
+            if qc is not None:
+                qc["profile"] = summary
+                json.dump(qc, open(outdir/"qc.json","w",encoding="utf-8"), ensure_ascii=False, indent=2)
+            else:
+                profiling.write_summary(str(outdir), summary)
+            print(f"[PROFILE] {summary['mode']}: " + ", ".join(summary["files"]) + f" -> {outdir}")
+
 
 if __name__ == "__main__":
     main()
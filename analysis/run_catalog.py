@@ -0,0 +1,250 @@
+# analysis/run_catalog.py
+# 本地 SQLite 运行目录：索引各 run 的 meta.json 与 compute_metrics 的汇总/试次级指标，跨会话查询不再逐个读取 run 文件夹
+import argparse, glob, os, json, sqlite3, time
+from datetime import datetime, timedelta
+import pandas as pd
+
+DEFAULT_DB = r"C:\Users\23842\Desktop\bci\data\logs\run_catalog.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_dir TEXT PRIMARY KEY,
+    run TEXT, subject TEXT, method TEXT, window_s REAL, vote INTEGER,
+    freqs TEXT, chs TEXT, earlystop INTEGER, idle INTEGER, dtype TEXT,
+    started TEXT, meta_mtime_ns INTEGER, meta_json TEXT, indexed_at TEXT
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_dir TEXT PRIMARY KEY REFERENCES runs(run_dir) ON DELETE CASCADE,
+    analysis_version INTEGER, classes TEXT, selection_time REAL,
+    acc_window REAL, lat_mean_window REAL, lat_median_window REAL, itr_window REAL,
+    acc_trial REAL, lat_mean_trial REAL, lat_median_trial REAL, itr_trial REAL,
+    idle_fp_rate REAL, row_json TEXT, analysed_at TEXT
+);
+CREATE TABLE IF NOT EXISTS trials (
+    run_dir TEXT REFERENCES runs(run_dir) ON DELETE CASCADE,
+    trial_id REAL, true_freq REAL, pred_freq REAL, lat_first REAL, correct INTEGER,
+    PRIMARY KEY (run_dir, trial_id)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_method_window ON runs(method, window_s);
+CREATE INDEX IF NOT EXISTS idx_runs_subject ON runs(subject);
+CREATE INDEX IF NOT EXISTS idx_runs_started ON runs(started);
+CREATE INDEX IF NOT EXISTS idx_trials_true ON trials(true_freq);
+"""
+
+METRIC_COLS = ["acc_window", "lat_mean_window", "lat_median_window", "itr_window",
+               "acc_trial", "lat_mean_trial", "lat_median_trial", "itr_trial", "idle_fp_rate"]
+
+def connect(db_path):
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    con = sqlite3.connect(db_path, timeout=30.0)
+    con.execute("PRAGMA journal_mode=WAL")  # GUI 写入与命令行查询可同时进行
+    con.execute("PRAGMA foreign_keys=ON")
+    con.executescript(SCHEMA)
+    return con
+
+def _num(v):
+    """NaN / 非数值 -> None（SQLite 里存 NULL）"""
+    try:
+        v = float(v)
+    except (TypeError, ValueError):
+        return None
+    return None if v != v else v
+
+def subject_of(meta, run_name):
+    """被试 ID：meta 里有就用；否则按 GUI 的命名约定 <被试>_<解码器>_w..._v... 取第一段"""
+    if meta.get("subject"):
+        return str(meta["subject"])
+    parts = run_name.split("_")
+    return parts[0] if len(parts) >= 3 else None
+
+def index_run(con, run_dir, force=False):
+    """登记（或更新）一个 run 的元数据；meta.json 未变化时跳过。返回是否写入"""
+    run_dir = os.path.abspath(run_dir)
+    meta_path = os.path.join(run_dir, "meta.json")
+    if not os.path.isfile(meta_path):
+        return False
+    mtime = os.stat(meta_path).st_mtime_ns
+    if not force:
+        row = con.execute("SELECT meta_mtime_ns FROM runs WHERE run_dir=?", (run_dir,)).fetchone()
+        if row and row[0] == mtime:
+            return False
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except Exception as e:
+        print("  WARN meta unreadable:", meta_path, e)
+        return False
+    run = os.path.basename(run_dir)
+    con.execute(
+        """INSERT INTO runs (run_dir, run, subject, method, window_s, vote, freqs, chs, earlystop, idle, dtype, started, meta_mtime_ns, meta_json, indexed_at)
+           VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+           ON CONFLICT(run_dir) DO UPDATE SET run=excluded.run, subject=excluded.subject, method=excluded.method,
+               window_s=excluded.window_s, vote=excluded.vote, freqs=excluded.freqs, chs=excluded.chs,
+               earlystop=excluded.earlystop, idle=excluded.idle, dtype=excluded.dtype, started=excluded.started,
+               meta_mtime_ns=excluded.meta_mtime_ns, meta_json=excluded.meta_json, indexed_at=excluded.indexed_at""",
+        (run_dir, run, subject_of(meta, run), meta.get("method"), _num(meta.get("window_s")), meta.get("vote"),
+         str(meta.get("freqs")) if meta.get("freqs") is not None else None,
+         json.dumps(meta.get("chs_final", meta.get("chs")), ensure_ascii=False),
+         int(bool(meta.get("earlystop"))), int(bool(meta.get("idle"))), meta.get("dtype", "float64"),
+         meta.get("timestamp"), mtime, json.dumps(meta, ensure_ascii=False), datetime.now().isoformat(timespec="seconds")))
+    return True
+
+def record_metrics(con, row, df_trial, classes, selection_time, version):
+    """写入 compute_metrics 的汇总行（原样保存在 row_json，导出时还原 batch_summary 的列）与试次级结果"""
+    run_dir = os.path.abspath(row["dir"])
+    if con.execute("SELECT 1 FROM runs WHERE run_dir=?", (run_dir,)).fetchone() is None:
+        # 没有 meta.json 的旧 run：只用汇总行里的信息登记
+        con.execute("INSERT INTO runs (run_dir, run, subject, method, window_s, indexed_at) VALUES (?,?,?,?,?,?)",
+                    (run_dir, row["run"], subject_of({}, row["run"]), row.get("method"), _num(row.get("window_s")),
+                     datetime.now().isoformat(timespec="seconds")))
+    con.execute(
+        f"""INSERT OR REPLACE INTO metrics (run_dir, analysis_version, classes, selection_time, {", ".join(METRIC_COLS)}, row_json, analysed_at)
+            VALUES ({", ".join("?" * (len(METRIC_COLS) + 6))})""",
+        (run_dir, version, ",".join(f"{c:g}" for c in classes), selection_time, *[_num(row.get(c)) for c in METRIC_COLS],
+         json.dumps(row, ensure_ascii=False, default=float), datetime.now().isoformat(timespec="seconds")))
+    con.execute("DELETE FROM trials WHERE run_dir=?", (run_dir,))
+    if df_trial is not None and len(df_trial):
+        t = df_trial.dropna(subset=["true"])
+        con.executemany("INSERT OR REPLACE INTO trials VALUES (?,?,?,?,?,?)",
+                        [(run_dir, _num(r.trial_id), _num(r.true), _num(r.pred), _num(r.lat_first),
+                          None if _num(r.pred) is None else int(abs(r.true - r.pred) < 1e-6))
+                         for r in t.itertuples(index=False)])
+
+def has_metrics(con, run_dir, version):
+    r = con.execute("SELECT analysis_version FROM metrics WHERE run_dir=?", (os.path.abspath(run_dir),)).fetchone()
+    return r is not None and r[0] == version
+
+def scan(con, root, force=False):
+    """遍历 root 下所有 run 文件夹（含 meta.json），登记新增/变化的 run；返回 (登记数, 总数)"""
+    paths = glob.glob(os.path.join(root, "**", "meta.json"), recursive=True)
+    n = 0
+    for p in paths:
+        n += index_run(con, os.path.dirname(p), force=force)
+    con.commit()
+    return n, len(paths)
+
+def build_query(args):
+    where, params = [], []
+    if args.method:
+        where.append("r.method = ? COLLATE NOCASE"); params.append(args.method)
+    if args.window:
+        where.append("ABS(r.window_s - ?) < 1e-6"); params.append(args.window)
+    if args.subject:
+        where.append("r.subject IN (%s)" % ",".join("?" * len(args.subject.split(","))))
+        params += args.subject.split(",")
+    if args.days:
+        args.since = (datetime.now() - timedelta(days=args.days)).strftime("%Y-%m-%d")
+    if args.since:
+        where.append("r.started >= ?"); params.append(args.since)
+    if args.until:
+        where.append("r.started < ?"); params.append(args.until)
+    if args.like:
+        where.append("r.run LIKE ?"); params.append(args.like)
+    if args.analysed:
+        where.append("m.run_dir IS NOT NULL")
+    if args.where:
+        where.append(f"({args.where})")
+    return (" WHERE " + " AND ".join(where)) if where else "", params
+
+def query_runs(con, args):
+    """按条件筛选 run：每行为 run 元数据 + 汇总指标"""
+    w, params = build_query(args)
+    sql = f"""SELECT r.run, r.subject, r.method, r.window_s, r.vote, r.started, {", ".join("m." + c for c in METRIC_COLS)}, r.run_dir, m.row_json
+              FROM runs r LEFT JOIN metrics m ON m.run_dir = r.run_dir{w} ORDER BY r.started, r.run"""
+    return pd.read_sql_query(sql, con, params=params)
+
+def group_summary(df, keys):
+    """按 keys 分组汇总：run 数与主要指标的均值"""
+    cols = ["acc_trial", "acc_window", "itr_trial", "lat_median_trial", "idle_fp_rate"]
+    g = df.groupby(keys, dropna=False)
+    out = g[cols].mean()
+    out.insert(0, "runs", g.size())
+    return out.reset_index()
+
+def export_batch_summary(df, out_path):
+    """导出成 compute_metrics 的 batch_summary.xlsx 版式（汇总行原样还原；未分析的 run 跳过）"""
+    rows = [json.loads(s) for s in df["row_json"].dropna()]
+    if not rows:
+        print("Nothing to export (no analysed runs match).")
+        return
+    from compute_metrics import excel_engine
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    if out_path.lower().endswith(".csv"):
+        pd.DataFrame(rows).to_csv(out_path, index=False, encoding="utf-8")
+    else:
+        with pd.ExcelWriter(out_path, engine=excel_engine()) as xw:
+            pd.DataFrame(rows).to_excel(xw, index=False, sheet_name="summary")
+    print(f"Exported {len(rows)} run(s) to:", out_path)
+
+def main():
+    ap = argparse.ArgumentParser(description="index runs into a local SQLite catalogue and query across sessions")
+    ap.add_argument("--db", type=str, default=DEFAULT_DB, help="目录数据库路径")
+    ap.add_argument("--scan", type=str, default=None, help="登记该目录下所有 run（只处理新增或 meta.json 有变化的）")
+    ap.add_argument("--analyse", action="store_true", help="与 --scan 一起用：对还没有指标（或分析版本过旧）的 run 计算指标并入库")
+    ap.add_argument("--classes", type=str, default="10,12,15,20", help="--analyse 用")
+    ap.add_argument("--selection_time", type=float, default=3.0, help="--analyse 用")
+    ap.add_argument("--outputs", type=str, default="none", choices=["none", "xlsx", "csv", "parquet"],
+                    help="--analyse 时是否同时在各 run 目录写出指标表（默认 none：只写入目录数据库）")
+    ap.add_argument("--no_raw", action="store_true", help="--outputs 时不把原始 latency 表写进指标文件")
+    ap.add_argument("--force", action="store_true", help="忽略 mtime，全部重新登记")
+    ap.add_argument("--method", type=str, default=None, help="例如 FBCCA / CCA+ / HYBRID / TRCA")
+    ap.add_argument("--window", type=float, default=None, help="窗长（秒）")
+    ap.add_argument("--subject", type=str, default=None, help="被试 ID（逗号分隔）")
+    ap.add_argument("--since", type=str, default=None, help="起始日期（含），如 2025-09-01")
+    ap.add_argument("--until", type=str, default=None, help="截止日期（不含）")
+    ap.add_argument("--days", type=int, default=0, help="最近 N 天（覆盖 --since）")
+    ap.add_argument("--like", type=str, default=None, help="run 名称 LIKE 模式，如 C1_%%")
+    ap.add_argument("--where", type=str, default=None, help="附加 SQL 条件（表别名 r=runs, m=metrics）")
+    ap.add_argument("--analysed", action="store_true", help="只列出已有指标的 run")
+    ap.add_argument("--group", type=str, default=None, help="分组汇总的列（逗号分隔），如 method,window_s 或 subject")
+    ap.add_argument("--export", type=str, default=None, help="把筛选结果导出为 batch_summary 版式（.xlsx / .csv）")
+    ap.add_argument("--sql", type=str, default=None, help="直接执行只读 SQL 并打印结果")
+    args = ap.parse_args()
+
+    con = connect(args.db)
+    try:
+        if args.scan:
+            t0 = time.perf_counter()
+            n, total = scan(con, args.scan, force=args.force)
+            print(f"Indexed {n} new/changed run(s) of {total} in {time.perf_counter() - t0:.2f}s")
+            if args.analyse:
+                from compute_metrics import one_run, trial_aggregate, read_csv, parquet_available, ANALYSIS_VERSION
+                fmt = None if args.outputs == "none" else args.outputs
+                if fmt == "parquet" and not parquet_available():
+                    print("WARN: parquet backend needs pyarrow or fastparquet; falling back to csv")
+                    fmt = "csv"
+                classes = [float(x) for x in args.classes.split(",")]
+                dirs = [d for (d,) in con.execute("SELECT run_dir FROM runs")]
+                todo = [d for d in dirs if os.path.isfile(os.path.join(d, "latency.csv")) and (args.force or not has_metrics(con, d, ANALYSIS_VERSION))]
+                for d in todo:
+                    csv_path = os.path.join(d, "latency.csv")
+                    try:
+                        row = one_run(csv_path, classes, args.selection_time, fmt=fmt, plots=False, raw=not args.no_raw)
+                        record_metrics(con, row, trial_aggregate(read_csv(csv_path)), classes, args.selection_time, ANALYSIS_VERSION)
+                        con.commit()
+                    except Exception as e:
+                        print("  WARN failed:", csv_path, e)
+                print(f"Analysed {len(todo)} run(s)")
+
+        con.commit()
+        con.execute("PRAGMA query_only=ON")  # 以下只读：--sql 与 --where 都是用户给的 SQL
+        if args.sql:
+            print(pd.read_sql_query(args.sql, con).to_string(index=False))
+            return
+
+        if not args.scan or any(v for v in (args.method, args.window, args.subject, args.since, args.until, args.days, args.like, args.where, args.group, args.export)):
+            df = query_runs(con, args)
+            if args.export:
+                export_batch_summary(df, args.export)
+            if args.group:
+                print(group_summary(df, [k.strip() for k in args.group.split(",")]).to_string(index=False))
+            else:
+                cols = ["run", "subject", "method", "window_s", "vote", "started", "acc_trial", "acc_window", "itr_trial", "lat_median_trial"]
+                print(df[cols].to_string(index=False) if len(df) else "No runs match.")
+            print(f"{len(df)} run(s), {int(df['row_json'].notna().sum())} analysed")
+    finally:
+        con.commit()
+        con.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 @echo off
 call conda activate bci-ssvep
+set PYTHONPATH=C:\Users\23842\Desktop\bci;%PYTHONPATH%
 cd /d C:\Users\23842\Desktop\bci\analysis
 python compute_metrics.py
 pause
@@ -0,0 +1,3 @@
+# common/
+# online/ 与 analysis/ 共用的模块（SNR 定义、剖析工具）。脚本按路径运行时需把仓库根目录加入 PYTHONPATH，
+# GUI 与 .bat 启动脚本已自动设置。
@@ -0,0 +1,212 @@
+# common/profiling.py
+# --profile：不改脚本即可在实验现场剖析解码器（online/）与分析脚本（analysis/）。
+#   sample   ：后台线程定时抓取所有线程的调用栈（默认 5ms 一次），开销低，适合正式实验
+#   cprofile ：cProfile 确定性剖析（只覆盖调用 start() 的线程，开销较大，适合复现问题）
+# 两种模式都同时用 tracemalloc（只记 1 层调用栈）统计内存分配，结束时把耗时与分配最多的位置写进输出目录。
+# 解码器在进入解码循环时才开始剖析（启动耗时另见 meta.json 的 startup），统计的是解码循环里的耗时与分配。
+import cProfile, io, json, os, pstats, sys, threading, time, tracemalloc
+from collections import Counter
+
+MODES = ("sample", "cprofile")
+TOP = 30
+
+class StackSampler:
+    """采样式剖析：每 interval 秒用 sys._current_frames() 抓一次各线程调用栈，按栈计数"""
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="profiler")
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    c = frame.f_code
+                    stack.append(f"{os.path.basename(c.co_filename)}:{c.co_name}:{c.co_firstlineno}")
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)))
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+    def threads(self):
+        """{线程名: 被采到的次数}，按次数排序"""
+        c = Counter()
+        for st, n in self.stacks.items():
+            c[st[0]] += n
+        return dict(c.most_common())
+
+    def table(self, thread):
+        """某线程的 [(函数, 自身样本数, 累计样本数)]，按自身样本数排序"""
+        own, total = Counter(), Counter()
+        for st, n in self.stacks.items():
+            if st[0] != thread:
+                continue
+            own[st[-1]] += n
+            for fn in set(st[1:]):
+                total[fn] += n
+        return [(fn, own[fn], total[fn]) for fn, _ in own.most_common()]
+
+# 内存统计里不看的位置：模块导入、剖析器自身
+IGNORE = [tracemalloc.Filter(False, "<frozen importlib._bootstrap>"), tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+          tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+
+class Profiler:
+    """sample 模式下 tracemalloc 只在周期性的短时段内开启（默认每 60s 开 2s），每段结束取快照；
+    tracemalloc 会让分配密集的代码慢数倍，持续开启会改变被测的延迟。cprofile 模式本身开销就大，持续跟踪。"""
+    def __init__(self, mode="sample", interval=0.005, burst=(2.0, 60.0)):
+        if mode not in MODES:
+            raise ValueError(f"unknown profile mode: {mode}")
+        self.mode = mode
+        self.interval = interval
+        self.burst = burst if mode == "sample" else None
+        self.prof = None
+        self.sampler = None
+        self.marks = []            # (标签, 快照)：持续跟踪时 mark() 记下的快照
+        self.first = None          # 第一段（或开始跟踪后第一次 mark）的快照
+        self.last = None
+        self.bursts = 0
+        self.peak = 0
+        self.malloc_from = None
+        self._stop = threading.Event()
+        self._burst_thread = None
+
+    def start(self):
+        self.thread = threading.current_thread().name
+        self.t0 = time.perf_counter()
+        self._malloc_on("start")
+        if self.mode == "cprofile":
+            self.prof = cProfile.Profile()
+            self.prof.enable()
+        else:
+            self.sampler = StackSampler(self.interval)
+            self.sampler.start()
+        return self
+
+    def _malloc_on(self, label):
+        self.malloc_from = label
+        if self.burst is None:
+            tracemalloc.start(1)
+        else:
+            self._burst_thread = threading.Thread(target=self._burst_loop, daemon=True, name="profiler-malloc")
+            self._burst_thread.start()
+
+    def _take(self):
+        snap = tracemalloc.take_snapshot().filter_traces(IGNORE)
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        self.first = self.first or snap
+        self.last = snap
+        return snap
+
+    def _burst_loop(self):
+        on, every = self.burst
+        while True:
+            tracemalloc.start(1)
+            if self._stop.wait(on):
+                return              # 停止时仍在跟踪：由 stop() 取最后一个快照
+            self._take()
+            self.bursts += 1
+            tracemalloc.stop()
+            if self._stop.wait(max(every - on, 0.0)):
+                return
+
+    def mark(self, label):
+        """持续跟踪（cprofile 模式）时记一个快照，结束时给出此后的内存增长"""
+        if self.burst is None:
+            self.marks.append((label, self._take()))
+
+    def stop(self, out_dir, prefix="profile"):
+        """停止剖析，把结果写进 out_dir，返回摘要（写入 meta.json / qc.json）"""
+        dur = time.perf_counter() - self.t0
+        if self.prof is not None:
+            self.prof.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        self._stop.set()
+        if self._burst_thread is not None:
+            self._burst_thread.join()
+        if tracemalloc.is_tracing():
+            self._take()
+            self.bursts += self.burst is not None
+            tracemalloc.stop()
+        os.makedirs(out_dir, exist_ok=True)
+        txt = os.path.join(out_dir, f"{prefix}.txt")
+        files = [txt]
+        summary = {"mode": self.mode, "duration_s": round(dur, 3), "malloc_from": self.malloc_from, "peak_traced_mb": round(self.peak / 2**20, 2)}
+        if self.burst is not None:
+            summary["malloc_bursts"] = self.bursts
+
+        with open(txt, "w", encoding="utf-8") as f:
+            f.write(f"# {self.mode} profile, {dur:.1f}s\n\n")
+            if self.prof is not None:
+                stats_path = os.path.join(out_dir, f"{prefix}.pstats")   # snakeviz / pstats 可直接打开
+                self.prof.dump_stats(stats_path)
+                files.append(stats_path)
+                for key in ("cumulative", "tottime"):
+                    s = io.StringIO()
+                    pstats.Stats(self.prof, stream=s).sort_stats(key).print_stats(TOP)
+                    f.write(f"## sorted by {key}\n{s.getvalue()}\n")
+                st = pstats.Stats(self.prof)
+                summary["calls"] = st.total_calls
+                summary["top"] = [{"func": f"{os.path.basename(k[0])}:{k[2]}:{k[1]}", "tottime_s": round(v[2], 4), "cumtime_s": round(v[3], 4)}
+                                  for k, v in sorted(st.stats.items(), key=lambda kv: -kv[1][2])[:5]]
+            else:
+                f.write(f"samples: {self.sampler.samples} (every {self.interval * 1000:.0f} ms; wall clock, waiting time included)\n")
+                threads = self.sampler.threads()
+                for name, n in threads.items():
+                    f.write(f"\n## thread {name}: {n} samples\n{'self%':>7} {'total%':>7}  function\n")
+                    for fn, own, total in self.sampler.table(name)[:TOP]:
+                        f.write(f"{100 * own / n:7.1f} {100 * total / n:7.1f}  {fn}\n")
+                folded = os.path.join(out_dir, f"{prefix}_folded.txt")   # flamegraph.pl / speedscope 格式
+                with open(folded, "w", encoding="utf-8") as g:
+                    for st, c in self.sampler.stacks.most_common():
+                        g.write(";".join(st) + f" {c}\n")
+                files.append(folded)
+                summary["samples"] = self.sampler.samples
+                summary["threads"] = threads
+                n = max(threads.get(self.thread, 0), 1)   # 摘要只列调用 start() 的线程（解码循环所在线程）
+                summary["top"] = [{"func": fn, "self_pct": round(100 * own / n, 1), "total_pct": round(100 * total / n, 1)}
+                                  for fn, own, total in self.sampler.table(self.thread)[:5]]
+
+        alloc = os.path.join(out_dir, f"{prefix}_alloc.txt")
+        top = self.last.statistics("lineno") if self.last is not None else []
+        with open(alloc, "w", encoding="utf-8") as f:
+            how = f"{self.bursts} burst(s) of {self.burst[0]:g}s every {self.burst[1]:g}s" if self.burst else "continuous"
+            f.write(f"# tracemalloc ({how}) since '{self.malloc_from}': peak {self.peak / 2**20:.2f} MB\n\n")
+            f.write(f"## live allocations at the {'end of the last burst' if self.burst else 'end'} (top {TOP})\n")
+            for s in top[:TOP]:
+                f.write(f"{s.size / 1024:10.1f} KiB {s.count:8d} blocks  {s.traceback}\n")
+            bases = self.marks if self.burst is None else ([("first burst", self.first)] if self.bursts > 1 else [])
+            for label, base in bases:
+                f.write(f"\n## growth since '{label}' (top {TOP})\n")
+                for s in self.last.compare_to(base, "lineno")[:TOP]:
+                    f.write(f"{s.size_diff / 1024:+10.1f} KiB {s.count_diff:+8d} blocks  {s.traceback}\n")
+        files.append(alloc)
+        summary["alloc_top"] = [{"site": str(s.traceback), "kib": round(s.size / 1024, 1), "blocks": s.count} for s in top[:5]]
+        summary["files"] = [os.path.basename(p) for p in files]
+        return summary
+
+def start(mode):
+    """--profile 未给时返回 None"""
+    return Profiler(mode).start() if mode else None
+
+def add_profile_args(ap):
+    ap.add_argument("--profile", nargs="?", const="sample", default=None, choices=MODES,
+                    help="剖析本次运行：sample（默认，低开销采样）或 cprofile；结果与 tracemalloc 内存分配统计写入输出目录")
+
+def write_summary(out_dir, summary, name="profile_summary.json"):
+    with open(os.path.join(out_dir, name), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
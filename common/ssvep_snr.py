@@ -0,0 +1,32 @@
+# common/ssvep_snr.py
+# SSVEP SNR 的唯一定义：离线 QC（analysis/quick_qc_psd.py）与解码器内的滚动通道质检（online/channel_qc.py）共用，
+# 两边的分数不会因各自修改而不一致。
+from functools import lru_cache
+import numpy as np
+
+def qc_targets(freqs):
+    """QC 打分目标：各目标基频(权重1.0)与二次谐波(权重0.5)"""
+    return tuple((f_,1.0) for f_ in freqs) + tuple((2*f_,0.5) for f_ in freqs)
+
+def trapz_weights(f, m):
+    """把 np.trapz(y[m], f[m]) 写成 w @ y 的权重向量（掩码点按顺序连成折线，与原积分完全一致）"""
+    w = np.zeros(len(f))
+    idx = np.flatnonzero(m)
+    if len(idx) >= 2:
+        d = np.diff(f[idx]) / 2.0
+        w[idx[:-1]] += d
+        w[idx[1:]] += d
+    return w
+
+@lru_cache(maxsize=32)
+def snr_weights(fs, nfft, targets, bw=0.5, inner=0.5, outer=2.0):
+    """按 (fs, nfft, 目标集) 预计算带内/邻带积分权重矩阵，形状均为 (n_targets, n_freq)；频率轴为 rfftfreq(nfft, 1/fs)"""
+    f = np.fft.rfftfreq(nfft, 1.0/fs)
+    W_sig = np.zeros((len(targets), len(f)))
+    W_nb = np.zeros((len(targets), len(f)))
+    for i, (f0, _) in enumerate(targets):
+        m_sig = (f>=f0-bw) & (f<=f0+bw)
+        m_nb = ((f>=f0-outer)&(f<=f0-inner)) | ((f>=f0+inner)&(f<=f0+outer))
+        W_sig[i] = trapz_weights(f, m_sig)
+        W_nb[i] = trapz_weights(f, m_nb)
+    return W_sig, W_nb
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# gui/live_scores.py
+# 实时分数面板（pyqtgraph）：订阅解码器 --score_stream 发布的 LSL 流 SSVEPScores，
+# 显示各目标分数、r1/margin 与 IDLE/CONTROL 状态。独立进程运行，不占用解码器与 tkinter GUI 的线程。
+import argparse, sys
+import numpy as np
+
+class DecimatedRing:
+    """定长环形缓冲 + 按时间抽取：每 bin 秒只保留最后一个样本，容量 = history / bin。
+    不管解码器每秒出多少窗，存储与每次重绘的点数都不超过容量。"""
+    def __init__(self, n_cols, history=30.0, bin_s=0.1):
+        self.bin_s = bin_s
+        self.cap = max(2, int(round(history / bin_s)))
+        self.t = np.full(self.cap, np.nan)
+        self.v = np.full((self.cap, n_cols), np.nan)
+        self.i = 0          # 下一个写入位置
+        self.n = 0
+        self.last_bin = None
+
+    def add(self, ts, rows):
+        for t, r in zip(ts, rows):
+            b = int(t // self.bin_s)
+            if b == self.last_bin and self.n:
+                j = (self.i - 1) % self.cap   # 同一个 bin：覆盖
+            else:
+                j = self.i
+                self.i = (self.i + 1) % self.cap
+                self.n = min(self.n + 1, self.cap)
+                self.last_bin = b
+            self.t[j] = t
+            self.v[j] = r
+
+    def view(self):
+        """按时间顺序返回 (t, v)"""
+        if self.n < self.cap:
+            return self.t[:self.n], self.v[:self.n]
+        return np.roll(self.t, -self.i), np.roll(self.v, -self.i, axis=0)
+
+def channel_labels(info, n):
+    """从流描述里读通道标签；读不到时按位置命名"""
+    labels = []
+    try:
+        ch = info.desc().child("channels").child("channel")
+        while not ch.empty():
+            labels.append(ch.child_value("label"))
+            ch = ch.next_sibling()
+    except Exception:
+        pass
+    return labels if len(labels) == n else [f"ch{i}" for i in range(n - 4)] + ["r1", "margin", "state", "pred_freq"]
+
+class ScorePanel:
+    """三栏：各目标分数 / r1 与 margin（含早停阈值线）/ 状态（CONTROL=1, IDLE=0）；标题显示最新预测"""
+    def __init__(self, labels, history=30.0, bin_s=0.1, rmin=None, margin=None):
+        import pyqtgraph as pg
+        self.pg = pg
+        self.targets = labels[:-4]
+        self.ring = DecimatedRing(len(labels), history, bin_s)
+        self.win = pg.GraphicsLayoutWidget(title="SSVEP live scores")
+        self.win.resize(900, 600)
+        self.p_sc = self.win.addPlot(row=0, col=0, title="per-target score")
+        self.p_sc.addLegend(offset=(5, 5))
+        self.p_rm = self.win.addPlot(row=1, col=0, title="r1 / margin")
+        self.p_rm.addLegend(offset=(5, 5))
+        self.p_st = self.win.addPlot(row=2, col=0, title="state")
+        self.p_st.setYRange(-0.1, 1.1)
+        self.p_st.getAxis("left").setTicks([[(0, "IDLE"), (1, "CONTROL")]])
+        for p in (self.p_rm, self.p_st):
+            p.setXLink(self.p_sc)
+        self.c_sc = [self.p_sc.plot(pen=pg.intColor(i, hues=max(len(self.targets), 1)), name=t) for i, t in enumerate(self.targets)]
+        self.c_r1 = self.p_rm.plot(pen=pg.mkPen("y", width=2), name="r1")
+        self.c_mg = self.p_rm.plot(pen=pg.mkPen("c", width=2), name="margin")
+        if rmin is not None:
+            self.p_rm.addLine(y=rmin, pen=pg.mkPen("y", style=pg.QtCore.Qt.DashLine))
+        if margin is not None:
+            self.p_rm.addLine(y=margin, pen=pg.mkPen("c", style=pg.QtCore.Qt.DashLine))
+        self.c_st = self.p_st.plot(pen=pg.mkPen("g", width=2), stepMode="right")
+        self.dirty = False
+
+    def feed(self, ts, rows):
+        if len(ts):
+            self.ring.add(ts, rows)
+            self.dirty = True
+
+    def redraw(self):
+        """只在有新数据时重绘；每条曲线的点数不超过环形缓冲容量"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        t, v = self.ring.view()
+        if not len(t):
+            return
+        x = t - t[-1]  # 横轴：相对最新判决的秒数
+        for k, c in enumerate(self.c_sc):
+            c.setData(x, v[:, k], connect="finite")
+        self.c_r1.setData(x, v[:, -4], connect="finite")
+        self.c_mg.setData(x, v[:, -3], connect="finite")
+        self.c_st.setData(x, v[:, -2], connect="finite")
+        pred = v[-1, -1]
+        self.p_sc.setTitle(f"per-target score | pred = {'IDLE' if np.isnan(pred) else f'{pred:g} Hz'}")
+
+def main():
+    ap = argparse.ArgumentParser(description="live score panel for the online decoders (needs --score_stream on the decoder)")
+    ap.add_argument("--name", type=str, default="SSVEPScores", help="LSL 流名称")
+    ap.add_argument("--resolve_timeout", type=float, default=60.0, help="等待数据流出现的最长时间（秒）")
+    ap.add_argument("--history", type=float, default=30.0, help="显示的时间跨度（秒）")
+    ap.add_argument("--bin", type=float, default=0.1, help="抽取间隔（秒）：每个间隔只保留最后一个窗的结果")
+    ap.add_argument("--fps", type=float, default=15.0, help="固定重绘频率")
+    ap.add_argument("--rmin", type=float, default=None, help="在 r1 图上画早停阈值线")
+    ap.add_argument("--margin", type=float, default=None, help="在 margin 图上画早停阈值线")
+    args = ap.parse_args()
+
+    try:
+        import pyqtgraph as pg
+    except ImportError:
+        sys.exit("live score panel needs pyqtgraph and a Qt binding: pip install pyqtgraph PyQt5")
+    from pylsl import StreamInlet
+    try:
+        from pylsl import resolve_byprop
+    except ImportError:
+        from pylsl.resolve import resolve_byprop
+
+    app = pg.mkQApp("SSVEP live scores")
+    print(f"Waiting for LSL stream '{args.name}' (start the decoder with --score_stream)...", flush=True)
+    infos = resolve_byprop("name", args.name, minimum=1, timeout=args.resolve_timeout)
+    if not infos:
+        sys.exit(f"no '{args.name}' stream found within {args.resolve_timeout:.0f}s")
+    inlet = StreamInlet(infos[0], max_buflen=int(max(args.history, 1)) + 1)
+    info = inlet.info()
+    labels = channel_labels(info, info.channel_count())
+    panel = ScorePanel(labels, args.history, args.bin, args.rmin, args.margin)
+    panel.win.show()
+
+    def tick():
+        chunk, ts = inlet.pull_chunk(timeout=0.0, max_samples=4096)
+        if chunk:
+            panel.feed(np.asarray(ts, dtype=float), np.asarray(chunk, dtype=float))
+        panel.redraw()
+
+    timer = pg.QtCore.QTimer()
+    timer.timeout.connect(tick)
+    timer.start(int(1000 / max(args.fps, 1.0)))
+    print(f"[LIVE] {info.name()} from {info.source_id()}: {len(labels) - 4} targets, redraw {args.fps:g} fps", flush=True)
+    app.exec() if hasattr(app, "exec") else app.exec_()
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, filedialog
 import subprocess
+import socket
+import json
 import threading
 import time
 import sys
@@ -10,6 +12,10 @@ import os
 from pathlib import Path
 from datetime import datetime
 
+# 解码器 / 分析脚本按路径启动，需要能导入仓库根目录下的 common 包；子进程继承该环境变量
+REPO_ROOT = str(Path(__file__).resolve().parent.parent)
+os.environ["PYTHONPATH"] = os.pathsep.join([REPO_ROOT] + [p for p in os.environ.get("PYTHONPATH", "").split(os.pathsep) if p and p != REPO_ROOT])
+
 class BCIRunner:
     def __init__(self, root):
         self.root = root
@@ -19,8 +25,13 @@ class BCIRunner:
         # 进程管理
         self.decoder_process = None
         self.stimulus_process = None
+        self.panel_process = None
+        self.daemon_process = None
+        self.daemon_port = 47810  # decoder_daemon.py 的默认控制端口
         self.batch_running = False
         self.stop_batch = False
+        self.decoder_ready = threading.Event()  # 解码器输出 [READY] 后置位
+        self.daemon_listening = threading.Event()  # 守护进程输出 [DAEMON] listening 后置位
         
         # 工作目录（确保在 bci 根目录）
         self.bci_root = Path(__file__).parent.parent
@@ -98,7 +109,7 @@ class BCIRunner:
         # 解码器类型
         ttk.Label(config_frame, text="解码器:").grid(row=0, column=2, sticky=tk.W)
         self.decoder_var = tk.StringVar(value="CCA+")
-        decoder_combo = ttk.Combobox(config_frame, textvariable=self.decoder_var, values=["CCA+", "FBCCA", "Hybrid"], width=8, state="readonly")
+        decoder_combo = ttk.Combobox(config_frame, textvariable=self.decoder_var, values=["CCA+", "FBCCA", "Hybrid", "TRCA"], width=8, state="readonly")
         decoder_combo.grid(row=0, column=3, sticky=tk.W, padx=(5, 20))
         
         # 窗口长度
@@ -171,6 +182,23 @@ class BCIRunner:
         self.freq_tune_var = tk.BooleanVar(value=False)
         ttk.Checkbutton(advanced_frame, text="频率细调", variable=self.freq_tune_var).grid(row=1, column=5, sticky=tk.W, padx=(10, 0))
         
+        # 实时分数面板（pyqtgraph 独立窗口；解码器加 --score_stream 发布分数流）
+        self.live_panel_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(advanced_frame, text="实时分数面板", variable=self.live_panel_var).grid(row=1, column=6, columnspan=2, sticky=tk.W, padx=(10, 0))
+        
+        # 目标配置（刺激端、解码器、通道QC 与分析共用同一组频率；相位与网格只影响刺激端）
+        ttk.Label(advanced_frame, text="目标频率:").grid(row=2, column=0, sticky=tk.W)
+        self.freqs_var = tk.StringVar(value="10,12,15,20")
+        ttk.Entry(advanced_frame, textvariable=self.freqs_var, width=30).grid(row=2, column=1, columnspan=4, sticky=(tk.W, tk.E), padx=(10, 0))
+        
+        ttk.Label(advanced_frame, text="相位(π):").grid(row=2, column=5, sticky=tk.W, padx=(10, 5))
+        self.phases_var = tk.StringVar(value="")
+        ttk.Entry(advanced_frame, textvariable=self.phases_var, width=16).grid(row=2, column=6, sticky=tk.W)
+        
+        ttk.Label(advanced_frame, text="网格:").grid(row=2, column=7, sticky=tk.W, padx=(10, 5))
+        self.grid_var = tk.StringVar(value="")
+        ttk.Entry(advanced_frame, textvariable=self.grid_var, width=8).grid(row=2, column=8, sticky=tk.W)
+        
         # 单项运行区域
         single_frame = ttk.LabelFrame(main_frame, text="单项运行", padding="10")
         single_frame.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
@@ -189,6 +217,9 @@ class BCIRunner:
         ttk.Button(batch_frame, text="全通道 8 组", command=lambda: self.run_batch("all")).grid(row=0, column=1, padx=(5, 5))
         ttk.Button(batch_frame, text="全部 16 组", command=lambda: self.run_batch("both")).grid(row=1, column=0, padx=(0, 5))
         ttk.Button(batch_frame, text="停止批量", command=self.stop_batch_run).grid(row=1, column=1, padx=(5, 5))
+        # 常驻解码进程：批量运行时只启动一次解码器（数据流保持连接），每组配置通过控制端口切换
+        self.daemon_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(batch_frame, text="常驻解码进程", variable=self.daemon_var).grid(row=2, column=0, columnspan=2, sticky=tk.W)
         
         # 状态显示
         status_frame = ttk.LabelFrame(main_frame, text="运行状态", padding="10")
@@ -270,7 +301,7 @@ class BCIRunner:
             qc_cmd = self.create_conda_cmd([
                 "python", "analysis/quick_qc_psd.py",
                 "--dur", "15",
-                "--freqs", "10,12,15,20",
+                "--freqs", self.get_freqs(),
                 "--out", "data/logs/qc"
             ])
             
@@ -327,8 +358,29 @@ class BCIRunner:
         logdir = Path(self.logdir_var.get())
         logdir.mkdir(parents=True, exist_ok=True)
         
+    def get_freqs(self):
+        """目标频率（逗号分隔，去掉空白）"""
+        return ",".join(f.strip() for f in self.freqs_var.get().split(",") if f.strip())
+        
+    def get_stimulus_cmd(self, runname=None):
+        """生成刺激端命令；给定 runname 时帧时序日志写入与解码器相同的 run 目录"""
+        python_cmd = ["python", "stimulus/ssvep_pygame.py", "--freqs", self.get_freqs()]
+        # 相位编码只改变刺激；CCA 类解码器对相位不敏感，只有 TRCA 的标定模板能利用它
+        if self.phases_var.get().strip():
+            python_cmd.extend(["--phases", self.phases_var.get().strip()])
+        if self.grid_var.get().strip():
+            python_cmd.extend(["--grid", self.grid_var.get().strip()])
+        if runname:
+            python_cmd.extend(["--outdir", self.logdir_var.get(), "--runname", runname])
+        return self.create_conda_cmd(python_cmd)
+        
     def get_decoder_cmd(self, window, vote, channels, logfile=None, runname=None):
         """生成解码器命令"""
+        script, args = self.get_decoder_args(window, vote, channels, logfile, runname)
+        return self.create_conda_cmd(["python", script] + args)
+        
+    def get_decoder_args(self, window, vote, channels, logfile=None, runname=None):
+        """生成解码器脚本与参数（子进程命令行与常驻解码进程共用）"""
         decoder = self.decoder_var.get()
         notch = self.notch_var.get()
         
@@ -336,14 +388,15 @@ class BCIRunner:
             script = "online/online_cca.py"
         elif decoder == "FBCCA":
             script = "online/online_fbcca.py"
+        elif decoder == "TRCA":
+            script = "online/online_trca.py"
         else:  # Hybrid
             script = "online/online_hybrid.py"
             
         python_cmd = [
-            "python", script,
             "--window", str(window),
             "--vote", str(vote),
-            "--freqs", "10,12,15,20",
+            "--freqs", self.get_freqs(),
             "--notch", notch,
             "--outdir", self.logdir_var.get()
         ]
@@ -374,11 +427,18 @@ class BCIRunner:
             python_cmd.extend(["--idle_rmin", self.idle_rmin_var.get()])
             python_cmd.extend(["--idle_margin", self.idle_margin_var.get()])
         
-        # 添加频率细调参数
-        if self.freq_tune_var.get():
+        # TRCA：按被试从模板库复用标定结果（没有则本次标定后存入）
+        if decoder == "TRCA":
+            python_cmd.extend(["--subject", self.subject_var.get()])
+            
+        # 添加频率细调参数（TRCA 用标定模板，无频率细调）
+        if self.freq_tune_var.get() and decoder != "TRCA":
             python_cmd.append("--freq_tune")
+        
+        if self.live_panel_var.get():
+            python_cmd.append("--score_stream")
             
-        return self.create_conda_cmd(python_cmd)
+        return script, python_cmd
         
     def get_logfile_name(self, window, vote, channels):
         """生成日志文件名"""
@@ -439,6 +499,7 @@ class BCIRunner:
                 "channels": channels
             }
             
+            self.decoder_ready.clear()
             self.decoder_process = subprocess.Popen(
                 cmd, 
                 stdout=subprocess.PIPE, 
@@ -448,6 +509,7 @@ class BCIRunner:
             )
             
             self.status_var.set("解码器运行中")
+            self.open_live_panel()
             
             # 启动线程监控输出
             threading.Thread(target=self.monitor_decoder, daemon=True).start()
@@ -456,6 +518,19 @@ class BCIRunner:
             self.log(f"启动解码器失败: {e}")
             messagebox.showerror("错误", f"启动解码器失败: {e}")
             
+    def open_live_panel(self):
+        """启动实时分数面板（已在运行则复用：解码器重启后面板自动重连同一分数流）"""
+        if not self.live_panel_var.get() or (self.panel_process and self.panel_process.poll() is None):
+            return
+        cmd = ["python", "gui/live_scores.py"]
+        if self.earlystop_var.get():
+            cmd += ["--rmin", self.rmin_var.get(), "--margin", self.margin_var.get()]
+        try:
+            self.panel_process = subprocess.Popen(self.create_conda_cmd(cmd), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.log("实时分数面板已启动")
+        except Exception as e:
+            self.log(f"启动实时分数面板失败: {e}")
+            
     def run_stimulus(self):
         """运行刺激端"""
         if self.stimulus_process and self.stimulus_process.poll() is None:
@@ -463,8 +538,12 @@ class BCIRunner:
             return
             
         try:
-            python_cmd = ["python", "stimulus/ssvep_pygame.py"]
-            cmd = self.create_conda_cmd(python_cmd)
+            # 解码器在运行时，帧时序日志与其 latency.csv 放在同一 run 目录
+            runname = None
+            run_info = getattr(self, 'current_run_info', None)
+            if run_info and self.decoder_process and self.decoder_process.poll() is None:
+                runname = run_info.get("runname")
+            cmd = self.get_stimulus_cmd(runname)
             
             self.log("启动刺激端...")
             self.log(f"命令: {' '.join(cmd)}")
@@ -501,7 +580,7 @@ class BCIRunner:
             # 先启动解码器
             self.run_decoder()
             self.log("等待解码器初始化...")
-            time.sleep(2)  # 等待解码器启动
+            self.wait_decoder_ready()
             
             # 再启动刺激端
             self.run_stimulus()
@@ -534,37 +613,117 @@ class BCIRunner:
         """停止所有进程"""
         self.stop_decoder()
         self.stop_stimulus()
+        self.stop_daemon()
+        if self.panel_process and self.panel_process.poll() is None:
+            self.panel_process.terminate()
         self.status_var.set("就绪")
         self.log("所有进程已停止")
         
+    def start_daemon(self, timeout=60.0):
+        """启动常驻解码进程（解析数据流、预加载解码器），等待其开始监听控制端口"""
+        if self.daemon_process and self.daemon_process.poll() is None:
+            return True
+        cmd = ["python", "online/decoder_daemon.py", "--port", str(self.daemon_port)]
+        self.daemon_listening.clear()
+        self.daemon_process = subprocess.Popen(self.create_conda_cmd(cmd), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1)
+        threading.Thread(target=self.monitor_daemon, daemon=True).start()
+        t0 = time.time()
+        while not self.daemon_listening.wait(0.1):
+            if self.daemon_process.poll() is not None or time.time() - t0 > timeout:
+                self.log("常驻解码进程启动失败，改用逐组启动解码器")
+                self.stop_daemon()
+                return False
+        self.log(f"常驻解码进程已就绪 ({time.time() - t0:.1f}s)")
+        return True
+        
+    def daemon_command(self, req, timeout=90.0):
+        """向常驻解码进程发送一条 JSON 命令并返回应答"""
+        with socket.create_connection(("127.0.0.1", self.daemon_port), timeout=timeout) as s:
+            s.sendall((json.dumps(req) + "\n").encode("utf-8"))
+            buf = b""
+            while not buf.endswith(b"\n"):
+                part = s.recv(65536)
+                if not part:
+                    break
+                buf += part
+        if not buf.strip():
+            return {"ok": False, "error": "no reply from daemon"}
+        return json.loads(buf.decode("utf-8"))
+        
+    def stop_daemon(self):
+        """结束常驻解码进程（先请求正常退出，让当前 run 写完日志）"""
+        proc = self.daemon_process
+        if not proc or proc.poll() is not None:
+            return
+        try:
+            self.daemon_command({"cmd": "quit"}, timeout=30.0)
+            proc.wait(timeout=10)
+        except Exception:
+            proc.terminate()
+        self.log("常驻解码进程已退出")
+        
+    def monitor_daemon(self):
+        """监控常驻解码进程输出（包含各组解码器的输出）"""
+        proc = self.daemon_process
+        try:
+            for line in iter(proc.stdout.readline, ''):
+                if line:
+                    if line.startswith("[DAEMON] listening"):
+                        self.daemon_listening.set()
+                    self.log(f"[解码器] {line.strip()}")
+            proc.stdout.close()
+            proc.wait()
+        except Exception as e:
+            self.log(f"常驻解码进程监控错误: {e}")
+            
+    def wait_decoder_ready(self, timeout=30.0):
+        """等待解码器输出 [READY]（数据流已连接、预热完成）；进程提前退出或超时则不再等待"""
+        proc = self.decoder_process
+        t0 = time.time()
+        while time.time() - t0 < timeout:
+            if self.decoder_ready.wait(0.1):
+                self.log(f"解码器已就绪 ({time.time() - t0:.1f}s)")
+                return True
+            if proc is None or proc.poll() is not None:
+                self.log("警告: 解码器在就绪前退出")
+                return False
+        self.log(f"警告: 等待解码器就绪超时 ({timeout:.0f}s)，继续运行")
+        return False
+            
     def monitor_decoder(self):
         """监控解码器输出"""
-        if not self.decoder_process:
+        proc = self.decoder_process
+        if not proc:
             return
+        # 记下本进程对应的run信息（批量运行时 current_run_info 会被下一组覆盖）
+        run_info = getattr(self, 'current_run_info', None)
             
         try:
-            for line in iter(self.decoder_process.stdout.readline, ''):
+            for line in iter(proc.stdout.readline, ''):
                 if line:
+                    if line.startswith("[READY]"):
+                        self.decoder_ready.set()
                     self.log(f"[解码器] {line.strip()}")
                     
-            self.decoder_process.stdout.close()
-            self.decoder_process.wait()
+            proc.stdout.close()
+            proc.wait()
             self.log("解码器进程结束")
             
             # 解码器结束后自动运行数据分析
-            if hasattr(self, 'current_run_info'):
-                self.run_analysis_for_current_run()
+            if run_info:
+                self.run_analysis_for_current_run(run_info)
             
         except Exception as e:
             self.log(f"解码器监控错误: {e}")
             
-    def run_analysis_for_current_run(self):
+    def run_analysis_for_current_run(self, run_info=None):
         """为当前run运行数据分析"""
         try:
-            if not hasattr(self, 'current_run_info'):
+            run_info = run_info or getattr(self, 'current_run_info', None)
+            if not run_info:
                 return
                 
-            runname = self.current_run_info['runname']
+            runname = run_info['runname']
             csv_path = os.path.join(self.logdir_var.get(), runname, "latency.csv")
             
             if not os.path.exists(csv_path):
@@ -574,33 +733,36 @@ class BCIRunner:
             self.log("开始自动数据分析...")
             
             # 运行数据分析
+            # 图片交给后台进程渲染（--plots defer），指标写完即可返回
             analysis_cmd = self.create_conda_cmd([
                 "python", "analysis/compute_metrics.py",
                 "--csv", csv_path,
-                "--classes", "10,12,15,20",
-                "--selection_time", "3.0"
+                "--classes", self.get_freqs(),
+                "--selection_time", "3.0",
+                "--plots", "defer",
+                "--catalog", os.path.join(self.logdir_var.get(), "run_catalog.sqlite")
             ])
             
             analysis_process = subprocess.Popen(
                 analysis_cmd,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
-                universal_newlines=True
+                universal_newlines=True,
+                bufsize=1
             )
             
-            # 等待分析完成并显示输出
-            stdout, _ = analysis_process.communicate()
-            if stdout:
-                for line in stdout.split('\n'):
-                    if line.strip():
-                        self.log(f"[分析] {line.strip()}")
+            # 逐行显示输出
+            for line in iter(analysis_process.stdout.readline, ''):
+                if line.strip():
+                    self.log(f"[分析] {line.strip()}")
+            analysis_process.stdout.close()
+            analysis_process.wait()
                         
             if analysis_process.returncode == 0:
                 self.log(f"数据分析完成! 结果保存在: {os.path.dirname(csv_path)}")
                 run_dir = os.path.dirname(csv_path)
                 self.log(f"  - metrics.xlsx: {os.path.join(run_dir, 'metrics.xlsx')}")
-                self.log(f"  - confmat.png: {os.path.join(run_dir, 'confmat.png')}")
-                self.log(f"  - latency_hist.png: {os.path.join(run_dir, 'latency_hist.png')}")
+                self.log(f"  - confmat.png / latency_hist.png / per_freq.png 正在后台生成: {run_dir}")
             else:
                 self.log("数据分析失败")
                 
@@ -676,6 +838,7 @@ class BCIRunner:
         """批量运行线程"""
         try:
             total = len(configs)
+            use_daemon = self.daemon_var.get() and self.start_daemon()
             
             for i, config in enumerate(configs, 1):
                 if self.stop_batch:
@@ -707,10 +870,6 @@ class BCIRunner:
                 timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
                 runname = f"{subject}_{decoder}_{window_str}_v{config['vote']}{channels_str}_{timestamp}"
                 
-                # 启动解码器
-                cmd = self.get_decoder_cmd(config["window"], config["vote"], config["channels"], runname=runname)
-                self.decoder_process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
-                
                 # 保存当前run信息
                 self.current_run_info = {
                     "runname": runname,
@@ -720,18 +879,38 @@ class BCIRunner:
                     "channels": config["channels"]
                 }
                 
-                time.sleep(2)  # 等待解码器启动
+                # 启动解码器，并等待其报告就绪（常驻模式：控制端口切换配置，应答即就绪）
+                if use_daemon:
+                    script, args = self.get_decoder_args(config["window"], config["vote"], config["channels"], runname=runname)
+                    resp = self.daemon_command({"cmd": "start", "decoder": script, "argv": args})
+                    if resp.get("ok"):
+                        self.log(f"解码器已就绪 ({resp['ready_s']:.2f}s, 常驻进程)")
+                    else:
+                        self.log(f"警告: 常驻解码进程启动本组失败: {resp.get('error')}")
+                    self.open_live_panel()
+                else:
+                    cmd = self.get_decoder_cmd(config["window"], config["vote"], config["channels"], runname=runname)
+                    self.decoder_ready.clear()
+                    self.decoder_process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1)
+                    threading.Thread(target=self.monitor_decoder, daemon=True).start()
+                    self.open_live_panel()
+                    self.wait_decoder_ready()
                 
                 # 启动刺激端
-                python_cmd = ["python", "stimulus/ssvep_pygame.py"]
-                stimulus_cmd = self.create_conda_cmd(python_cmd)
+                stimulus_cmd = self.get_stimulus_cmd(runname)
                 self.stimulus_process = subprocess.Popen(stimulus_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
                 
                 # 等待刺激端结束
                 self.stimulus_process.wait()
                 
-                # 停止解码器
-                if self.decoder_process and self.decoder_process.poll() is None:
+                # 停止解码器（常驻模式：在 run 边界结束本组，日志写完后应答，再分析本组数据）
+                if use_daemon and self.daemon_process and self.daemon_process.poll() is None:
+                    resp = self.daemon_command({"cmd": "stop"})
+                    if not resp.get("ok"):
+                        self.log(f"警告: 常驻解码进程结束本组失败: {resp.get('error')}")
+                    run_info = dict(self.current_run_info)
+                    threading.Thread(target=self.run_analysis_for_current_run, args=(run_info,), daemon=True).start()
+                elif self.decoder_process and self.decoder_process.poll() is None:
                     self.decoder_process.terminate()
                     self.decoder_process.wait()
                     
@@ -750,6 +929,7 @@ class BCIRunner:
         except Exception as e:
             self.log(f"批量运行错误: {e}")
         finally:
+            self.stop_daemon()
             self.batch_running = False
             self.stop_batch = False
             self.progress_var.set("")
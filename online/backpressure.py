@@ -0,0 +1,86 @@
+# online/backpressure.py
+import numpy as np
+from collections import deque
+from pylsl import local_clock
+
+class Backpressure:
+    """EEG 入口积压检测与追赶。
+
+    StreamInlet 会把处理不过来的数据默默缓存（max_buflen 秒），解码器随后逐块处理陈旧数据，判决整体滞后。
+    每取一块后估计积压：本块最新样本的时间戳（经 time_correction 换算到本地时钟）距现在多久，
+    与入口中尚未取走的样本数 / fs，取较大者（前者含设备的采集与传输延迟，只用于记录）。
+    max_lag>0 且积压超过它时进入追赶：把入口里剩余的块一次取完、与本块拼接后写入缓冲，只对最新的一个窗解码；
+    入口里确实有积压的块被取走时才记一次追赶，被跳过的块数记为 skipped。
+    """
+    def __init__(self, inlet, fs, max_lag=0.0, tc_interval=5.0):
+        self.inlet, self.fs, self.max_lag, self.tc_interval = inlet, fs, max_lag, tc_interval
+        self.tc = 0.0
+        self.next_tc = 0.0
+        self.chunks = 0
+        self.catchups = 0
+        self.skipped = 0
+        self.drained_samples = 0
+        self.lags = deque(maxlen=100000)
+        self.last_lag = 0.0
+        self.pending_skipped = 0  # 上一条日志行之后跳过的块数
+        self.have_tc = False      # 时钟偏移在第一次估计积压时才取（不阻塞启动），拿到之前按 0 计
+
+    def _refresh_tc(self, timeout=0.0):
+        try:
+            self.tc = float(self.inlet.time_correction(timeout=timeout))
+            self.have_tc = True
+        except Exception:
+            pass  # 时钟偏移暂时拿不到时沿用上一次的值
+        self.next_tc = local_clock() + (self.tc_interval if self.have_tc else 0.5)
+
+    def lag(self, ts_last):
+        """当前积压（秒）"""
+        if local_clock() >= self.next_tc:
+            self._refresh_tc()
+        lag = local_clock() - (float(ts_last) + self.tc)
+        try:
+            lag = max(lag, self.inlet.samples_available() / self.fs)
+        except Exception:
+            pass  # 老版本 pylsl 没有 samples_available
+        return max(0.0, lag)
+
+    def check(self, x, ts):
+        """x: 本块样本 (m, C)，ts: 本块时间戳；返回 (x, ts)，追赶时为拼接了入口剩余数据的块"""
+        ts = np.asarray(ts, dtype=float)
+        lag = self.lag(ts[-1])
+        self.chunks += 1
+        self.lags.append(lag)
+        self.last_lag = lag
+        if self.max_lag > 0 and lag > self.max_lag:
+            xs, tss = [x], [ts]
+            while True:
+                c, t = self.inlet.pull_chunk(timeout=0.0)
+                if not c: break
+                xs.append(np.asarray(c, dtype=x.dtype)); tss.append(np.asarray(t, dtype=float))
+            n_skip = len(xs) - 1
+            if n_skip:  # 积压只来自设备延迟、入口里没有可跳过的数据时不算追赶
+                self.catchups += 1
+                self.skipped += n_skip
+                self.pending_skipped += n_skip
+                x, ts = np.vstack(xs), np.concatenate(tss)
+                self.drained_samples += sum(len(t) for t in tss[1:])
+                print(f"[CATCHUP] lag={lag:.3f}s > {self.max_lag}s: drained {n_skip} chunk(s), decoding the freshest window only")
+        return x, ts
+
+    def row(self):
+        """写日志行用：(本次积压秒数, 上一行之后跳过的块数)"""
+        n, self.pending_skipped = self.pending_skipped, 0
+        return round(self.last_lag, 4), n
+
+    def snapshot(self):
+        lags = np.asarray(self.lags) if self.lags else np.zeros(1)
+        return {
+            "max_lag_s": self.max_lag,
+            "chunks": self.chunks,
+            "catchups": self.catchups,
+            "skipped_chunks": self.skipped,
+            "drained_samples": self.drained_samples,
+            "lag_median_s": round(float(np.median(lags)), 4),
+            "lag_p95_s": round(float(np.percentile(lags, 95)), 4),
+            "lag_max_s": round(float(lags.max()), 4),
+        }
@@ -0,0 +1,71 @@
+# online/channel_qc.py
+import numpy as np
+from common.ssvep_snr import qc_targets, snr_weights
+
+class RollingChannelQC:
+    """解码器内的滚动通道质检：用解码器已缓存的数据估计每通道 SSVEP SNR（指数平滑），
+    并在通道质量变化时给出新的通道子集建议。
+
+    SNR 定义与离线 QC 一致：目标频带 ±bw 内功率 / 邻带 [inner, outer] 功率，按目标权重求和。
+    """
+    def __init__(self, fs, n_ch, freqs, alpha=0.3, min_res=0.25, bw=0.5, inner=0.5, outer=2.0):
+        self.fs = fs
+        self.n_ch = n_ch
+        self.alpha = alpha
+        self.min_res = min_res
+        self.targets = qc_targets(freqs)
+        self.tw = np.array([w for _, w in self.targets])
+        self.bw, self.inner, self.outer = bw, inner, outer
+        self.snr = np.zeros(n_ch)       # 平滑后的每通道分数
+        self.n_updates = 0
+        self._weights = {}              # n -> (窗函数, nfft, W_sig, W_nb)
+
+    def _get_weights(self, n):
+        nfft = max(n, int(np.ceil(self.fs / self.min_res)))  # 补零到至少 min_res Hz 的谱线间隔
+        if n not in self._weights:
+            W_sig, W_nb = snr_weights(self.fs, nfft, self.targets, self.bw, self.inner, self.outer)
+            self._weights[n] = (np.hanning(n), nfft, W_sig, W_nb)
+        return self._weights[n]
+
+    def update(self, x):
+        """x: (n, n_ch) 最近一段原始数据（全部通道，按时间顺序）；返回本次（未平滑的）分数"""
+        x = np.asarray(x, dtype=float)
+        win, nfft, W_sig, W_nb = self._get_weights(x.shape[0])
+        x = x - x.mean(axis=0, keepdims=True)
+        X = np.fft.rfft(x * win[:, None], n=nfft, axis=0)
+        P = X.real**2 + X.imag**2
+        scores = self.tw @ ((W_sig @ P) / np.maximum(W_nb @ P, 1e-12))
+        self.snr = scores if self.n_updates == 0 else self.alpha*scores + (1-self.alpha)*self.snr
+        self.n_updates += 1
+        return scores
+
+    def propose(self, sel, k=0, margin=0.2, min_updates=3):
+        """给出新的通道子集（排序后的列表）；无需更换时返回 None。
+
+        sel 为当前子集（None 表示全部通道）；k>0 时子集大小取 k，否则保持当前大小。
+        只有当子集外最好的通道分数超过子集内最差通道的 (1+margin) 倍时才替换，避免来回抖动。
+        """
+        if self.n_updates < min_updates:
+            return None
+        cur = [c for c in (sel if sel else range(self.n_ch)) if 0 <= c < self.n_ch]
+        k = k if k > 0 else len(cur)
+        if k >= self.n_ch:
+            return None
+        new = sorted(cur, key=lambda c: self.snr[c], reverse=True)[:k]
+        outside = sorted((c for c in range(self.n_ch) if c not in new), key=lambda c: self.snr[c], reverse=True)
+        while len(new) < k and outside:
+            new.append(outside.pop(0))
+        while outside:
+            worst = min(new, key=lambda c: self.snr[c])
+            best = outside[0]
+            if self.snr[best] <= self.snr[worst] * (1.0 + margin):
+                break
+            new.remove(worst); new.append(best)
+            outside.pop(0)
+            outside.append(worst)
+            outside.sort(key=lambda c: self.snr[c], reverse=True)
+        new = sorted(new)
+        return None if sel and new == sorted(sel) else new
+
+    def snapshot(self):
+        return [round(float(v), 4) for v in self.snr]
@@ -0,0 +1,162 @@
+# online/decoder_daemon.py
+# 常驻解码守护进程：启动时解析并连接一次 EEG / Markers 数据流、预先导入各解码器（scipy/sklearn 随之导入），
+# 之后通过本地控制端口接收命令，在同一进程里依次运行不同的解码配置；批量实验不再为每组配置重启解码器。
+#
+# 控制协议：TCP（默认 127.0.0.1:47810），每个连接发送一行 JSON 命令，返回一行 JSON 应答
+#   {"cmd": "start", "decoder": "FBCCA", "argv": ["--window", "1.0", "--runname", "..."]}
+#       结束正在进行的 run（如有），清空入口中积压的旧数据，按 argv 启动新 run，等解码器就绪后应答
+#   {"cmd": "stop"}     结束当前 run（当前窗处理完、meta.json / latency.csv 写完后应答）
+#   {"cmd": "status"}   当前状态
+#   {"cmd": "quit"}     结束当前 run 并退出
+import argparse, contextlib, importlib, io, json, os, socket, socketserver, sys, threading, time
+import jit_kernels
+from lsl_resolve import add_stream_args, open_inlets
+
+DEFAULT_PORT = 47810
+DECODERS = {"CCA+": "online_cca", "CCA": "online_cca", "FBCCA": "online_fbcca", "HYBRID": "online_hybrid", "TRCA": "online_trca"}
+
+def decoder_module(name):
+    """解码器名称（CCA+ / FBCCA / Hybrid / TRCA）或脚本路径 -> 模块"""
+    key = os.path.splitext(os.path.basename(name))[0] if name.endswith(".py") else DECODERS.get(name.upper())
+    if key not in DECODERS.values():
+        raise ValueError(f"unknown decoder: {name}")
+    return importlib.import_module(key)
+
+class Daemon:
+    def __init__(self, inlet_eeg, inlet_mk):
+        self.inlets = (inlet_eeg, inlet_mk)
+        self.lock = threading.Lock()     # 串行处理控制命令
+        self.thread = None
+        self.stop = None
+        self.ready = None
+        self.current = None
+        self.runs = 0
+        self.last_error = None
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def _run(self, mod, args, stop, ready):
+        try:
+            mod.T0 = time.perf_counter()  # 启动统计从本次 run 开始计
+            jit_kernels.disable()         # 模块级开关不继承上一次 run 的设置（解码器按本次 --jit 重新决定）
+            mod.main(args, inlets=self.inlets, stop=stop, ready=ready)
+        except BaseException as e:  # 解码器内部出错只结束本次 run，守护进程继续服务
+            self.last_error = f"{type(e).__name__}: {e}"
+            print(f"[DAEMON] run failed: {self.last_error}", flush=True)
+
+    def stop_run(self, timeout=30.0):
+        if not self.running():
+            return None
+        self.stop.set()
+        self.thread.join(timeout)
+        name = self.current["runname"] if self.current else None
+        if self.thread.is_alive():
+            print(f"[DAEMON] run did not stop within {timeout:.0f}s: {name}", flush=True)
+        else:
+            print(f"[DAEMON] run stopped: {name}", flush=True)
+        return name
+
+    def start_run(self, decoder, argv, ready_timeout=60.0):
+        mod = decoder_module(decoder)
+        err = io.StringIO()
+        try:
+            with contextlib.redirect_stderr(err):
+                args = mod.build_parser().parse_args(argv)
+        except SystemExit:  # argparse 出错时直接退出进程，这里改为返回错误
+            return {"ok": False, "error": f"invalid argv for {decoder}: " + (err.getvalue().strip().splitlines() or ["?"])[-1]}
+        stopped = self.stop_run()
+        if self.running():  # 上一个 run 还没结束：两个解码器会同时读同一组入口、写同一份日志，不启动新 run
+            return {"ok": False, "error": f"previous run {stopped} is still stopping; not starting a new run", "stopped": None}
+        drained = [i.flush() if i is not None else 0 for i in self.inlets]  # 上一组 run 结束后积压的 EEG 与旧 Markers
+        self.stop, self.ready = threading.Event(), threading.Event()
+        self.last_error = None
+        self.current = {"decoder": decoder, "runname": getattr(args, "runname", None), "argv": argv, "started": time.time()}
+        self.thread = threading.Thread(target=self._run, args=(mod, args, self.stop, self.ready), daemon=True, name=f"run-{self.runs}")
+        t0 = time.perf_counter()
+        self.thread.start()
+        self.runs += 1
+        while not self.ready.wait(0.05):
+            if not self.thread.is_alive() or time.perf_counter() - t0 > ready_timeout:
+                return {"ok": False, "error": self.last_error or "decoder not ready", "stopped": stopped}
+        return {"ok": True, "ready": True, "ready_s": round(time.perf_counter() - t0, 3), "stopped": stopped, "flushed": drained}
+
+    def status(self):
+        eeg = self.inlets[0].info()
+        return {"ok": True, "running": self.running(), "current": self.current, "runs": self.runs, "last_error": self.last_error,
+                "eeg": {"name": eeg.name(), "fs": eeg.nominal_srate(), "channels": eeg.channel_count()},
+                "markers": self.inlets[1] is not None}
+
+    def handle(self, req):
+        cmd = req.get("cmd")
+        with self.lock:
+            if cmd == "start":
+                return self.start_run(req["decoder"], [str(a) for a in req.get("argv", [])], float(req.get("ready_timeout", 60.0)))
+            if cmd == "stop":
+                stopped = self.stop_run()
+                if self.running():
+                    return {"ok": False, "error": f"run {stopped} did not stop in time", "stopped": None}
+                return {"ok": True, "stopped": stopped}
+            if cmd == "status":
+                return self.status()
+            if cmd == "quit":
+                return {"ok": True, "stopped": self.stop_run(), "quit": True}
+        return {"ok": False, "error": f"unknown command: {cmd}"}
+
+def send_command(req, host="127.0.0.1", port=DEFAULT_PORT, timeout=90.0):
+    """客户端：发送一条命令并返回应答（GUI / 脚本用）"""
+    with socket.create_connection((host, port), timeout=timeout) as s:
+        s.sendall((json.dumps(req) + "\n").encode("utf-8"))
+        buf = b""
+        while not buf.endswith(b"\n"):
+            part = s.recv(65536)
+            if not part: break
+            buf += part
+    if not buf.strip():
+        return {"ok": False, "error": "no reply from daemon"}
+    return json.loads(buf.decode("utf-8"))
+
+def main():
+    ap = argparse.ArgumentParser(description="long-lived decoder daemon: keeps LSL streams connected and runs decoder configs on request")
+    ap.add_argument("--host", type=str, default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--no-markers", action="store_true", help="不连接 Markers 流")
+    ap.add_argument("--preload", type=str, default="CCA+,FBCCA,Hybrid,TRCA", help="启动时预先导入的解码器")
+    add_stream_args(ap)
+    ap.add_argument("--send", type=str, default=None, help="作为客户端发送一条 JSON 命令后退出，例如 '{\"cmd\": \"status\"}'")
+    args = ap.parse_args()
+
+    if args.send:
+        print(json.dumps(send_command(json.loads(args.send), args.host, args.port), ensure_ascii=False))
+        return
+
+    t0 = time.perf_counter()
+    for name in [n for n in args.preload.split(",") if n.strip()]:
+        decoder_module(name.strip())
+    import scipy.signal, sklearn.cross_decomposition  # noqa: F401,E401
+    inlet_eeg, inlet_mk = open_inlets(args, markers=not args.no_markers)
+    daemon = Daemon(inlet_eeg, inlet_mk)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            line = self.rfile.readline().decode("utf-8").strip()
+            try:
+                resp = daemon.handle(json.loads(line))
+            except (Exception, SystemExit) as e:  # 任何情况下都给客户端一行应答
+                resp = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(resp, ensure_ascii=False) + "\n").encode("utf-8"))
+            if resp.get("quit"):
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    socketserver.TCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer((args.host, args.port), Handler) as server:
+        server.daemon_threads = True
+        print(f"[DAEMON] listening on {args.host}:{args.port} (startup {time.perf_counter() - t0:.2f}s)", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            daemon.stop_run()
+    print("[DAEMON] exit", flush=True)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+# online/jit_kernels.py
+# 可选的 Numba 融合内核：陷波 + 带通（filtfilt）+ 典型相关，一次调用完成 score_one / fbcca_score 的整条计算。
+# 没装 numba 时自动退回同样算法的 NumPy/SciPy 实现（scipy filtfilt + QR/SVD 闭式相关），结果一致。
+import argparse, time, threading
+import importlib.util
+import numpy as np
+from functools import lru_cache
+
+HAVE_NUMBA = importlib.util.find_spec("numba") is not None  # numba 本身较重，到 compile_kernels() 时才导入
+ENABLED = False    # enable() 之后各解码器的 apply_filter / score_one / fbcca_score 走本模块，disable() 恢复原路径
+_COMPILED = False
+_lock = threading.Lock()
+
+# ---- Numba 内核（与 scipy.signal.filtfilt 默认参数相同：奇延拓、padlen=3*max(len(a),len(b))、lfilter_zi 初值） ----
+
+def _lfilter_1d(b, a, zi, x, y):
+    m = len(b) - 1
+    z = zi.copy()
+    for n in range(len(x)):
+        xn = x[n]
+        yn = b[0]*xn + z[0]
+        for k in range(1, m):
+            z[k-1] = b[k]*xn + z[k] - a[k]*yn
+        z[m-1] = b[m]*xn - a[m]*yn
+        y[n] = yn
+
+def _filtfilt_nb(b, a, zi, x, padlen):
+    n, C = x.shape
+    N = n + 2*padlen
+    out = np.empty((n, C))
+    ext = np.empty(N); y = np.empty(N); r = np.empty(N)
+    for c in range(C):
+        x0, x1 = x[0, c], x[n-1, c]
+        for i in range(padlen):
+            ext[i] = 2*x0 - x[padlen-i, c]
+            ext[N-1-i] = 2*x1 - x[n-1-padlen+i, c]
+        for i in range(n):
+            ext[padlen+i] = x[i, c]
+        _lfilter_1d_nb(b, a, zi*ext[0], ext, y)
+        for i in range(N):
+            r[i] = y[N-1-i]
+        _lfilter_1d_nb(b, a, zi*r[0], r, y)
+        for i in range(n):
+            out[i, c] = y[N-1-padlen-i]
+    return out
+
+def _corr_nb(X, Y):
+    Xc = X - X.sum(axis=0) / X.shape[0]
+    Yc = Y - Y.sum(axis=0) / Y.shape[0]
+    Qx, _ = np.linalg.qr(Xc)
+    Qy, _ = np.linalg.qr(Yc)
+    s = np.linalg.svd(np.ascontiguousarray(Qx.T) @ np.ascontiguousarray(Qy))[1]
+    return min(s[0], 1.0)
+
+def _notch_demean_nb(x, b, a, zi, padlen):
+    y = _filtfilt_nb_c(b, a, zi, x, padlen)
+    return y - y.sum(axis=0) / y.shape[0]
+
+def _cca_plus_nb(segf, B, A, Z, Y, weights, padlen):
+    score = 0.0
+    for h in range(B.shape[0]):
+        xf = _filtfilt_nb_c(B[h], A[h], Z[h], segf, padlen)
+        r = _corr_nb_c(xf, np.ascontiguousarray(Y[:, 2*h:2*h+2]))
+        score += weights[h] * max(0.0, r)
+    return score
+
+def _fbcca_nb(seg, B, A, Z, Y, weights, padlen):
+    score = 0.0
+    for k in range(B.shape[0]):
+        xf = _filtfilt_nb_c(B[k], A[k], Z[k], seg, padlen)
+        score += weights[k] * max(0.0, _corr_nb_c(xf, Y))
+    return score
+
+def compile_kernels():
+    """导入 numba 并编译内核（cache=True：首次编译后写入 __pycache__，之后启动只需加载）；返回后端名称"""
+    global _COMPILED, _lfilter_1d_nb, _filtfilt_nb_c, _corr_nb_c, _notch_demean_c, _cca_plus_c, _fbcca_c
+    if not HAVE_NUMBA:
+        return "numpy (numba not installed)"
+    with _lock:
+        import numba
+        if not _COMPILED:
+            jit = numba.njit(cache=True, nogil=True)  # nogil：Hybrid 的两个分支可在线程池里真正并行
+            _lfilter_1d_nb = jit(_lfilter_1d)
+            _filtfilt_nb_c = jit(_filtfilt_nb)
+            _corr_nb_c = jit(_corr_nb)
+            _notch_demean_c = jit(_notch_demean_nb)
+            _cca_plus_c = jit(_cca_plus_nb)
+            _fbcca_c = jit(_fbcca_nb)
+            # 按内核实际使用的参数类型触发编译（二维 C 连续 float64、一维系数）
+            x = np.random.default_rng(0).standard_normal((64, 2)); Y = np.ones((64, 6)); Y[:, 1::2] = np.arange(64)[:, None]
+            b, a, zi = _ba("notch", 50.0, 30.0, 250)
+            _notch_demean_c(x, b, a, zi, 9)
+            B, A, Z = _bank(((8.0, 14.0),), 250)
+            _cca_plus_c(x, B, A, Z, Y, np.ones(1), 27)
+            _fbcca_c(x, B, A, Z, np.ascontiguousarray(Y[:, :2]), np.ones(1), 27)
+            _COMPILED = True
+        return f"numba {numba.__version__}"
+
+# ---- 滤波器组设计（按参数缓存） ----
+
+@lru_cache(maxsize=None)
+def _ba(kind, p1, p2, fs, order=4):
+    from scipy.signal import butter, iirnotch, lfilter_zi
+    if kind == "notch":
+        b, a = iirnotch(w0=p1/(fs/2), Q=p2)
+    else:
+        b, a = butter(order, [p1/(fs/2), p2/(fs/2)], btype='band')
+    return b, a, lfilter_zi(b, a)
+
+@lru_cache(maxsize=None)
+def _bank(key, fs):
+    """key: ((lo, hi), ...) -> (B, A, Z) 堆叠的带通系数"""
+    rows = [_ba("band", lo, hi, fs) for lo, hi in key]
+    return tuple(np.ascontiguousarray(np.stack(v)) for v in zip(*rows))
+
+def _cca_plus_key(f, fs, harmonics=3, bw=3.0):
+    return tuple((max(1.0, h*f - bw/2.0), min(fs/2.0 - 1.0, h*f + bw/2.0)) for h in range(1, harmonics+1))
+
+DTYPE = np.float64  # 内核只按 float64 编译与计算
+
+def check_dtype(dtype):
+    """--jit 与 --dtype float32 不能同时使用：内核按 float64 计算，单精度设置会被悄悄忽略"""
+    if np.dtype(dtype) != DTYPE:
+        raise ValueError(f"--jit kernels compute in float64 only; use --dtype float64 with --jit (got {np.dtype(dtype).name})")
+
+# ---- 对外接口：与解码器中的同名函数语义一致 ----
+
+def notch_demean(seg, fs, notch=50.0):
+    x = np.ascontiguousarray(seg, dtype=np.float64)
+    if notch:
+        b, a, zi = _ba("notch", float(notch), 30.0, fs)
+        if _COMPILED:
+            return _notch_demean_c(x, b, a, zi, 3*len(b)).astype(seg.dtype, copy=False)
+        from scipy.signal import filtfilt
+        x = filtfilt(b, a, x, axis=0)
+    return (x - x.mean(axis=0, keepdims=True)).astype(seg.dtype, copy=False)
+
+def cca_plus_score(segf, fs, f, ref, weights=(1.0, 0.6, 0.4)):
+    """score_one 的融合版本：各谐波窄带滤波 + 与该谐波 sin/cos 的典型相关，加权求和"""
+    B, A, Z = _bank(_cca_plus_key(f, fs, len(weights)), fs)
+    x = np.ascontiguousarray(segf, dtype=np.float64)
+    Y = np.ascontiguousarray(ref, dtype=np.float64)
+    if _COMPILED:
+        return float(_cca_plus_c(x, B, A, Z, Y, np.asarray(weights, dtype=np.float64), 3*B.shape[1]))
+    from scipy.signal import filtfilt
+    from precision import canon_corr
+    return sum(w * max(0.0, canon_corr(filtfilt(B[h], A[h], x, axis=0), Y[:, 2*h:2*h+2])) for h, w in enumerate(weights))
+
+def fbcca_score(seg, fs, ref, fb_bands):
+    """fbcca_score 的融合版本：逐子带带通 + 典型相关，按子带权重求和"""
+    B, A, Z = _bank(tuple((float(lo), float(hi)) for lo, hi, _ in fb_bands), fs)
+    w = np.asarray([w for _, _, w in fb_bands], dtype=np.float64)
+    x = np.ascontiguousarray(seg, dtype=np.float64)
+    Y = np.ascontiguousarray(ref, dtype=np.float64)
+    if _COMPILED:
+        return float(_fbcca_c(x, B, A, Z, Y, w, 3*B.shape[1]))
+    from scipy.signal import filtfilt
+    from precision import canon_corr
+    return sum(wk * max(0.0, canon_corr(filtfilt(B[k], A[k], x, axis=0), Y)) for k, wk in enumerate(w))
+
+def _ref(fs, n, f, harmonics=3):
+    t = np.arange(n) / fs
+    return np.stack([g(2*np.pi*h*f*t) for h in range(1, harmonics+1) for g in (np.sin, np.cos)], axis=1)
+
+def bench(fs, n, n_ch, notch=50.0, fb_bands=((8,14,1.0),(14,20,0.8),(20,26,0.6),(26,32,0.4)), f=10.0, repeat=50):
+    """对比 原始路径（scipy filtfilt + sklearn CCA）与 融合路径 的单目标打分耗时（ms，取中位数）"""
+    from scipy.signal import filtfilt, butter
+    from sklearn.cross_decomposition import CCA
+    seg = np.random.default_rng(0).standard_normal((n, n_ch))
+    ref = _ref(fs, n, f)
+    cca = CCA(n_components=1)
+
+    def orig_cca_plus():
+        b, a = _ba("notch", float(notch), 30.0, fs)[:2]
+        x = filtfilt(b, a, seg, axis=0); x -= x.mean(axis=0)
+        s = 0.0
+        for h, w in zip((1, 2, 3), (1.0, 0.6, 0.4)):
+            lo, hi = max(1.0, h*f - 1.5), min(fs/2.0 - 1.0, h*f + 1.5)
+            bb, aa = butter(4, [lo/(fs/2), hi/(fs/2)], btype='band')
+            xn = filtfilt(bb, aa, x, axis=0)
+            cca.fit(xn, ref[:, 2*(h-1):2*h]); U, V = cca.transform(xn, ref[:, 2*(h-1):2*h])
+            s += w * max(0.0, float(np.corrcoef(U[:, 0], V[:, 0])[0, 1]))
+        return s
+
+    def orig_fbcca():
+        s = 0.0
+        for lo, hi, w in fb_bands:
+            bb, aa = butter(4, [lo/(fs/2), hi/(fs/2)], btype='band')
+            xb = filtfilt(bb, aa, seg, axis=0)
+            cca.fit(xb, ref); U, V = cca.transform(xb, ref)
+            s += w * max(0.0, float(np.corrcoef(U[:, 0], V[:, 0])[0, 1]))
+        return s
+
+    def timed(fn):
+        ts = []
+        for _ in range(repeat):
+            t0 = time.perf_counter(); fn(); ts.append((time.perf_counter() - t0) * 1000)
+        return round(float(np.median(ts)), 4)
+
+    return {
+        "cca_plus_orig_ms": timed(orig_cca_plus),
+        "cca_plus_fused_ms": timed(lambda: cca_plus_score(notch_demean(seg, fs, notch), fs, f, ref)),
+        "fbcca_orig_ms": timed(orig_fbcca),
+        "fbcca_fused_ms": timed(lambda: fbcca_score(notch_demean(seg, fs, notch), fs, ref, fb_bands)),
+    }
+
+def enable(fs, n, n_ch, notch=50.0, fb_bands=None, run_bench=True, repeat=10):
+    """打开融合路径：编译/加载缓存的内核并按实际尺寸预热，可选跑一次对比基准；返回写入 meta 的信息"""
+    global ENABLED
+    fb_bands = fb_bands or ((8,14,1.0),(14,20,0.8),(20,26,0.6),(26,32,0.4))
+    t0 = time.perf_counter()
+    backend = compile_kernels()
+    seg = np.random.default_rng(0).standard_normal((n, max(1, n_ch)))
+    ref = _ref(fs, n, 10.0)
+    segf = notch_demean(seg, fs, notch)
+    cca_plus_score(segf, fs, 10.0, ref)
+    fbcca_score(segf, fs, ref, fb_bands)
+    info = {"backend": backend, "warmup_s": round(time.perf_counter() - t0, 4)}
+    if run_bench:
+        info["bench"] = bench(fs, n, max(1, n_ch), notch, fb_bands, repeat=repeat)
+    ENABLED = True
+    return info
+
+def disable():
+    """关闭融合路径（解码器每次运行开始与结束时调用，常驻进程里上一次 run 的 --jit 不会带到下一次）"""
+    global ENABLED
+    ENABLED = False
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="benchmark fused (Numba) scoring kernels against the original scipy/sklearn path")
+    ap.add_argument("--fs", type=int, default=250)
+    ap.add_argument("--windows", type=str, default="0.5,1.0,2.0", help="窗长（秒，逗号分隔）")
+    ap.add_argument("--chs", type=str, default="4,8,16", help="通道数（逗号分隔）")
+    ap.add_argument("--notch", type=float, default=50.0)
+    ap.add_argument("--repeat", type=int, default=50)
+    args = ap.parse_args()
+    t0 = time.perf_counter()
+    print("backend:", compile_kernels(), f"(compile or load cache: {time.perf_counter() - t0:.2f}s)")
+    print(f"{'window':>7} {'chs':>4} | {'CCA+ orig':>10} {'fused':>8} {'x':>5} | {'FBCCA orig':>10} {'fused':>8} {'x':>5}   (ms per target)")
+    for w in [float(v) for v in args.windows.split(",")]:
+        for c in [int(v) for v in args.chs.split(",")]:
+            r = bench(args.fs, int(w*args.fs), c, args.notch, repeat=args.repeat)
+            print(f"{w:>6.2f}s {c:>4d} | {r['cca_plus_orig_ms']:>10.3f} {r['cca_plus_fused_ms']:>8.3f} {r['cca_plus_orig_ms']/r['cca_plus_fused_ms']:>5.1f} | "
+                  f"{r['fbcca_orig_ms']:>10.3f} {r['fbcca_fused_ms']:>8.3f} {r['fbcca_orig_ms']/r['fbcca_fused_ms']:>5.1f}")
@@ -0,0 +1,218 @@
+# online/lsl_resolve.py
+# LSL 数据流解析与重连：按 type/name/source_id 谓词解析（有超时），缓存上次连接的流以便重启后直接定位，
+# 断流（LostError 或长时间无数据）后自动重连，恢复后把中断区间交给解码循环写进日志。
+import json, os, time
+from datetime import datetime
+from pylsl import StreamInlet
+try:
+    from pylsl import resolve_bypred, LostError
+except ImportError:
+    from pylsl.resolve import resolve_bypred
+    from pylsl.util import LostError
+
+CACHE_TIMEOUT = 1.0   # 缓存的流在线时通常几十毫秒内应答；超过这个时间就按宽松谓词重新找
+GAP_S = 0.25          # 相邻数据块时间戳跳变超过该值（秒）记为一次中断
+
+def xpath_literal(v):
+    """XPath 1.0 字符串字面量：XPath 没有转义，含单引号时改用双引号，两种引号都有时用 concat()"""
+    v = str(v)
+    if "'" not in v:
+        return f"'{v}'"
+    if '"' not in v:
+        return f'"{v}"'
+    return "concat(" + ", \"'\", ".join(f"'{p}'" for p in v.split("'")) + ")"
+
+def predicate(stype, name=None, source_id=None, hostname=None):
+    """XPath 谓词，例如 type='EEG' and name='BrainAmp'（取值按 XPath 字面量加引号，名称里带引号也能解析）"""
+    parts = [f"type={xpath_literal(stype)}"]
+    for k, v in (("name", name), ("source_id", source_id), ("hostname", hostname)):
+        if v:
+            parts.append(f"{k}={xpath_literal(v)}")
+    return " and ".join(parts)
+
+def load_cache(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_cache(path, stype, info):
+    if not path:
+        return
+    cache = load_cache(path)
+    cache[stype] = {"name": info.name(), "source_id": info.source_id(), "hostname": info.hostname(),
+                    "channel_count": info.channel_count(), "nominal_srate": info.nominal_srate(),
+                    "updated": datetime.now().isoformat(timespec="seconds")}
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print("WARN: cannot write stream cache:", e)
+
+def resolve_one(stype, name=None, source_id=None, timeout=30.0, cache=None):
+    """解析一个 type=stype 的流，最多等 timeout 秒；返回 (StreamInfo, 谓词, 来源 cache/resolve) 或 (None, 谓词, None)。
+    缓存里有与 name/source_id 不冲突的记录时，先按它的 source_id + hostname 精确查找。"""
+    t0 = time.perf_counter()
+    c = load_cache(cache).get(stype) if cache else None
+    if c and (not name or name == c["name"]) and (not source_id or source_id == c["source_id"]):
+        pred = predicate(stype, c["name"], c["source_id"], c["hostname"])
+        found = resolve_bypred(pred, 1, min(CACHE_TIMEOUT, timeout))
+        if found:
+            return found[0], pred, "cache"
+    pred = predicate(stype, name, source_id)
+    found = resolve_bypred(pred, 1, max(timeout - (time.perf_counter() - t0), 0.1))
+    if not found:
+        return None, pred, None
+    if len(found) > 1:
+        print(f"WARNING: {len(found)} streams match {pred}: " + ", ".join(f"{i.name()}@{i.hostname()}" for i in found)
+              + f"; using {found[0].name()}@{found[0].hostname()} (select with --eeg_name / --mk_name / --eeg_source_id)")
+    save_cache(cache, stype, found[0])
+    # 以后重连按 source_id（没有则按名称 + 主机）找同一个流
+    return found[0], predicate(stype, found[0].name(), found[0].source_id(), found[0].hostname()), "resolve"
+
+class RecoveringInlet:
+    """StreamInlet 包装：LostError 或超过 idle 秒没有数据时按同一谓词重新解析并重连（每次尝试最多 0.5s，
+    不阻塞解码循环），数据恢复后以时间戳跳变记录中断；pop_gap() 取出最近一次中断供日志标注。其余属性转给内部 inlet。"""
+    def __init__(self, info, pred, max_buflen=360, idle=0.0):
+        self.pred = pred
+        self.max_buflen = max_buflen
+        self.idle = idle
+        self.inlet = StreamInlet(info, max_buflen=max_buflen)
+        self._info = self.inlet.info()
+        self.fs = self._info.nominal_srate()
+        self.last_data = None      # 最近一次收到数据的本地时刻
+        self.last_ts = None        # 最近一个样本的 LSL 时间戳
+        self.lost_reason = None
+        self.next_try = 0.0
+        self.reconnects = 0
+        self.gaps = []
+        self._pending = None
+
+    def __getattr__(self, k):
+        inlet = self.__dict__.get("inlet")
+        if k.startswith("__") or "inlet" not in self.__dict__:
+            raise AttributeError(k)
+        if inlet is None:  # 断流重连期间没有可转发的 inlet
+            raise LostError(f"{self._info.type()} stream '{self._info.name()}' lost ({self.lost_reason}); reconnecting, '{k}' unavailable")
+        return getattr(inlet, k)
+
+    def info(self, timeout=1.0):
+        return self._info
+
+    def _lost(self, reason):
+        if self.lost_reason is None:
+            print(f"[LSL] {self._info.type()} stream '{self._info.name()}' lost ({reason}); reconnecting...", flush=True)
+            self.lost_reason = reason
+            try:
+                self.inlet.close_stream()
+            except Exception:
+                pass
+            self.inlet = None
+
+    def _try_reconnect(self):
+        now = time.perf_counter()
+        if now < self.next_try:
+            return False
+        found = resolve_bypred(self.pred, 1, 0.5)
+        if not found:
+            self.next_try = time.perf_counter() + 0.5
+            return False
+        self.inlet = StreamInlet(found[0], max_buflen=self.max_buflen)
+        self._info = self.inlet.info()
+        self.reconnects += 1
+        self.last_data = time.perf_counter()
+        print(f"[LSL] {self._info.type()} stream '{self._info.name()}' reconnected", flush=True)
+        return True
+
+    def _check(self, ts):
+        """收到数据：与上一块的时间戳比较，跳变即中断（自己重连或 liblsl 内部恢复都会走到这里）"""
+        now = time.perf_counter()
+        if self.last_ts is not None and ts[0] - self.last_ts > GAP_S + (1.0 / self.fs if self.fs > 0 else 0.0):
+            self._pending = {"lsl_from": round(self.last_ts, 4), "lsl_to": round(ts[0], 4), "gap_s": round(ts[0] - self.last_ts, 3),
+                             "reason": self.lost_reason or "timestamp jump", "reconnects": self.reconnects}
+            self.gaps.append(self._pending)
+            print(f"[GAP] {self._info.type()} {self._pending['gap_s']:.2f}s without data ({self._pending['reason']})", flush=True)
+        self.lost_reason = None
+        self.last_ts = ts[-1]
+        self.last_data = now
+
+    def pull_chunk(self, timeout=0.0, max_samples=1024):
+        if self.inlet is None and not self._try_reconnect():
+            time.sleep(timeout)
+            return [], []
+        try:
+            chunk, ts = self.inlet.pull_chunk(timeout=timeout, max_samples=max_samples)
+        except LostError:
+            self._lost("LostError")
+            return [], []
+        now = time.perf_counter()
+        if chunk:
+            self._check(ts)
+        elif self.last_data is None:
+            self.last_data = now   # 从第一次取数开始计无数据时间（不把预热时间算进去）
+        elif self.idle > 0 and now - self.last_data > self.idle:
+            self._lost(f"no data for {now - self.last_data:.1f}s")
+        return chunk, ts
+
+    def pull_sample(self, timeout=0.0):
+        if self.inlet is None and not self._try_reconnect():
+            return None, None
+        try:
+            return self.inlet.pull_sample(timeout=timeout)
+        except LostError:
+            self._lost("LostError")
+            return None, None
+
+    def flush(self):
+        """丢弃入口中积压的数据（常驻进程换 run 时）；之后的第一块数据不算中断"""
+        self.last_ts = self.last_data = None
+        self._pending = None
+        if self.inlet is None:
+            return 0
+        if hasattr(self.inlet, "flush"):
+            return self.inlet.flush()
+        n = 0
+        while True:
+            chunk, _ = self.inlet.pull_chunk(timeout=0.0)
+            if not chunk:
+                return n
+            n += len(chunk)
+
+    def pop_gap(self):
+        g, self._pending = self._pending, None
+        return g
+
+def add_stream_args(ap):
+    """解码器 / 守护进程共用的数据流选择参数"""
+    ap.add_argument("--eeg_name", type=str, default=None, help="按名称选择 EEG 流（网络上有多个 EEG 流时）")
+    ap.add_argument("--eeg_source_id", type=str, default=None, help="按 source_id 选择 EEG 流")
+    ap.add_argument("--mk_name", type=str, default=None, help="按名称选择 Markers 流")
+    ap.add_argument("--resolve_timeout", type=float, default=30.0, help="解析数据流的最长等待（秒）")
+    ap.add_argument("--stream_cache", type=str, default="data/logs/lsl_streams.json", help="上次连接的流信息缓存，空字符串关闭")
+    ap.add_argument("--reconnect", type=float, default=2.0, help="EEG 超过该秒数没有数据即视为断流并自动重连，0=只在 LostError 时重连")
+
+def open_inlets(args, markers=True):
+    """解析 EEG（必需）与 Markers（可选）流并打开重连包装后的 inlet"""
+    t0 = time.perf_counter()
+    print("Resolving EEG stream...")
+    info, pred, how = resolve_one("EEG", args.eeg_name, args.eeg_source_id, args.resolve_timeout, args.stream_cache)
+    if info is None:
+        raise RuntimeError(f"No EEG stream found within {args.resolve_timeout:.0f}s ({pred}).")
+    inlet_eeg = RecoveringInlet(info, pred, max_buflen=5, idle=args.reconnect)
+    print(f"[LSL] EEG '{info.name()}'@{info.hostname()} via {how} in {time.perf_counter() - t0:.2f}s")
+
+    inlet_mk = None
+    if markers:
+        print("Resolving Markers stream...")
+        info, pred, how = resolve_one("Markers", args.mk_name, None, args.resolve_timeout, args.stream_cache)
+        inlet_mk = RecoveringInlet(info, pred) if info is not None else None
+        if inlet_mk is None:
+            print("WARNING: no Markers stream; latency & ground-truth unavailable.")
+    return inlet_eeg, inlet_mk
+
+def gap_row(columns, gap, **fields):
+    """latency.csv 里标注一次中断的行：note=GAP，lsl_pred_time 为恢复时刻，其余按列名填写"""
+    row = dict(fields, lsl_pred_time=gap["lsl_to"], note=f"GAP {gap['gap_s']:.2f}s ({gap['reason']})")
+    return [row.get(c) for c in columns]
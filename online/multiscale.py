@@ -0,0 +1,52 @@
+# online/multiscale.py
+import numpy as np
+
+def parse_scales(spec, window):
+    """'0.5,1.0' -> 比 --window 短的嵌套窗长（秒，升序）；--window 本身始终是最长的一层"""
+    if not spec:
+        return []
+    vals = sorted({round(float(s), 3) for s in spec.split(",") if s.strip()})
+    bad = [v for v in vals if v <= 0 or v > window]
+    if bad:
+        raise SystemExit(f"--multiwin 中的窗长须在 (0, --window={window}] 内: {bad}")
+    return [v for v in vals if v < window]
+
+def rank(scores):
+    """[(f, s), ...] -> (best_f, r1, r2, margin)"""
+    r_sorted = sorted(scores, key=lambda t: t[1], reverse=True)
+    r1 = r_sorted[0][1] if r_sorted else -1
+    r2 = r_sorted[1][1] if len(r_sorted) > 1 else -1
+    return (r_sorted[0][0] if r_sorted else None), r1, r2, r1 - r2
+
+def tail(segf, n):
+    """取同一结束样本的末尾 n 个样本并重新去直流（预处理只在最长窗上做一次）"""
+    x = segf[-n:]
+    return x - x.mean(axis=0, keepdims=True)
+
+class ScaleLock:
+    """多尺度早停：每个窗长各自维护连续一致计数，取满足阈值的最短窗长"""
+    def __init__(self, scales, window):
+        self.scales = list(scales)
+        self.window = window
+        self.decided = {str(s): 0 for s in self.scales + [window]}
+        self.reset()
+
+    def reset(self):
+        self.consec = {}
+
+    def vote(self, L, f):
+        """更新窗长 L 的连续一致计数并返回"""
+        pred, cnt = self.consec.get(L, (None, 0))
+        cnt = cnt + 1 if pred == f else 1
+        self.consec[L] = (f, cnt)
+        return cnt
+
+    def ready(self, L, elapsed, minwin):
+        """短窗只有完全落在 trial 起点之后才参与判定"""
+        return elapsed >= max(minwin, L)
+
+    def record(self, L):
+        self.decided[str(L)] = self.decided.get(str(L), 0) + 1
+
+    def snapshot(self):
+        return {"scales": self.scales + [self.window], "decided": dict(self.decided)}
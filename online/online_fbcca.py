@@ -1,54 +1,77 @@
-import argparse, csv, os, json
+import argparse, csv, os, json, time, threading
+T0 = time.perf_counter()  # 进程启动时刻（用于统计启动耗时 / 首次预测时间）
 import numpy as np
 from collections import deque
 from datetime import datetime
-from pylsl import StreamInlet, local_clock
-try:
-    from pylsl.stream import resolve_stream
-except Exception:
-    from pylsl import resolve_stream
-from scipy.signal import butter, filtfilt, iirnotch
-from sklearn.cross_decomposition import CCA
+from functools import lru_cache
+from pylsl import local_clock
+from channel_qc import RollingChannelQC
+from backpressure import Backpressure
+from lsl_resolve import add_stream_args, open_inlets, gap_row
+from spatial import add_spatial_args, make_spatial
+from score_stream import ScoreOutlet
+from prescreen import spectral_scores, select_targets, PruneStats
+from multiscale import parse_scales, rank, tail, ScaleLock
+from precision import DTYPES, band_sos, notch_sos, sos_filtfilt, cca_corr, SOLVERS, make_cca
+import jit_kernels
+from common import profiling
+from sliding_cca import SlidingFBCCA
 
-def bandpass(x, fs, lo, hi, order=4):
+# scipy / sklearn 较重，延迟到首次使用（或等待数据流时的预热线程）再导入
+
+@lru_cache(maxsize=None)
+def butter_band(lo, hi, fs, order=4):
+    from scipy.signal import butter
     b,a = butter(order, [lo/(fs/2), hi/(fs/2)], btype='band')
+    return b,a
+
+@lru_cache(maxsize=None)
+def notch_coefs(notch, fs, Q=30):
+    from scipy.signal import iirnotch
+    return iirnotch(w0=notch/(fs/2), Q=Q)
+
+def bandpass(x, fs, lo, hi, order=4):
+    if x.dtype == np.float32:
+        return sos_filtfilt(band_sos(lo, hi, fs, order), x)
+    from scipy.signal import filtfilt
+    b,a = butter_band(lo, hi, fs, order=order)
     return filtfilt(b,a,x, axis=0)
 
 def apply_filter(x, fs, notch=50.0):
+    if jit_kernels.ENABLED:
+        return jit_kernels.notch_demean(x, fs, notch)
+    from scipy.signal import filtfilt
     x = x.copy()
     if notch:
-        b,a = iirnotch(w0=notch/(fs/2), Q=30)
-        x = filtfilt(b,a,x, axis=0)
+        if x.dtype == np.float32:
+            x = sos_filtfilt(notch_sos(notch, fs), x)
+        else:
+            b,a = notch_coefs(notch, fs)
+            x = filtfilt(b,a,x, axis=0)
     x -= x.mean(axis=0, keepdims=True)
     return x
 
-def make_ref(fs, n, freqs, harmonics=3):
-    t = np.arange(n)/fs
-    refs={}
-    for f in freqs:
-        cols=[]
-        for h in range(1, harmonics+1):
-            cols += [np.sin(2*np.pi*h*f*t), np.cos(2*np.pi*h*f*t)]
-        refs[f] = np.stack(cols, axis=1)
-    return refs
+def make_ref(fs, n, freqs, harmonics=3, dtype=np.float64):
+    """各频率的 sin/cos 参考。初相位只是每个谐波 sin/cos 平面内的旋转，CCA 相关系数不受影响，因此不区分相位编码"""
+    return {f: make_ref_single(fs, n, f, harmonics, dtype=dtype) for f in freqs}
 
 def fbcca_score(seg, fs, refs_f, cca, fb_bands):
+    if jit_kernels.ENABLED:
+        return jit_kernels.fbcca_score(seg, fs, refs_f, fb_bands)
     scores=[]
     for lo,hi,w in fb_bands:
         segb = bandpass(seg, fs, lo, hi)
-        cca.fit(segb, refs_f)
-        U, V = cca.transform(segb, refs_f)
-        r = np.corrcoef(U[:,0].ravel(), V[:,0].ravel())[0,1]
+        r = cca_corr(cca, segb, refs_f)
         scores.append(max(0.0, float(r)) * w)
     return sum(scores)
 
-def make_ref_single(fs, n, f, harmonics=3):
+def make_ref_single(fs, n, f, harmonics=3, dtype=np.float64):
     """生成单个频率的参考矩阵"""
     t = np.arange(n)/fs
     cols = []
     for h in range(1, harmonics+1):
         cols += [np.sin(2*np.pi*h*f*t), np.cos(2*np.pi*h*f*t)]
-    return np.stack(cols, axis=1)
+    return np.stack(cols, axis=1).astype(dtype, copy=False)
 
 def tune_one_freq_fbcca(seg, fs, f0, cca, fb_bands, delta=0.2, step=0.05):
     """FBCCA频率细调：在f0±delta范围内网格搜索最优频率"""
@@ -56,7 +79,7 @@ def tune_one_freq_fbcca(seg, fs, f0, cca, fb_bands, delta=0.2, step=0.05):
     best, best_s = f0, -1
     n = seg.shape[0]
     for f in cand:
-        R = make_ref_single(fs, n, f, harmonics=3)
+        R = make_ref_single(fs, n, f, harmonics=3, dtype=seg.dtype)
         try:
             sc = fbcca_score(seg, fs, R, cca, fb_bands)
             if sc > best_s:
@@ -65,24 +88,73 @@ def tune_one_freq_fbcca(seg, fs, f0, cca, fb_bands, delta=0.2, step=0.05):
             continue
     return best
 
-def main(args):
-    print("Resolving EEG stream...")
-    eeg_streams = resolve_stream('type','EEG')
-    if not eeg_streams: raise RuntimeError("No EEG stream found.")
-    inlet = StreamInlet(eeg_streams[0], max_buflen=5)
+# filter bank（经验值，可微调；低频权重大）
+FB_BANDS = [
+    (8,14, 1.0),
+    (14,20, 0.8),
+    (20,26, 0.6),
+    (26,32, 0.4),
+]
+
+def prewarm(fs, win, n_ch, freqs, notch, fb_bands, refs=None, cca=None, dtype=np.float64):
+    """预热：导入 scipy/sklearn、生成滤波器设计与参考信号，并用噪声跑一遍完整打分"""
+    if refs is None:
+        refs = make_ref(fs, win, freqs, harmonics=3, dtype=dtype)
+    if cca is None:
+        cca = make_cca()
+    seg = np.random.default_rng(0).standard_normal((win, max(1, n_ch))).astype(dtype)
+    seg = apply_filter(seg, fs, notch=notch)
+    for f in freqs:
+        fbcca_score(seg, fs, refs[f], cca, fb_bands)
+    return refs, cca
+
+def write_meta(run_dir, meta):
+    with open(os.path.join(run_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
 
-    inlet_mk = None
-    if not args.no_markers:
-        print("Resolving Markers stream...")
-        mk_streams = resolve_stream('type','Markers')
-        inlet_mk = StreamInlet(mk_streams[0]) if mk_streams else None
-        if inlet_mk is None:
-            print("WARNING: no Markers stream; latency & ground-truth unavailable.")
+def main(args, inlets=None, stop=None, ready=None):
+    # inlets / stop / ready 由常驻守护进程（decoder_daemon.py）传入：已连接的 (EEG, Markers) 入口、结束本次运行的事件、就绪事件
+    freqs = [float(f) for f in args.freqs.split(",")]
+    if len(set(freqs)) != len(freqs):
+        raise ValueError("--freqs must be unique (targets are identified by frequency)")
+    jit_kernels.disable()  # 融合路径只由本次的 --jit 决定
+    if args.jit:
+        jit_kernels.check_dtype(DTYPES[args.dtype])
+    scales = parse_scales(args.multiwin, args.window)
+    dt = DTYPES[args.dtype]  # 缓冲、参考信号、滤波与打分的计算精度
+    n_sel_hint = len([c for c in args.chs.split(",") if c.strip()]) if args.chs else 4
+    fb_bands = FB_BANDS
+
+    # 等待数据流的同时在后台预热（导入重模块；给定 --fs_hint 时顺带预生成滤波器与参考信号）
+    warm = {}
+    def _warm():
+        try:
+            if args.jit:
+                warm["jit"] = jit_kernels.compile_kernels()  # 编译或从缓存加载 Numba 内核
+            if args.fs_hint > 0:
+                fs_h = int(round(args.fs_hint))
+                warm["fs"] = fs_h
+                warm["refs"], warm["cca"] = prewarm(fs_h, int(args.window * fs_h), n_sel_hint, freqs, args.notch, fb_bands, cca=make_cca(args.cca_solver), dtype=dt)
+            else:
+                warm["cca"] = make_cca(args.cca_solver)
+                import scipy.signal  # noqa: F401
+        except Exception as e:
+            print("WARN: prewarm failed:", e)
+    warm_thread = threading.Thread(target=_warm, daemon=True)
+    warm_thread.start()
+
+    if inlets is not None:
+        inlet, inlet_mk = inlets
+        if args.no_markers: inlet_mk = None
+    else:
+        inlet, inlet_mk = open_inlets(args, markers=not args.no_markers)
 
     fs = int(round(inlet.info().nominal_srate()))
+    bp = Backpressure(inlet, fs, args.max_lag)  # 入口积压检测；给了 --max_lag 时超过即追赶到最新数据
     n_ch = inlet.info().channel_count()
     win = int(args.window * fs)
     print(f"EEG fs={fs} Hz, n_ch={n_ch}, window={args.window}s ({win} samples)")
+    t_resolved = time.perf_counter()
 
     # 创建run目录和文件路径
     method_name = "FBCCA"
@@ -91,22 +163,10 @@ def main(args):
     os.makedirs(run_dir, exist_ok=True)
     latlog_path = args.latlog or os.path.join(run_dir, "latency.csv")
 
-    freqs = [float(f) for f in args.freqs.split(",")]
-    refs = make_ref(fs, win, freqs, harmonics=3)
-    cca = CCA(n_components=1)
-    
     # 频率细调相关
     freq_map = {f: f for f in freqs}  # 原频率 -> 细调后频率
     tuned_freqs_done = set()  # 已完成细调的频率
 
-    # filter bank（经验值，可微调；低频权重大）
-    fb_bands = [
-        (8,14, 1.0),
-        (14,20, 0.8),
-        (20,26, 0.6),
-        (26,32, 0.4),
-    ]
-
     # 通道选择
     sel = None
     if args.auto_chs and (not args.chs):
@@ -119,10 +179,49 @@ def main(args):
     elif args.chs:
         sel = [int(i) for i in args.chs.split(",")]
 
+    # 入口空间滤波：之后缓冲、通道质检与打分都只处理滤波后的各路
+    spf = make_spatial(args, n_ch, sel, dt)
+    if spf is not None:
+        print(f"[SPATIAL] {spf.desc}: {n_ch} -> {spf.n_out} channels at ingest")
+        n_ch, sel = spf.n_out, None
+        if args.hot_chs:
+            print("WARN: --hot_chs needs every channel in the buffer; disabled with --spatial")
+            args.hot_chs = False
+
+    # 预热结果：采样率与 fs_hint 一致时直接复用参考信号；再按真实尺寸跑一遍打分
+    warm_thread.join()
+    jit_info = None
+    if args.jit:
+        if not jit_kernels.HAVE_NUMBA:
+            print("WARN: numba not installed; --jit uses the NumPy fallback of the fused path (pip install numba)")
+        jit_info = jit_kernels.enable(fs, win, len(sel) if sel else n_ch, args.notch, fb_bands)
+        jb = jit_info["bench"]
+        print(f"[JIT] backend={jit_info['backend']} warm-up={jit_info['warmup_s']:.2f}s | per target: "
+              f"CCA+ {jb['cca_plus_orig_ms']:.2f}->{jb['cca_plus_fused_ms']:.2f}ms, FBCCA {jb['fbcca_orig_ms']:.2f}->{jb['fbcca_fused_ms']:.2f}ms")
+    refs = warm.get("refs") if warm.get("fs") == fs else None
+    refs, cca = prewarm(fs, win, len(sel) if sel else n_ch, freqs, args.notch, fb_bands, refs=refs, cca=warm.get("cca") or make_cca(args.cca_solver), dtype=dt)
+    refs_ms = {L: make_ref(fs, int(round(L*fs)), freqs, dtype=dt) for L in scales}  # 嵌套短窗的参考信号
+
     # 缓冲 & 日志
-    buf = np.zeros((win*2, n_ch)); head=0
+    buf = np.zeros((win*2, n_ch), dtype=dt); head=0; n_recv=0
+    refill = False  # 断流恢复后置位：缓冲重新积满一个窗之前不解码
+
+    # 增量模式：因果滤波 + 滑动累加的协方差，每块新数据只更新增量，打分代价与窗长无关
+    inc = None
+    if args.incremental:
+        inc = SlidingFBCCA(fs, len(sel) if sel else n_ch, freqs, win, fb_bands, notch=args.notch, dtype=dt)
+        if args.freq_tune:
+            print("WARN: --freq_tune is ignored in --incremental mode")
+
+    # 滚动通道质检（用该缓冲估计每通道 SNR）；--hot_chs 时在 trial 间隙热切换通道
+    chqc = RollingChannelQC(fs, n_ch, freqs) if args.chqc_interval > 0 else None
+    next_chqc = 0.0
+    prune = PruneStats(args.prescreen, args.prescreen_margin, args.prescreen_audit) if args.prescreen > 0 and not args.incremental else None  # 增量模式一次算全部目标，不需要预筛
+    ms = ScaleLock(scales, args.window) if scales else None
+    in_rest = True
     out = open(latlog_path,"w",newline="",encoding="utf-8"); wr=csv.writer(out)
-    wr.writerow(["lsl_trial_start","lsl_pred_time","latency_sec","true_freq","pred_freq","method","window_s","note","score","r1","r2","margin","early","locked","state"])
+    cols = ["lsl_trial_start","lsl_pred_time","latency_sec","true_freq","pred_freq","method","window_s","note","score","r1","r2","margin","early","locked","state","decide_win","lag_s","skipped"]
+    wr.writerow(cols)
     
     # 保存meta.json
     meta = {
@@ -143,12 +242,35 @@ def main(args):
         "auto_chs": getattr(args, "auto_chs", False),
         "freq_tune": getattr(args, "freq_tune", False),
         "tuned_freqs": freq_map if args.freq_tune else {},
+        "chqc_interval": args.chqc_interval,
+        "hot_chs": args.hot_chs,
+        "hot_k": args.hot_k,
+        "hot_margin": args.hot_margin,
+        "prescreen": args.prescreen,
+        "multiwin": scales,
+        "dtype": args.dtype,
+        "cca_solver": args.cca_solver,
+        "max_lag": args.max_lag,
+        "spatial": spf.describe() if spf is not None else None,
+        "stream_gaps": [],
+        "jit": jit_info,
+        "channel_changes": [],
+        "incremental": args.incremental,
         "timestamp": datetime.now().isoformat(timespec="seconds")
     }
-    with open(os.path.join(run_dir, "meta.json"), "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
+    t_ready = time.perf_counter()
+    meta["startup"] = {
+        "resolve_s": round(t_resolved - T0, 4),
+        "ready_s": round(t_ready - T0, 4),
+        "time_to_first_prediction_s": None,
+    }
+    write_meta(run_dir, meta)
     print(f"[INFO] Run folder: {run_dir}")
     print(f"[INFO] Log CSV   : {latlog_path}")
+    score_out = ScoreOutlet(freqs, method_name) if args.score_stream else None  # 逐窗分数的 LSL 流（实时分数面板）
+    print(f"[READY] decoder ready in {t_ready - T0:.2f}s", flush=True)
+    if ready is not None:
+        ready.set()
 
     # 早停相关初始化
     hist = deque(maxlen=max(1,args.vote))
@@ -159,34 +281,49 @@ def main(args):
     consec_pred = None
     consec_count = 0
 
+    prof = None
     try:
-        while True:
+        prof = profiling.start(args.profile)  # --profile：剖析解码循环，结束时把耗时与内存分配统计写进 run 目录
+        while stop is None or not stop.is_set():
             # markers
             if inlet_mk:
                 while True:
                     m, ts = inlet_mk.pull_sample(timeout=0.0)
                     if m is None: break
                     s=str(m[0])
-                                    if s.startswith("TRIAL_START"):
-                    last_trial_start = ts
-                    trial_locked = False
-                    locked_pred = None
-                    locked_time = None
-                    consec_pred = None
-                    consec_count = 0
-                    parts = s.split("|"); last_true = float(parts[1]) if len(parts)>1 else None
-                elif s.startswith("TRIAL_END"):
-                    trial_locked = False
-                    locked_pred = None
-                    locked_time = None
-                    consec_pred = None
-                    consec_count = 0
-                    last_true = float("nan")  # REST 阶段 ground-truth 为空
+                    if s.startswith("TRIAL_START"):
+                        last_trial_start = ts
+                        in_rest = False
+                        trial_locked = False
+                        locked_pred = None
+                        locked_time = None
+                        consec_pred = None
+                        consec_count = 0
+                        if ms is not None: ms.reset()
+                        parts = s.split("|"); last_true = float(parts[1]) if len(parts)>1 else None
+                    elif s.startswith("TRIAL_END"):
+                        in_rest = True
+                        trial_locked = False
+                        locked_pred = None
+                        locked_time = None
+                        consec_pred = None
+                        consec_count = 0
+                        if ms is not None: ms.reset()
+                        last_true = float("nan")  # REST 阶段 ground-truth 为空
 
             # eeg
             chunk, ts = inlet.pull_chunk(timeout=0.2)
             if not chunk: continue
-            x = np.asarray(chunk); nnew = x.shape[0]
+            gap = inlet.pop_gap()
+            if gap is not None:
+                # 断流恢复：缓冲里的旧数据与新数据不连续，重新积满一个窗再解码；日志记一行 GAP
+                n_recv = 0; refill = True
+                if inc is not None: inc = SlidingFBCCA(fs, len(sel) if sel else n_ch, freqs, win, fb_bands, notch=args.notch, dtype=dt)
+                meta["stream_gaps"].append(gap); write_meta(run_dir, meta)
+                wr.writerow(gap_row(cols, gap, method="FBCCA", window_s=args.window)); out.flush()
+            x, ts = bp.check(np.asarray(chunk, dtype=dt), ts)
+            if spf is not None: x = spf(x)  # 入口空间滤波：缓冲只存滤波后的各路
+            nnew = x.shape[0]
             if nnew >= buf.shape[0]:
                 buf[:] = x[-buf.shape[0]:,:]; head=0
             else:
@@ -197,30 +334,72 @@ def main(args):
                     part = buf.shape[0] - head
                     buf[head:,:] = x[:part,:]; buf[:nnew-part,:] = x[part:,:]
                 head = (head + nnew) % buf.shape[0]
+            n_recv += nnew
+            if inc is not None:
+                inc.update(x[:, sel] if sel else x)
 
-            seg = buf[head-win:head,:] if head>=win else np.vstack([buf[buf.shape[0]-(win-head):,:], buf[:head,:]])
-            if sel: seg = seg[:, sel]
-            seg = apply_filter(seg, fs, notch=args.notch)
-
-            # 频率细调逻辑
-            if args.freq_tune and last_trial_start is not None and last_true is not None and not np.isnan(last_true):
-                if last_true not in tuned_freqs_done:
-                    print(f"Fine-tuning frequency {last_true}Hz...")
-                    tuned_freq = tune_one_freq_fbcca(seg, fs, last_true, cca, fb_bands)
-                    freq_map[last_true] = tuned_freq
-                    tuned_freqs_done.add(last_true)
-                    print(f"Tuned {last_true}Hz -> {tuned_freq:.2f}Hz")
-                    # 更新参考信号
-                    refs[last_true] = make_ref_single(fs, win, tuned_freq, harmonics=3)
-
-            r_scores = []
-            best_f, best_s = None, -1
-            for f in freqs:
-                tuned_f = freq_map.get(f, f)
-                s = fbcca_score(seg, fs, refs[f], cca, fb_bands)
-                r_scores.append((f, s))  # 仍用原频率标识
-                if s > best_s:
-                    best_s, best_f = s, f
+            # 滚动通道质检：缓冲填满后每 chqc_interval 秒更新一次；热切换只在 trial 间隙（或无 Markers 时）进行
+            if chqc is not None and n_recv >= buf.shape[0] and local_clock() >= next_chqc:
+                chqc.update(np.vstack([buf[head:,:], buf[:head,:]]))
+                next_chqc = local_clock() + args.chqc_interval
+                if args.hot_chs and (in_rest or inlet_mk is None):
+                    new_sel = chqc.propose(sel, k=args.hot_k, margin=args.hot_margin)
+                    if new_sel is not None:
+                        snr = chqc.snapshot()
+                        print(f"[CHS] reselect {sel if sel else 'all'} -> {new_sel} snr=" + ",".join(f"{v:.2f}" for v in snr))
+                        meta["channel_changes"].append({"lsl_time": local_clock(), "from": sel, "to": new_sel, "snr": snr})
+                        write_meta(run_dir, meta)
+                        sel = new_sel
+                        if inc is not None:  # 通道变了：重建增量状态，用缓冲中的历史数据预热
+                            inc = SlidingFBCCA(fs, len(sel), freqs, win, fb_bands, notch=args.notch, dtype=dt)
+                            inc.update(np.vstack([buf[head:,:], buf[:head,:]])[:, sel])
+
+            if refill and n_recv < win: continue
+            if inc is not None:
+                sc = inc.scores()
+                r_scores = list(zip(freqs, sc.tolist()))
+                k = int(np.argmax(sc))
+                best_f, best_s = freqs[k], float(sc[k])
+                seg, cand = None, freqs
+            else:
+                seg = buf[head-win:head,:] if head>=win else np.vstack([buf[buf.shape[0]-(win-head):,:], buf[:head,:]])
+                if sel: seg = seg[:, sel]
+                seg = apply_filter(seg, fs, notch=args.notch)
+
+                # 频率细调逻辑
+                if args.freq_tune and last_trial_start is not None and last_true is not None and not np.isnan(last_true):
+                    if last_true not in tuned_freqs_done:
+                        print(f"Fine-tuning frequency {last_true}Hz...")
+                        tuned_freq = tune_one_freq_fbcca(seg, fs, last_true, cca, fb_bands)
+                        freq_map[last_true] = tuned_freq
+                        tuned_freqs_done.add(last_true)
+                        print(f"Tuned {last_true}Hz -> {tuned_freq:.2f}Hz")
+                        # 更新参考信号
+                        refs[last_true] = make_ref_single(fs, win, tuned_freq, harmonics=3, dtype=dt)
+                        for L in scales:
+                            refs_ms[L][last_true] = make_ref_single(fs, int(round(L*fs)), tuned_freq, harmonics=3, dtype=dt)
+
+                cand = freqs
+                if prune is not None:  # 谐波功率预筛，只对候选目标做完整打分
+                    ps = spectral_scores(seg, fs, [freq_map.get(f, f) for f in freqs])
+                    cand = [freqs[i] for i in select_targets(ps, args.prescreen, args.prescreen_margin)]
+                r_scores = []
+                best_f, best_s = None, -1
+                for f in cand:
+                    tuned_f = freq_map.get(f, f)
+                    s = fbcca_score(seg, fs, refs[f], cca, fb_bands)
+                    r_scores.append((f, s))  # 仍用原频率标识
+                    if s > best_s:
+                        best_s, best_f = s, f
+                if prune is not None:
+                    changed = None
+                    if prune.want_audit():
+                        rest = [(f, fbcca_score(seg, fs, refs[f], cca, fb_bands)) for f in freqs if f not in cand]
+                        full_best = max(r_scores + rest, key=lambda t: t[1])[0]
+                        changed = full_best != best_f
+                        if changed:
+                            print(f"[PRESCREEN] pruned decision {best_f}Hz != full {full_best}Hz (kept {len(cand)}/{len(freqs)})")
+                    prune.record(len(cand), len(freqs), changed)
 
             pred_time = local_clock()
 
@@ -244,8 +423,28 @@ def main(args):
                 pred_f = max(set(hist), key=hist.count) if len(hist)==hist.maxlen else best_f
 
             early = False
+            decide_win = args.window
             if not state == "IDLE" and args.earlystop and (inlet_mk is not None) and (last_trial_start is not None) and (not trial_locked):
                 elapsed = pred_time - last_trial_start
+                # 多尺度：与主窗同一结束样本的嵌套短窗，从最短的起，取第一个满足阈值的窗长
+                if ms is not None:
+                    if seg is None:  # 增量模式下主窗不经过 seg，多尺度判定时再取一次
+                        seg = buf[head-win:head,:] if head>=win else np.vstack([buf[buf.shape[0]-(win-head):,:], buf[:head,:]])
+                        if sel: seg = seg[:, sel]
+                        seg = apply_filter(seg, fs, notch=args.notch)
+                    for L in ms.scales:
+                        if not ms.ready(L, elapsed, args.minwin): break
+                        sub = tail(seg, int(round(L*fs)))
+                        f_L, r1_L, r2_L, m_L = rank([(f, fbcca_score(sub, fs, refs_ms[L][f], cca, fb_bands)) for f in cand])
+                        if ms.vote(L, f_L) >= args.patience and r1_L >= args.rmin and m_L >= args.margin:
+                            trial_locked = True
+                            locked_pred = f_L
+                            locked_time = pred_time
+                            early = True
+                            decide_win = L
+                            best_f = pred_f = f_L
+                            best_s, r1, r2, margin = r1_L, r1_L, r2_L, m_L
+                            break
                 # 连续一致计数
                 if consec_pred is None or consec_pred != best_f:
                     consec_pred = best_f
@@ -253,11 +452,14 @@ def main(args):
                 else:
                     consec_count += 1
                 # 判定是否早停
-                if (elapsed >= args.minwin) and (r1 >= args.rmin) and (margin >= args.margin) and (consec_count >= args.patience):
+                if (not trial_locked) and (elapsed >= args.minwin) and (r1 >= args.rmin) and (margin >= args.margin) and (consec_count >= args.patience):
                     trial_locked = True
                     locked_pred = best_f
                     locked_time = pred_time
                     early = True
+                if early and ms is not None:
+                    ms.record(decide_win)
+                    print(f"[MULTIWIN] locked {locked_pred}Hz by {decide_win}s window (elapsed={elapsed:.3f}s)")
 
             # 若已锁定，本trial内忽略后续窗（但仍可记录日志行，note标记为LOCKED）
             note_flags = []
@@ -268,7 +470,7 @@ def main(args):
             
             base_note = ""
             if last_true is not None and not np.isnan(last_true):
-                base_note = "CORRECT" if abs(pred_f - last_true) < 1e-6 else "WRONG"
+                base_note = "CORRECT" if pred_f is not None and abs(pred_f - last_true) < 1e-6 else "WRONG"
             
             if base_note and note_flags:
                 note = base_note + "|" + "|".join(note_flags)
@@ -279,14 +481,40 @@ def main(args):
 
             pred_str = f"{pred_f:.1f}Hz" if pred_f is not None else "IDLE"
             print(f"[{pred_time:.3f}] Pred={pred_str} (score={best_s:.3f}) True={last_true}Hz Lat={lat:.3f}s {note} State={state}")
-            wr.writerow([last_trial_start, pred_time, lat, last_true, pred_f, "FBCCA", args.window, note, best_s, r1, r2, margin, early, trial_locked, state]); out.flush()
+            if score_out is not None:
+                score_out.push(r_scores, r1, margin, state, pred_f, pred_time)
+            wr.writerow([last_trial_start, pred_time, lat, last_true, pred_f, "FBCCA", args.window, note, best_s, r1, r2, margin, early, trial_locked, state, decide_win, *bp.row()]); out.flush()
+
+            if meta["startup"]["time_to_first_prediction_s"] is None:
+                meta["startup"]["time_to_first_prediction_s"] = round(time.perf_counter() - T0, 4)
+                write_meta(run_dir, meta)
 
     except KeyboardInterrupt:
         print("Stopping...")
     finally:
         out.close()
+        meta["backpressure"] = bp.snapshot()
+        print(f"[BACKPRESSURE] {meta['backpressure']}")
+        write_meta(run_dir, meta)
+        if chqc is not None:
+            meta["channel_snr"] = chqc.snapshot()
+            meta["chs_final"] = sel
+            write_meta(run_dir, meta)
+        if ms is not None:
+            meta["multiwin_stats"] = ms.snapshot()
+            print(f"[MULTIWIN] {meta['multiwin_stats']}")
+            write_meta(run_dir, meta)
+        if prune is not None:
+            meta["prescreen_stats"] = prune.snapshot()
+            print(f"[PRESCREEN] {meta['prescreen_stats']}")
+            write_meta(run_dir, meta)
+        jit_kernels.disable()
+        if prof is not None:
+            meta["profile"] = prof.stop(run_dir)
+            print(f"[PROFILE] {meta['profile']['mode']}: " + ", ".join(meta["profile"]["files"]) + f" -> {run_dir}")
+            write_meta(run_dir, meta)
 
-if __name__ == "__main__":
+def build_parser():
     ap = argparse.ArgumentParser()
     ap.add_argument("--window", type=float, default=1.5)
     ap.add_argument("--freqs", type=str, default="10,12,15,20")
@@ -307,5 +535,25 @@ if __name__ == "__main__":
     ap.add_argument("--idle_margin", type=float, default=0.12, help="IDLE门控的(r1-r2)阈值")
     ap.add_argument("--auto_chs", action="store_true", help="从 data/logs/qc/selected_chs.txt 自动选通道")
     ap.add_argument("--freq_tune", action="store_true", help="启用频率细调（每个目标±0.2Hz内网格搜索）")
-    args = ap.parse_args()
-    main(args)
\ No newline at end of file
+    ap.add_argument("--fs_hint", type=float, default=0.0, help="预期EEG采样率；给定时在等待数据流期间预生成滤波器与参考信号")
+    ap.add_argument("--incremental", action="store_true", help="增量滑动协方差打分（因果滤波；高跳窗率/长窗/多通道时使用）")
+    ap.add_argument("--chqc_interval", type=float, default=2.0, help="滚动通道质检的更新间隔（秒），<=0 关闭")
+    ap.add_argument("--hot_chs", action="store_true", help="根据滚动通道 SNR 在 trial 间隙热切换通道子集")
+    ap.add_argument("--hot_k", type=int, default=0, help="热切换时的通道数；0=保持当前子集大小")
+    ap.add_argument("--hot_margin", type=float, default=0.2, help="候选通道 SNR 需超过子集内最差通道的 (1+margin) 倍才替换")
+    ap.add_argument("--prescreen", type=int, default=0, help="谐波功率预筛：只对功率前 k 的目标做完整打分（0=关闭）")
+    ap.add_argument("--prescreen_margin", type=float, default=0.2, help="预筛安全余量：功率不低于第 k 名 (1-margin) 倍的目标也保留")
+    ap.add_argument("--prescreen_audit", type=int, default=20, help="每 N 个窗对全部目标打分一次，统计剪枝改变判决的比例（0=不审计）")
+    ap.add_argument("--multiwin", type=str, default="", help="早停用的嵌套短窗长（秒，逗号分隔，如 0.5,1.0），与 --window 同一结束样本；取满足阈值的最短窗")
+    ap.add_argument("--jit", action="store_true", help="打分走融合内核（陷波+带通+典型相关；装了 numba 时编译执行，否则用等价的 NumPy 实现），启动时预热并输出基准对比")
+    ap.add_argument("--score_stream", action="store_true", help="把每窗各目标分数、r1/margin、IDLE/CONTROL 状态发布为 LSL 流 SSVEPScores（gui/live_scores.py 显示）")
+    ap.add_argument("--max_lag", type=float, default=0.0, help="入口积压超过该值（秒）时进入追赶：取完积压数据，只解码最新的窗（默认 0：只记录积压不追赶）")
+    add_stream_args(ap)
+    add_spatial_args(ap)
+    profiling.add_profile_args(ap)
+    ap.add_argument("--dtype", choices=["float64", "float32"], default="float64", help="计算精度：float32 时缓冲/参考信号/滤波用单精度（滤波改用 SOS）；典型相关的精度见 --cca_solver")
+    ap.add_argument("--cca_solver", choices=SOLVERS, default="sklearn", help="典型相关求解：sklearn=迭代 CCA（内部 float64）；closed=闭式解 QR+SVD（精度跟随 --dtype）")
+    return ap
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())
\ No newline at end of file
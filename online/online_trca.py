@@ -0,0 +1,532 @@
+import argparse, csv, os, json, time, threading
+T0 = time.perf_counter()  # 进程启动时刻（用于统计启动耗时 / 首次预测时间）
+import numpy as np
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from pylsl import local_clock
+from channel_qc import RollingChannelQC
+from backpressure import Backpressure
+from lsl_resolve import add_stream_args, open_inlets, gap_row
+from spatial import add_spatial_args, make_spatial
+from score_stream import ScoreOutlet
+from template_store import TemplateStore
+from precision import DTYPES, band_sos, notch_sos, sos_filtfilt
+
+# scipy 较重，延迟到首次使用（或等待数据流时的预热线程）再导入
+
+@lru_cache(maxsize=None)
+def butter_band(lo, hi, fs, order=4):
+    from scipy.signal import butter
+    b,a = butter(order, [lo/(fs/2), hi/(fs/2)], btype='band')
+    return b,a
+
+@lru_cache(maxsize=None)
+def notch_coefs(notch, fs, Q=30):
+    from scipy.signal import iirnotch
+    return iirnotch(w0=notch/(fs/2), Q=Q)
+
+def bandpass(x, fs, lo, hi, order=4):
+    if x.dtype == np.float32:
+        return sos_filtfilt(band_sos(lo, hi, fs, order), x)
+    from scipy.signal import filtfilt
+    b,a = butter_band(lo, hi, fs, order=order)
+    return filtfilt(b,a,x, axis=0)
+
+def apply_filter(x, fs, notch=50.0):
+    from scipy.signal import filtfilt
+    x = x.copy()
+    if notch:
+        if x.dtype == np.float32:
+            x = sos_filtfilt(notch_sos(notch, fs), x)
+        else:
+            b,a = notch_coefs(notch, fs)
+            x = filtfilt(b,a,x, axis=0)
+    x -= x.mean(axis=0, keepdims=True)
+    return x
+
+# filter bank（Nakanishi 等的 FB-TRCA：第 m 个子带 [8m, 88] Hz，权重 m^-1.25 + 0.25）
+N_BANDS = 5
+
+def trca_bands(fs, n_bands=N_BANDS):
+    hi = min(88.0, fs/2.0 - 1.0)
+    return [(8.0*m, hi, m**-1.25 + 0.25) for m in range(1, n_bands+1) if 8.0*m < hi]
+
+def fb_filter(x, fs, notch, bands, pad):
+    """陷波+去直流后逐子带带通，丢掉前面 pad 个样本（只用于减小滤波边缘效应）；返回 (n_bands, n, C)"""
+    x = apply_filter(x, fs, notch=notch)
+    return np.stack([bandpass(x, fs, lo, hi)[pad:] for lo, hi, _ in bands])
+
+def trca_filter(X):
+    """X: (n_trials, n, C) 同一目标的多次试次；返回使试次间协方差最大的空间滤波器 (C,)"""
+    from scipy.linalg import eigh
+    X = X - X.mean(axis=1, keepdims=True)
+    Xs = X.sum(axis=0)
+    S = Xs.T @ Xs - np.einsum('tnc,tnd->cd', X, X)
+    Xc = X.reshape(-1, X.shape[2])
+    Q = Xc.T @ Xc
+    Q += 1e-9 * np.trace(Q) / len(Q) * np.eye(len(Q))
+    _, vecs = eigh(S, Q)
+    return vecs[:, -1]
+
+def fit_trca(epochs, freqs):
+    """epochs: {f: [ (n_bands, n, C), ... ]}；返回模板 T (n_bands, K, n, C) 与集成滤波器 W (n_bands, C, K)"""
+    E = [np.stack(epochs[f]).astype(np.float64) for f in freqs]  # K × (n_trials, n_bands, n, C)；标定求解一律用双精度
+    n_bands = E[0].shape[1]
+    T = np.stack([e.mean(axis=0) for e in E], axis=1)    # (n_bands, K, n, C)
+    W = np.stack([np.stack([trca_filter(e[:, b]) for e in E], axis=1) for b in range(n_bands)])
+    return T, W
+
+def trca_scores(xb, T, W, offset, weights):
+    """xb: (n_bands, L, C) 测试窗，offset 为窗起点相对试次起点的样本数；返回各目标的 FB-TRCA 分数 (K,)"""
+    L = xb.shape[1]
+    rho = np.zeros(T.shape[1])
+    for b, w in enumerate(weights):
+        XW = (xb[b] @ W[b]).ravel()                               # (L*K,)
+        TW = (T[b, :, offset:offset+L] @ W[b]).reshape(T.shape[1], -1)  # (K, L*K)
+        XW = XW - XW.mean()
+        TW = TW - TW.mean(axis=1, keepdims=True)
+        r = (TW @ XW) / np.maximum(np.linalg.norm(TW, axis=1) * np.linalg.norm(XW), 1e-12)
+        rho += w * np.sign(r) * r**2
+    return rho
+
+def save_model(path, T, W, freqs, fs, chs, epoch_s, delay):
+    np.savez(path, T=T, W=W, freqs=np.asarray(freqs), fs=fs, chs=np.asarray(chs if chs else [], dtype=int), epoch_s=epoch_s, delay=delay)
+
+def load_model(path):
+    d = np.load(path)
+    return {k: d[k] for k in d.files}
+
+def band_spec(bands):
+    """子带设置的可记录形式（meta.json / 模板 info.json 共用）"""
+    return [[lo, hi, round(w, 4)] for lo, hi, w in bands]
+
+def template_mismatch(info, n_stored, ep_n, delay, notch, bands):
+    """模板库中的模板与当前设置不一致之处（为空时可直接复用）；info 中缺失的字段按不一致处理"""
+    diff = []
+    if n_stored != ep_n:
+        diff.append(f"epoch {n_stored} samples (--epoch needs {ep_n})")
+    if info.get("delay_s") is None or abs(float(info["delay_s"]) - delay) > 1e-9:
+        diff.append(f"delay {info.get('delay_s')}s (--delay {delay})")
+    if "notch" not in info or info["notch"] != notch:
+        diff.append(f"notch {info.get('notch', 'unknown')} (--notch {notch})")
+    if info.get("bands") != band_spec(bands):
+        diff.append("different filter-bank bands")
+    return diff
+
+def prewarm(fs, n, n_ch, notch, bands, dtype=np.float64):
+    """预热：导入 scipy、生成各子带滤波器设计，并用噪声跑一遍滤波与 TRCA 求解"""
+    pad = int(0.2*fs)
+    X = np.stack([fb_filter(np.random.default_rng(i).standard_normal((n+pad, max(1, n_ch))).astype(dtype), fs, notch, bands, pad) for i in range(2)])
+    trca_filter(X[:, 0])
+
+def write_meta(run_dir, meta):
+    with open(os.path.join(run_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+def main(args, inlets=None, stop=None, ready=None):
+    # inlets / stop / ready 由常驻守护进程（decoder_daemon.py）传入：已连接的 (EEG, Markers) 入口、结束本次运行的事件、就绪事件
+    freqs = [float(f) for f in args.freqs.split(",")]
+    if len(set(freqs)) != len(freqs):
+        raise ValueError("--freqs must be unique (targets are identified by frequency)")
+    if args.window > args.epoch:
+        raise ValueError("--window must not exceed --epoch (templates are --epoch seconds long)")
+    dt = DTYPES[args.dtype]  # 缓冲、滤波与打分的计算精度（标定求解始终为双精度）
+    n_sel_hint = len([c for c in args.chs.split(",") if c.strip()]) if args.chs else 4
+
+    # 等待数据流的同时在后台预热（导入重模块；给定 --fs_hint 时顺带预生成滤波器设计）
+    def _warm():
+        try:
+            if args.fs_hint > 0:
+                fs_h = int(round(args.fs_hint))
+                prewarm(fs_h, int(args.epoch * fs_h), n_sel_hint, args.notch, trca_bands(fs_h), dtype=dt)
+            else:
+                import scipy.signal, scipy.linalg  # noqa: F401
+        except Exception as e:
+            print("WARN: prewarm failed:", e)
+    warm_thread = threading.Thread(target=_warm, daemon=True)
+    warm_thread.start()
+
+    if inlets is not None:
+        inlet, inlet_mk = inlets
+        if inlet_mk is None: raise RuntimeError("TRCA needs the Markers stream (trial onsets).")
+    else:
+        # TRCA 的模板与试次起点锁相，标定与解码都依赖 TRIAL_START 标记
+        inlet, inlet_mk = open_inlets(args)
+        if inlet_mk is None: raise RuntimeError("TRCA needs the Markers stream (trial onsets).")
+
+    fs = int(round(inlet.info().nominal_srate()))
+    bp = Backpressure(inlet, fs, args.max_lag)  # 入口积压检测；给了 --max_lag 时超过即追赶到最新数据
+    n_ch = inlet.info().channel_count()
+    win = int(args.window * fs)
+    ep_n = int(args.epoch * fs)
+    min_n = max(int(args.min_len * fs), 1)
+    pad = int(0.2 * fs)
+    bands = trca_bands(fs)
+    weights = [w for _, _, w in bands]
+    print(f"EEG fs={fs} Hz, n_ch={n_ch}, window={args.window}s ({win} samples), epoch={args.epoch}s, delay={args.delay}s")
+    t_resolved = time.perf_counter()
+
+    # 创建run目录和文件路径
+    method_name = "TRCA"
+    runname = args.runname or f"{method_name}_w{args.window:.1f}_v{getattr(args,'vote',1)}_{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+    run_dir = os.path.join(args.outdir, runname)
+    os.makedirs(run_dir, exist_ok=True)
+    latlog_path = args.latlog or os.path.join(run_dir, "latency.csv")
+
+    # 通道选择
+    sel = None
+    if args.auto_chs and (not args.chs):
+        try:
+            txt = open(r"data/logs/qc/selected_chs.txt","r",encoding="utf-8").read().strip()
+            sel = [int(x) for x in txt.split(",") if x.strip()!=""]
+            print("Auto channels from QC:", sel)
+        except Exception:
+            print("WARN: auto_chs enabled but selected_chs.txt not found; fallback to all channels.")
+    elif args.chs:
+        sel = [int(i) for i in args.chs.split(",")]
+
+    # 模板库：给定 --subject 时按 被试/电极布局/采样率/目标集 查找已有模板（默认取最新版本）
+    store = TemplateStore(args.store) if args.subject else None
+    store_key = None
+    if store is not None:
+        montage = f"{args.montage or f'{n_ch}ch'}_" + ("ch" + "-".join(map(str, sel)) if sel else "all")
+        if args.spatial != "none":  # 空间滤波后的模板不能与未滤波的混用
+            montage += "_" + (os.path.splitext(os.path.basename(args.spatial_matrix or ""))[0] if args.spatial == "matrix" else args.spatial)
+        store_key = TemplateStore.key(args.subject, montage, fs, freqs)
+    template = {"store": args.store if store else None, "key": store_key, "version": None, "source": None}
+
+    # 模型：--model 直接加载 / 模板库已有则复用，否则先用前 calib_trials 个/目标 的试次做标定
+    T = W = None
+    if args.model:
+        mdl = load_model(args.model)
+        if int(mdl["fs"]) != fs or [float(f) for f in mdl["freqs"]] != freqs:
+            raise ValueError(f"model {args.model} was fitted for fs={int(mdl['fs'])}, freqs={mdl['freqs'].tolist()}")
+        if int(mdl["T"].shape[2]) != ep_n:
+            raise ValueError(f"model epoch length {mdl['T'].shape[2]} samples != --epoch {ep_n} samples")
+        if mdl["chs"].size:
+            sel = [int(c) for c in mdl["chs"]]
+        T, W = mdl["T"], mdl["W"]
+        print(f"[TRCA] loaded model {args.model} (chs={sel if sel else 'all'})")
+        template["source"] = "model"
+    elif store is not None and not args.recalibrate:
+        arrays, info = store.load(store_key, args.template_version)
+        if arrays is None:
+            if args.template_version is not None:
+                raise ValueError(f"template version {args.template_version} not found for {store_key}")
+            print(f"[TRCA] no stored templates for {store_key}; calibrating")
+        else:
+            diff = template_mismatch(info, arrays["T"].shape[2], ep_n, args.delay, args.notch, bands)
+            if diff:
+                print(f"WARN: stored templates v{info['version']} do not match this session ({'; '.join(diff)}); calibrating")
+            else:
+                T, W = arrays["T"], arrays["W"]
+                template.update({"version": info["version"], "source": "store", "path": info["path"],
+                                 "created": info.get("created"), "load_ms": info["load_ms"]})
+                print(f"[TRCA] templates {store_key} v{info['version']:03d} loaded in {info['load_ms']:.1f} ms")
+
+    # 入口空间滤波：之后缓冲与模板匹配只处理滤波后的各路（模型/模板仍记录原始通道 chs）
+    chs = sel
+    spf = make_spatial(args, n_ch, sel, dt)
+    if spf is not None:
+        print(f"[SPATIAL] {spf.desc}: {n_ch} -> {spf.n_out} channels at ingest")
+        n_ch, sel = spf.n_out, None
+
+    warm_thread.join()
+    prewarm(fs, ep_n, len(sel) if sel else n_ch, args.notch, bands, dtype=dt)
+    if T is not None:
+        T, W = T.astype(dt, copy=False), W.astype(dt, copy=False)
+
+    # 缓冲（带时间戳，足够容纳一个完整标定段 + 滤波前导 + 到达延迟）
+    H = max(2*win, ep_n + pad + int((args.delay + 1.5) * fs))
+    buf = np.zeros((H, n_ch), dtype=dt); tbuf = np.full(H, -np.inf); head=0; n_recv=0
+
+    # 滚动通道质检（只记录；模板与通道绑定，TRCA 不做热切换）
+    chqc = RollingChannelQC(fs, n_ch, freqs) if args.chqc_interval > 0 else None
+    next_chqc = 0.0
+    out = open(latlog_path,"w",newline="",encoding="utf-8"); wr=csv.writer(out)
+    cols = ["lsl_trial_start","lsl_pred_time","latency_sec","true_freq","pred_freq","method","window_s","note","score","r1","r2","margin","early","locked","state","lag_s","skipped"]
+    wr.writerow(cols)
+
+    # 保存meta.json
+    meta = {
+        "method": method_name,
+        "window_s": args.window,
+        "freqs": args.freqs,
+        "notch": args.notch,
+        "vote": getattr(args, "vote", None),
+        "chs": getattr(args, "chs", None),
+        "earlystop": getattr(args, "earlystop", False),
+        "rmin": getattr(args, "rmin", None),
+        "margin": getattr(args, "margin", None),
+        "patience": getattr(args, "patience", None),
+        "minwin": getattr(args, "minwin", None),
+        "idle": getattr(args, "idle", False),
+        "idle_rmin": getattr(args, "idle_rmin", None),
+        "idle_margin": getattr(args, "idle_margin", None),
+        "auto_chs": getattr(args, "auto_chs", False),
+        "chqc_interval": args.chqc_interval,
+        "epoch_s": args.epoch,
+        "delay_s": args.delay,
+        "min_len_s": args.min_len,
+        "bands": band_spec(bands),
+        "calibration": {"model": args.model, "trials_per_target": args.calib_trials if T is None else None},
+        "subject": args.subject,
+        "template": template,
+        "dtype": args.dtype,
+        "max_lag": args.max_lag,
+        "spatial": spf.describe() if spf is not None else None,
+        "stream_gaps": [],
+        "timestamp": datetime.now().isoformat(timespec="seconds")
+    }
+    t_ready = time.perf_counter()
+    meta["startup"] = {
+        "resolve_s": round(t_resolved - T0, 4),
+        "ready_s": round(t_ready - T0, 4),
+        "time_to_first_prediction_s": None,
+    }
+    write_meta(run_dir, meta)
+    print(f"[INFO] Run folder: {run_dir}")
+    print(f"[INFO] Log CSV   : {latlog_path}")
+    if T is None:
+        print(f"[TRCA] calibration: first {args.calib_trials} trial(s) per target are used for training")
+    score_out = ScoreOutlet(freqs, method_name) if args.score_stream else None  # 逐窗分数的 LSL 流（实时分数面板）
+    print(f"[READY] decoder ready in {t_ready - T0:.2f}s", flush=True)
+    if ready is not None:
+        ready.set()
+
+    # 标定
+    epochs = {f: [] for f in freqs}
+    pending = []  # 等待数据到齐的标定试次 (onset, freq)
+    calib_onset = None
+
+    # 早停相关初始化
+    hist = deque(maxlen=max(1,args.vote))
+    last_trial_start=None; last_true=None
+    trial_true = None      # 当前锁相段所属试次的真值（TRIAL_END 之后段内剩余数据仍属于该试次）
+    last_end_n = None      # 上一次预测所用窗的终点（样本计数），避免同一窗重复打分
+    trial_locked = False
+    locked_pred = None
+    locked_time = None
+    consec_pred = None
+    consec_count = 0
+
+    try:
+        while stop is None or not stop.is_set():
+            # markers
+            while True:
+                m, ts = inlet_mk.pull_sample(timeout=0.0)
+                if m is None: break
+                s=str(m[0])
+                if s.startswith("TRIAL_START"):
+                    last_trial_start = ts
+                    trial_locked = False
+                    locked_pred = None
+                    locked_time = None
+                    consec_pred = None
+                    consec_count = 0
+                    last_end_n = None
+                    parts = s.split("|"); last_true = float(parts[1]) if len(parts)>1 else None
+                    trial_true = last_true
+                    if T is None and last_true in epochs and len(epochs[last_true]) + sum(p[1] == last_true for p in pending) < args.calib_trials:
+                        pending.append((ts, last_true))
+                elif s.startswith("TRIAL_END"):
+                    last_true = float("nan")  # REST 阶段 ground-truth 为空
+
+            # eeg
+            chunk, ts = inlet.pull_chunk(timeout=0.2)
+            if not chunk: continue
+            gap = inlet.pop_gap()
+            if gap is not None:
+                # 断流恢复：清空缓冲，跨越中断的试次（含未收齐的标定试次）不再使用；日志记一行 GAP
+                buf[:] = 0; tbuf[:] = -np.inf; head = 0
+                pending = [p for p in pending if p[0] + args.delay >= gap["lsl_to"]]
+                if last_trial_start is not None and last_trial_start + args.delay < gap["lsl_to"]: last_trial_start = None
+                meta["stream_gaps"].append(gap); write_meta(run_dir, meta)
+                wr.writerow(gap_row(cols, gap, method="TRCA", window_s=args.window)); out.flush()
+            x, ts = bp.check(np.asarray(chunk, dtype=dt), ts)
+            if spf is not None: x = spf(x)  # 入口空间滤波：缓冲只存滤波后的各路
+            nnew = x.shape[0]; tsa = np.asarray(ts, dtype=float)
+            if nnew >= buf.shape[0]:
+                buf[:] = x[-buf.shape[0]:,:]; tbuf[:] = tsa[-buf.shape[0]:]; head=0
+            else:
+                end = head + nnew
+                if end <= buf.shape[0]:
+                    buf[head:end,:] = x; tbuf[head:end] = tsa
+                else:
+                    part = buf.shape[0] - head
+                    buf[head:,:] = x[:part,:]; buf[:nnew-part,:] = x[part:,:]
+                    tbuf[head:] = tsa[:part]; tbuf[:nnew-part] = tsa[part:]
+                head = (head + nnew) % buf.shape[0]
+            n_recv += nnew
+            xo = np.vstack([buf[head:,:], buf[:head,:]])
+            to = np.concatenate([tbuf[head:], tbuf[:head]])
+
+            # 滚动通道质检（仅记录每通道 SNR）
+            if chqc is not None and n_recv >= buf.shape[0] and local_clock() >= next_chqc:
+                chqc.update(xo)
+                next_chqc = local_clock() + args.chqc_interval
+
+            # 标定：收齐一个完整锁相段就存下；每个目标都够数后拟合模型
+            if T is None:
+                for p in list(pending):
+                    i0 = int(np.searchsorted(to, p[0] + args.delay))
+                    if i0 + ep_n > len(to): continue
+                    pending.remove(p)
+                    if i0 - pad < 0:
+                        print(f"WARN: calibration trial {p[1]}Hz dropped (onset no longer in buffer)"); continue
+                    seg = xo[i0-pad:i0+ep_n]
+                    if sel: seg = seg[:, sel]
+                    epochs[p[1]].append(fb_filter(seg, fs, args.notch, bands, pad))
+                    print(f"[TRCA] calibration {sum(len(v) for v in epochs.values())}/{args.calib_trials*len(freqs)} ({p[1]}Hz)")
+                if all(len(v) >= args.calib_trials for v in epochs.values()):
+                    t_fit = time.perf_counter()
+                    T, W = fit_trca(epochs, freqs)
+                    model_path = os.path.join(run_dir, "trca_model.npz")
+                    save_model(model_path, T, W, freqs, fs, chs, args.epoch, args.delay)
+                    if store is not None:
+                        version = store.save(store_key, {"T": T, "W": W}, {
+                            "subject": args.subject, "fs": fs, "freqs": freqs, "chs": chs, "epoch_s": args.epoch,
+                            "delay_s": args.delay, "notch": args.notch, "bands": meta["bands"], "run": run_dir,
+                            "n_trials": {str(f): len(epochs[f]) for f in freqs}})
+                        template.update({"version": version, "source": "calibrated"})
+                        print(f"[TRCA] templates saved to store {store_key} v{version:03d}")
+                    meta["calibration"].update({"model": model_path, "fit_s": round(time.perf_counter() - t_fit, 4),
+                                                "n_trials": {str(f): len(epochs[f]) for f in freqs}})
+                    write_meta(run_dir, meta)
+                    print(f"[TRCA] calibration done, model saved to {model_path}", flush=True)
+                    T, W = T.astype(dt, copy=False), W.astype(dt, copy=False)
+                    calib_onset = last_trial_start  # 标定完成时的当前试次可能已用于训练，不再解码
+                continue
+
+            # 解码：窗口与试次起点锁相，长度取 min(window, 已到达的段内数据)，模板取对应偏移的片段
+            if last_trial_start is None or last_trial_start == calib_onset: continue
+            i0 = int(np.searchsorted(to, last_trial_start + args.delay))
+            if i0 - pad < 0: continue
+            end_i = min(len(to), i0 + ep_n)
+            end_n = n_recv - (len(to) - end_i)
+            if end_i - i0 < min_n or end_n == last_end_n: continue
+            last_end_n = end_n
+            L = min(win, end_i - i0)
+            start_i = end_i - L
+            seg = xo[start_i-pad:end_i]
+            if sel: seg = seg[:, sel]
+            xb = fb_filter(seg, fs, args.notch, bands, pad)
+            sc = trca_scores(xb, T, W, start_i - i0, weights)
+
+            k = int(np.argmax(sc))
+            best_f, best_s = freqs[k], float(sc[k])
+            pred_time = local_clock()
+
+            # 计算第二名r2和margin
+            r_sorted = np.sort(sc)[::-1]
+            r1 = float(r_sorted[0])
+            r2 = float(r_sorted[1]) if len(r_sorted) > 1 else -1
+            margin = r1 - r2
+
+            # Idle门控
+            state = "CONTROL"
+            if args.idle and (r1 < args.idle_rmin or margin < args.idle_margin):
+                # 进入IDLE：不输出控制类预测
+                pred_f = None
+                state = "IDLE"
+            else:
+                # 维持现有的投票/早停逻辑
+                hist.append(best_f)
+                pred_f = max(set(hist), key=hist.count) if len(hist)==hist.maxlen else best_f
+
+            early = False
+            if not state == "IDLE" and args.earlystop and (not trial_locked):
+                elapsed = pred_time - last_trial_start
+                # 连续一致计数
+                if consec_pred is None or consec_pred != best_f:
+                    consec_pred = best_f
+                    consec_count = 1
+                else:
+                    consec_count += 1
+                # 判定是否早停
+                if (elapsed >= args.minwin) and (r1 >= args.rmin) and (margin >= args.margin) and (consec_count >= args.patience):
+                    trial_locked = True
+                    locked_pred = best_f
+                    locked_time = pred_time
+                    early = True
+
+            # 若已锁定，本trial内忽略后续窗（但仍可记录日志行，note标记为LOCKED）
+            note_flags = []
+            if early: note_flags.append("EARLY")
+            if trial_locked: note_flags.append("LOCKED")
+
+            lat = pred_time - last_trial_start
+
+            base_note = ""
+            if trial_true is not None and not np.isnan(trial_true) and pred_f is not None:
+                base_note = "CORRECT" if abs(pred_f - trial_true) < 1e-6 else "WRONG"
+
+            if base_note and note_flags:
+                note = base_note + "|" + "|".join(note_flags)
+            elif note_flags:
+                note = "|".join(note_flags)
+            else:
+                note = base_note
+
+            pred_str = f"{pred_f:.1f}Hz" if pred_f is not None else "IDLE"
+            print(f"[{pred_time:.3f}] Pred={pred_str} (score={best_s:.3f}) True={trial_true}Hz Lat={lat:.3f}s {note} State={state}")
+            if score_out is not None:
+                score_out.push(zip(freqs, sc), r1, margin, state, pred_f, pred_time)
+            wr.writerow([last_trial_start, pred_time, lat, trial_true, pred_f, "TRCA", args.window, note, best_s, r1, r2, margin, early, trial_locked, state, *bp.row()]); out.flush()
+
+            if meta["startup"]["time_to_first_prediction_s"] is None:
+                meta["startup"]["time_to_first_prediction_s"] = round(time.perf_counter() - T0, 4)
+                write_meta(run_dir, meta)
+
+    except KeyboardInterrupt:
+        print("Stopping...")
+    finally:
+        out.close()
+        meta["backpressure"] = bp.snapshot()
+        print(f"[BACKPRESSURE] {meta['backpressure']}")
+        write_meta(run_dir, meta)
+        if chqc is not None:
+            meta["channel_snr"] = chqc.snapshot()
+            write_meta(run_dir, meta)
+
+def build_parser():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--window", type=float, default=0.5)
+    ap.add_argument("--freqs", type=str, default="10,12,15,20")
+    ap.add_argument("--notch", type=float, default=50.0)
+    ap.add_argument("--chs", type=str, default="", help="使用的通道索引（逗号分隔）")
+    ap.add_argument("--vote", type=int, default=1, help="多数投票窗口大小")
+    ap.add_argument("--outdir", type=str, default=r"C:\Users\23842\Desktop\bci\data\logs")
+    ap.add_argument("--runname", type=str, default=None, help="run folder name; default auto by method/window/vote/timestamp")
+    ap.add_argument("--latlog", type=str, default=None, help="(optional) direct csv path; overrides run folder if set")
+    ap.add_argument("--earlystop", action="store_true", help="enable adaptive early stopping")
+    ap.add_argument("--rmin", type=float, default=0.45, help="min FB-TRCA score r1 to allow early stop")
+    ap.add_argument("--margin", type=float, default=0.15, help="min (r1-r2) margin for early stop")
+    ap.add_argument("--patience", type=int, default=2, help="need same prediction for k consecutive windows")
+    ap.add_argument("--minwin", type=float, default=0.3, help="earliest time after TRIAL_START to allow early decision (s)")
+    ap.add_argument("--idle", action="store_true", help="启用IDLE门控（无注视时输出IDLE）")
+    ap.add_argument("--idle_rmin", type=float, default=0.50, help="IDLE门控的r1阈值")
+    ap.add_argument("--idle_margin", type=float, default=0.12, help="IDLE门控的(r1-r2)阈值")
+    ap.add_argument("--auto_chs", action="store_true", help="从 data/logs/qc/selected_chs.txt 自动选通道")
+    ap.add_argument("--fs_hint", type=float, default=0.0, help="预期EEG采样率；给定时在等待数据流期间预生成滤波器设计")
+    ap.add_argument("--chqc_interval", type=float, default=2.0, help="滚动通道质检的更新间隔（秒），<=0 关闭")
+    ap.add_argument("--calib_trials", type=int, default=5, help="标定阶段每个目标使用的试次数")
+    ap.add_argument("--model", type=str, default=None, help="直接加载已有的 trca_model.npz（跳过标定）")
+    ap.add_argument("--epoch", type=float, default=1.0, help="标定段/模板长度（秒），一般取刺激时长")
+    ap.add_argument("--delay", type=float, default=0.14, help="视觉通路延迟（秒）：锁相段从 TRIAL_START+delay 开始")
+    ap.add_argument("--subject", type=str, default=None, help="被试 ID；给定时从模板库复用/保存模板")
+    ap.add_argument("--store", type=str, default=r"C:\Users\23842\Desktop\bci\data\templates", help="模板库根目录（默认与 --outdir 同在仓库 data/ 下，不随启动目录变化）")
+    ap.add_argument("--montage", type=str, default=None, help="电极布局名（模板库的键之一）；默认按通道数")
+    ap.add_argument("--template_version", type=int, default=None, help="使用模板库中的指定版本；默认最新")
+    ap.add_argument("--recalibrate", action="store_true", help="忽略模板库中的已有模板，重新标定并保存为新版本")
+    ap.add_argument("--min_len", type=float, default=0.2, help="试次开始后至少积累多少秒数据才开始解码")
+    ap.add_argument("--score_stream", action="store_true", help="把每窗各目标分数、r1/margin、IDLE/CONTROL 状态发布为 LSL 流 SSVEPScores（gui/live_scores.py 显示）")
+    ap.add_argument("--max_lag", type=float, default=0.0, help="入口积压超过该值（秒）时进入追赶：取完积压数据，只解码最新的窗（默认 0：只记录积压不追赶）")
+    add_stream_args(ap)
+    add_spatial_args(ap)
+    ap.add_argument("--dtype", choices=["float64", "float32"], default="float64", help="计算精度：float32 时缓冲/滤波/模板匹配用单精度（滤波改用 SOS）")
+    return ap
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())
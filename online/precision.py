@@ -0,0 +1,49 @@
+# online/precision.py
+import numpy as np
+from functools import lru_cache
+
+# --dtype float32 时的滤波与相关计算，以及 --cca_solver closed 的闭式典型相关。
+# 单精度下 b/a 形式的高阶窄带 IIR 数值会发散，统一改用二阶节（SOS）。
+# 求解器与精度相互独立：sklearn 的 CCA 内部一律转成 float64（float32 模式下只有缓冲与滤波是单精度）；
+# 闭式解（QR + SVD）的计算精度跟随输入数据。
+
+DTYPES = {"float64": np.float64, "float32": np.float32}
+SOLVERS = ("sklearn", "closed")
+
+class ClosedFormCCA:
+    """--cca_solver closed：在原来传 sklearn CCA 的位置传入，cca_corr 见到它就用闭式解"""
+
+@lru_cache(maxsize=None)
+def band_sos(lo, hi, fs, order=4, dtype="float32"):
+    from scipy.signal import butter
+    return butter(order, [lo/(fs/2), hi/(fs/2)], btype='band', output='sos').astype(dtype)
+
+@lru_cache(maxsize=None)
+def notch_sos(notch, fs, Q=30, dtype="float32"):
+    from scipy.signal import iirnotch, tf2sos
+    return tf2sos(*iirnotch(w0=notch/(fs/2), Q=Q)).astype(dtype)
+
+def sos_filtfilt(sos, x):
+    from scipy.signal import sosfiltfilt
+    return sosfiltfilt(sos, x, axis=0)
+
+def canon_corr(X, Y):
+    """X: (n, C), Y: (n, R) 的首个典型相关系数，计算精度跟随 X 的 dtype"""
+    Y = Y.astype(X.dtype, copy=False)
+    Qx, _ = np.linalg.qr(X - X.mean(axis=0))
+    Qy, _ = np.linalg.qr(Y - Y.mean(axis=0))
+    return min(float(np.linalg.svd(Qx.T @ Qy, compute_uv=False)[0]), 1.0)
+
+def make_cca(solver="sklearn"):
+    if solver == "closed":
+        return ClosedFormCCA()
+    from sklearn.cross_decomposition import CCA
+    return CCA(n_components=1)
+
+def cca_corr(cca, X, Y):
+    """首个典型相关系数：ClosedFormCCA 走闭式解，否则沿用 sklearn CCA 的 fit/transform"""
+    if isinstance(cca, ClosedFormCCA):
+        return canon_corr(X, Y)
+    cca.fit(X, Y)
+    U, V = cca.transform(X, Y)
+    return np.corrcoef(U[:,0].ravel(), V[:,0].ravel())[0,1]
@@ -0,0 +1,62 @@
+# online/prescreen.py
+import numpy as np
+from functools import lru_cache
+
+@lru_cache(maxsize=16)
+def _dft_basis(n, fs, freqs, harmonics, dtype="complex128"):
+    """各目标各谐波处的加 Hann 窗 DFT 基 (K*H, n)，按 (窗长, 频率集) 缓存"""
+    t = np.arange(n) / fs
+    hz = np.array([h * f for f in freqs for h in range(1, harmonics+1)])
+    return (np.exp(-2j * np.pi * np.outer(hz, t)) * np.hanning(n)).astype(dtype)
+
+def spectral_scores(seg, fs, freqs, harmonics=3, weights=(1.0, 0.6, 0.4)):
+    """廉价预筛分数：各目标谐波频点上的功率（所选通道求和），谐波加权与 CCA+ 一致。
+
+    与 Goertzel 等价——只在目标频点求 DFT，不做整段 FFT，代价 O(n × C × K × H)。
+    """
+    cdt = "complex64" if seg.dtype == np.float32 else "complex128"
+    E = _dft_basis(seg.shape[0], float(fs), tuple(float(f) for f in freqs), harmonics, cdt)
+    Z = E @ (seg - seg.mean(axis=0))
+    P = (np.abs(Z)**2).sum(axis=1).reshape(len(freqs), harmonics)
+    return P @ np.asarray(weights[:harmonics], dtype=float)
+
+def select_targets(scores, k, margin=0.2):
+    """保留功率前 k 的目标，外加功率不低于第 k 名 (1-margin) 倍的目标（安全余量）；返回索引列表（原顺序）"""
+    K = len(scores)
+    if k <= 0 or k >= K:
+        return list(range(K))
+    k = max(k, 2)  # 至少留两个，r2/margin 才有意义
+    thr = np.sort(scores)[::-1][k-1] * (1.0 - margin)
+    return [i for i in range(K) if scores[i] >= thr]
+
+class PruneStats:
+    """预筛统计：每 audit 个窗额外对全部目标打分一次，比较剪枝前后的判决"""
+    def __init__(self, k, margin, audit=20):
+        self.k, self.margin, self.audit = k, margin, audit
+        self.windows = 0
+        self.kept = 0
+        self.total = 0
+        self.audited = 0
+        self.changed = 0
+
+    def want_audit(self):
+        return self.audit > 0 and self.windows % self.audit == 0
+
+    def record(self, n_kept, n_total, changed=None):
+        self.windows += 1
+        self.kept += n_kept
+        self.total += n_total
+        if changed is not None:
+            self.audited += 1
+            self.changed += int(bool(changed))
+
+    def snapshot(self):
+        return {
+            "k": self.k, "margin": self.margin, "audit_every": self.audit,
+            "windows": self.windows,
+            "mean_kept": round(self.kept / self.windows, 3) if self.windows else None,
+            "kept_ratio": round(self.kept / self.total, 4) if self.total else None,
+            "audited": self.audited,
+            "changed": self.changed,
+            "changed_rate": round(self.changed / self.audited, 4) if self.audited else None,
+        }
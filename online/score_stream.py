@@ -0,0 +1,31 @@
+# online/score_stream.py
+import numpy as np
+from pylsl import StreamInfo, StreamOutlet
+
+STATE_CODE = {"CONTROL": 1.0, "IDLE": 0.0}
+EXTRA = ["r1", "margin", "state", "pred_freq"]
+
+class ScoreOutlet:
+    """逐窗打分结果的 LSL 流（type=Scores，供 gui/live_scores.py 实时显示）。
+
+    每个样本 = [各目标分数..., r1, margin, state(1=CONTROL/0=IDLE), 预测频率(无输出时 NaN)]，
+    时间戳取该窗的判决时刻；本窗没有打分的目标（被预筛剪掉）为 NaN。push_sample 不阻塞，解码循环几乎无额外开销。
+    """
+    def __init__(self, freqs, method, name="SSVEPScores"):
+        self.idx = {f: i for i, f in enumerate(freqs)}
+        info = StreamInfo(name=name, type="Scores", channel_count=len(freqs) + len(EXTRA), nominal_srate=0.0,
+                          channel_format="float32", source_id="ssvep-scores")  # 固定 source_id：解码器重启后面板的 inlet 自动重连
+        chns = info.desc().append_child("channels")
+        for label in [f"{f:g}Hz" for f in freqs] + EXTRA:
+            chns.append_child("channel").append_child_value("label", label)
+        info.desc().append_child_value("method", method)
+        self.outlet = StreamOutlet(info)
+        self.row = np.full(len(freqs) + len(EXTRA), np.nan)
+
+    def push(self, scores, r1, margin, state, pred_f, ts):
+        row = self.row
+        row[:] = np.nan
+        for f, s in scores:
+            row[self.idx[f]] = s
+        row[-4:] = r1, margin, STATE_CODE.get(state, 1.0), np.nan if pred_f is None else pred_f
+        self.outlet.push_sample(row.tolist(), ts)
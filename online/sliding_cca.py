@@ -0,0 +1,130 @@
+# online/sliding_cca.py
+import numpy as np
+
+def ref_block(n0, m, fs, freqs, harmonics=3, dtype=np.float64):
+    """绝对样本序号 n0..n0+m-1 处的参考信号，形状 (K, m, 2*harmonics)。
+
+    相位按绝对序号计算（跨窗连续），因此同一样本无论落在哪个窗里参考值都相同，
+    滑动累加时可以直接加上新样本、减去移出的样本。相对窗起点的相位差只是每个谐波 sin/cos
+    平面内的旋转，CCA 相关系数不受影响（同理也不需要目标的初相位）。
+    """
+    n = np.arange(n0, n0 + m)
+    out = np.empty((len(freqs), m, 2*harmonics), dtype=dtype)
+    for k, f in enumerate(freqs):
+        cyc = np.mod(n * (f / fs), 1.0)  # 先取小数部分，长时间运行也不损失相位精度
+        for h in range(1, harmonics+1):
+            ph = 2*np.pi*h*cyc
+            out[k, :, 2*(h-1)] = np.sin(ph)
+            out[k, :, 2*h-1] = np.cos(ph)
+    return out
+
+class SlidingCCA:
+    """单个频带的增量 CCA：因果滤波（带状态）+ 滑动窗内的一阶/二阶累加量。
+
+    每来一块新样本只做 O(新样本数 × 通道数 × (通道数 + 参考维数)) 的累加更新，
+    打分时由协方差直接求最大典型相关系数，代价与窗长无关。每 refresh 次更新按环形缓冲重算一次，消除累计误差。
+    """
+    def __init__(self, fs, n_ch, freqs, win, sos, harmonics=3, refresh=200, dtype=np.float64):
+        self.fs, self.n_ch, self.freqs, self.win = fs, n_ch, list(freqs), win
+        self.harmonics, self.refresh = harmonics, refresh
+        self.dtype = np.dtype(dtype)
+        self.sos = sos.astype(self.dtype)
+        self.zi = np.zeros((sos.shape[0], 2, n_ch), dtype=self.dtype)  # 因果滤波器状态，跨块保持
+        self.ring = np.zeros((win, n_ch), dtype=self.dtype)   # 已滤波样本
+        self.n = 0                          # 已处理的样本总数（绝对序号）
+        self.n_updates = 0
+        self._zero()
+
+    def _zero(self):
+        K, R = len(self.freqs), 2*self.harmonics
+        dt = self.dtype
+        self.Sx = np.zeros(self.n_ch, dt); self.Sxx = np.zeros((self.n_ch, self.n_ch), dt)
+        self.Sy = np.zeros((K, R), dt); self.Syy = np.zeros((K, R, R), dt); self.Sxy = np.zeros((K, self.n_ch, R), dt)
+
+    def _accumulate(self, X, Y, sign):
+        self.Sx += sign * X.sum(axis=0)
+        self.Sxx += sign * (X.T @ X)
+        self.Sy += sign * Y.sum(axis=1)
+        self.Syy += sign * np.einsum('kmi,kmj->kij', Y, Y)
+        self.Sxy += sign * np.einsum('mc,kmj->kcj', X, Y)
+
+    def count(self):
+        return min(self.n, self.win)
+
+    def update(self, x):
+        """送入新的原始样本块 x: (m, C)"""
+        from scipy.signal import sosfilt
+        X, self.zi = sosfilt(self.sos, np.asarray(x, dtype=self.dtype), axis=0, zi=self.zi)
+        m = X.shape[0]
+        if m >= self.win:
+            # 环形缓冲按绝对序号 % win 定位样本，最后 win 个样本也要按各自的序号写入
+            self.ring[(self.n + m - self.win + np.arange(self.win)) % self.win] = X[-self.win:]
+            self.n += m
+            self.recompute()
+            return
+        n0 = self.n
+        # 移出窗口的样本：绝对序号 [max(0, n0-win), max(0, n0+m-win))
+        old0, old1 = max(0, n0 - self.win), max(0, n0 + m - self.win)
+        if old1 > old0:
+            oi = (old0 + np.arange(old1 - old0)) % self.win
+            self._accumulate(self.ring[oi], ref_block(old0, old1 - old0, self.fs, self.freqs, self.harmonics, self.dtype), -1.0)
+        idx = (n0 + np.arange(m)) % self.win
+        self.ring[idx] = X
+        self._accumulate(X, ref_block(n0, m, self.fs, self.freqs, self.harmonics, self.dtype), 1.0)
+        self.n += m
+        self.n_updates += 1
+        if self.n_updates % self.refresh == 0:
+            self.recompute()
+
+    def recompute(self):
+        """按环形缓冲中的当前窗从头重算累加量"""
+        c = self.count()
+        n0 = self.n - c
+        idx = (n0 + np.arange(c)) % self.win
+        self._zero()
+        if c:
+            self._accumulate(self.ring[idx], ref_block(n0, c, self.fs, self.freqs, self.harmonics, self.dtype), 1.0)
+
+    def corr(self, reg=1e-9):
+        """各目标的最大典型相关系数 (K,)"""
+        c = self.count()
+        if c < 2:
+            return np.zeros(len(self.freqs))
+        if self.dtype == np.float32:
+            reg = max(reg, 1e-5)  # 单精度下 Cholesky 需要更大的对角加载
+        mx = self.Sx / c
+        Cxx = self.Sxx / c - np.outer(mx, mx)
+        Cxx += (reg * np.trace(Cxx) / self.n_ch + 1e-12) * np.eye(self.n_ch, dtype=self.dtype)
+        Lx = np.linalg.cholesky(Cxx)
+        my = self.Sy / c
+        r = np.zeros(len(self.freqs))
+        for k in range(len(self.freqs)):
+            Cyy = self.Syy[k] / c - np.outer(my[k], my[k]) + 1e-12*np.eye(len(my[k]), dtype=self.dtype)
+            Cxy = self.Sxy[k] / c - np.outer(mx, my[k])
+            Ly = np.linalg.cholesky(Cyy)
+            M = np.linalg.solve(Lx, Cxy)
+            M = np.linalg.solve(Ly, M.T).T
+            r[k] = np.linalg.svd(M, compute_uv=False)[0]
+        return np.minimum(r, 1.0)
+
+class SlidingFBCCA:
+    """滤波器组版本：每个子带一个 SlidingCCA，分数 = Σ w_b · max(0, r_b)（与 fbcca_score 相同的组合方式）"""
+    def __init__(self, fs, n_ch, freqs, win, fb_bands, notch=50.0, harmonics=3, refresh=200, order=4, dtype=np.float64):
+        from scipy.signal import butter, iirnotch, tf2sos
+        notch_sos = tf2sos(*iirnotch(w0=notch/(fs/2), Q=30)) if notch else np.zeros((0, 6))
+        self.weights = [w for _, _, w in fb_bands]
+        self.bands = []
+        for lo, hi, _ in fb_bands:
+            sos = np.vstack([notch_sos, butter(order, [lo/(fs/2), hi/(fs/2)], btype='band', output='sos')])
+            self.bands.append(SlidingCCA(fs, n_ch, freqs, win, sos, harmonics, refresh, dtype))
+        self.freqs = list(freqs)
+
+    def update(self, x):
+        for b in self.bands:
+            b.update(x)
+
+    def scores(self):
+        s = np.zeros(len(self.freqs))
+        for w, b in zip(self.weights, self.bands):
+            s += w * np.maximum(0.0, b.corr())
+        return s
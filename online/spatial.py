@@ -0,0 +1,84 @@
+# online/spatial.py
+# 入口空间滤波：每块 EEG 进入环形缓冲前做一次 y = x @ P（P 为 n_ch × n_out），
+# 之后缓冲、通道质检与打分都只处理 n_out 路信号（64 通道只解码 8 路枕区时，缓冲与每窗计算约减为 1/8）。
+import os
+import numpy as np
+
+MODES = ("none", "subset", "car", "laplacian", "matrix")
+
+def parse_neighbors(spec):
+    """'2:0,4;3:1,5' -> {2: [0, 4], 3: [1, 5]}（通道: 参与求平均的邻近通道）"""
+    nb = {}
+    for item in (spec or "").split(";"):
+        if not item.strip():
+            continue
+        c, ns = item.split(":")
+        nb[int(c)] = [int(n) for n in ns.split(",") if n.strip()]
+    return nb
+
+def load_matrix(path):
+    """投影矩阵：.npy，或逗号分隔的文本（.csv/.txt），形状 (输入通道, 输出路数)"""
+    M = np.load(path) if path.endswith(".npy") else np.loadtxt(path, delimiter=",", ndmin=2)
+    return np.atleast_2d(np.asarray(M, dtype=np.float64))
+
+class SpatialFilter:
+    """y = x @ P；纯通道子集时直接按列取，不做矩阵乘"""
+    def __init__(self, n_in, P=None, idx=None, desc="", dtype=np.float64):
+        self.n_in = n_in
+        self.P = None if P is None else np.ascontiguousarray(P, dtype=dtype)
+        self.idx = None if idx is None else np.asarray(idx, dtype=np.intp)
+        self.n_out = len(self.idx) if self.P is None else self.P.shape[1]
+        self.desc = desc
+
+    def __call__(self, x):
+        return x[:, self.idx] if self.P is None else x @ self.P
+
+    def describe(self):
+        return {"mode": self.desc, "n_in": self.n_in, "n_out": self.n_out,
+                "chs": None if self.idx is None else self.idx.tolist()}
+
+def make_spatial(args, n_ch, sel, dtype=np.float64):
+    """按 --spatial 构造入口滤波；none 返回 None（缓冲保存全部通道，按窗取 sel，即原来的行为）。
+    subset / car / laplacian 的输出为 sel（未给则全部通道）对应的各路；matrix 的输出列数由矩阵决定。"""
+    mode = getattr(args, "spatial", "none")
+    if mode == "none":
+        return None
+    keep = list(sel) if sel else list(range(n_ch))
+    bad = [c for c in keep if not 0 <= c < n_ch]
+    if bad:
+        raise ValueError(f"channels {bad} out of range for {n_ch}-channel stream")
+    if mode == "subset":
+        return SpatialFilter(n_ch, idx=keep, desc="subset", dtype=dtype)
+    if mode == "car":
+        # 共平均参考：减去全部通道的均值后再取子集
+        P = np.eye(n_ch) - 1.0 / n_ch
+        return SpatialFilter(n_ch, P[:, keep], desc="car", dtype=dtype)
+    if mode == "laplacian":
+        nb = parse_neighbors(args.lap_neighbors)
+        if not nb:
+            raise ValueError("--spatial laplacian needs --lap_neighbors, e.g. '2:0,4;3:1,5'")
+        P = np.eye(n_ch)
+        for c, ns in nb.items():
+            if ns:
+                P[ns, c] -= 1.0 / len(ns)   # 该通道减去邻近通道的均值；未列出的通道保持不变
+        return SpatialFilter(n_ch, P[:, keep], desc="laplacian", dtype=dtype)
+    if mode == "matrix":
+        if not args.spatial_matrix:
+            raise ValueError("--spatial matrix needs --spatial_matrix <file>")
+        M = load_matrix(args.spatial_matrix)
+        if M.shape[0] == n_ch:
+            P = M
+        elif sel and M.shape[0] == len(sel):
+            P = np.zeros((n_ch, M.shape[1]))
+            P[sel] = M   # 矩阵按 --chs 的通道顺序给出
+        else:
+            raise ValueError(f"projection matrix {args.spatial_matrix} has {M.shape[0]} rows; stream has {n_ch} channels"
+                             + (f", --chs selects {len(sel)}" if sel else ""))
+        return SpatialFilter(n_ch, P, desc=f"matrix:{os.path.basename(args.spatial_matrix)}", dtype=dtype)
+    raise ValueError(f"unknown --spatial mode: {mode}")
+
+def add_spatial_args(ap):
+    ap.add_argument("--spatial", choices=MODES, default="none",
+                    help="入口空间滤波（每块数据进缓冲前做一次）：subset=只保留 --chs 通道；car=共平均参考；laplacian=减邻近通道均值；matrix=从文件读投影矩阵")
+    ap.add_argument("--lap_neighbors", type=str, default=None, help="Laplacian 邻接，例如 '2:0,4;3:1,5'（通道:邻近通道）")
+    ap.add_argument("--spatial_matrix", type=str, default=None, help="投影矩阵文件（.npy 或逗号分隔文本），形状 (通道数, 输出路数)")
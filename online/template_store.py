@@ -0,0 +1,56 @@
+# online/template_store.py
+import os, json, time, hashlib
+import numpy as np
+from datetime import datetime
+
+class TemplateStore:
+    """按 被试 / 电极布局 / 采样率 / 目标集 保存标定得到的空间滤波器与模板，跨 session 复用。
+
+    目录结构：<root>/<subject>/<montage>_fs<fs>_k<K>-<hash>/v001/{T.npy, W.npy, info.json}
+    数组用 .npy 保存，加载时 mmap_mode="r"（只映射不拷贝，启动时毫秒级）；每次保存新建一个版本目录。
+    """
+    def __init__(self, root="data/templates"):
+        self.root = root
+
+    @staticmethod
+    def key(subject, montage, fs, freqs):
+        targets = [round(float(f), 4) for f in freqs]
+        h = hashlib.sha1(json.dumps(targets).encode("utf-8")).hexdigest()[:8]
+        return os.path.join(str(subject), f"{montage}_fs{int(fs)}_k{len(targets)}-{h}")
+
+    def versions(self, key):
+        d = os.path.join(self.root, key)
+        if not os.path.isdir(d):
+            return []
+        return sorted(int(v[1:]) for v in os.listdir(d) if v.startswith("v") and v[1:].isdigit()
+                      and os.path.exists(os.path.join(d, v, "info.json")))
+
+    def save(self, key, arrays, info):
+        """保存一个新版本（arrays: {名称: ndarray}）；返回版本号"""
+        vs = self.versions(key)
+        version = (vs[-1] + 1) if vs else 1
+        d = os.path.join(self.root, key, f"v{version:03d}")
+        tmp = d + ".tmp"
+        os.makedirs(tmp, exist_ok=True)
+        for name, a in arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(a))
+        info = dict(info, key=key, version=version, arrays=sorted(arrays), created=datetime.now().isoformat(timespec="seconds"))
+        with open(os.path.join(tmp, "info.json"), "w", encoding="utf-8") as f:
+            json.dump(info, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, d)  # 写完整个目录再改名，避免并发读到半个版本
+        return version
+
+    def load(self, key, version=None):
+        """加载指定版本（默认最新）；返回 (arrays, info)，不存在时返回 (None, None)"""
+        vs = self.versions(key)
+        if not vs or (version is not None and version not in vs):
+            return None, None
+        version = vs[-1] if version is None else version
+        d = os.path.join(self.root, key, f"v{version:03d}")
+        t0 = time.perf_counter()
+        with open(os.path.join(d, "info.json"), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        arrays = {name: np.load(os.path.join(d, f"{name}.npy"), mmap_mode="r") for name in info["arrays"]}
+        info["load_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        info["path"] = d
+        return arrays, info
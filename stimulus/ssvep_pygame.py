@@ -1,105 +1,228 @@
 # stimulus/ssvep_pygame.py
-import random, time, sys
+import random, time, sys, math, os, csv, argparse
+from datetime import datetime
 import pygame
 from pylsl import StreamInfo, StreamOutlet, local_clock
 
 # ---------- 参数 ----------
 SCREEN_REFRESH = 60           # 显示器刷新率（务必在系统里设为 60Hz）
-FREQS = [10.0, 12.0, 15.0, 20.0]  # 四个目标频率
-DUTY = 0.5                    # 占空比（此版本用整帧翻转方式，实际效果 ~50%）
+FREQS = [10.0, 12.0, 15.0, 20.0]  # 默认四个目标频率（--freqs 覆盖）
+MAX_TARGETS = 40
+DUTY = 0.5                    # 占空比（方波调制时 ~50%）
+MODULATION = "auto"           # "auto": 刷新率整除的频率用方波，其余用采样正弦；"square" / "sin" 强制统一
+LUM_MIN, LUM_MAX = 80, 255    # 灰度范围（暗 / 亮）
 TRIAL_LEN = 1.0               # 刺激窗（秒），先固定 1.0
 REST_LEN = 2.0                # 休息时长（秒）
 CUE_LEN = 0.5                 # 提示时长（秒）
-BLOCK_TRIALS = 10             # 每目标试次数 => 共 4*10 = 40 个 trial
+BLOCK_TRIALS = 10             # 每目标试次数（--trials 覆盖）=> 默认共 4*10 = 40 个 trial
 FULLSCREEN = True             # 全屏显示
+VSYNC = True                  # 请求垂直同步（驱动不支持时自动退回）
 
-# ---------- LSL 标记 ----------
+ap = argparse.ArgumentParser()
+ap.add_argument("--outdir", type=str, default="data/logs/stim", help="帧时序日志的输出目录（GUI 传入解码器的日志目录）")
+ap.add_argument("--runname", type=str, default=None, help="run 子目录名；默认按时间戳生成")
+ap.add_argument("--freqs", type=str, default=",".join(str(f) for f in FREQS), help="各目标频率（逗号分隔，最多 40 个，需互不相同）")
+ap.add_argument("--phases", type=str, default="", help="各目标初相位，单位 π（逗号分隔，与 --freqs 等长）；默认全 0。只有 TRCA 能利用相位，CCA 类解码器对相位不敏感")
+ap.add_argument("--grid", type=str, default="", help="目标网格 行x列，例如 5x8；默认按目标数自动取近似方阵")
+ap.add_argument("--size", type=float, default=1/3, help="方块边长占网格单元短边的比例（目标多时可调大，如 0.7）")
+ap.add_argument("--trials", type=int, default=BLOCK_TRIALS, help="每个目标的试次数")
+args = ap.parse_args()
+
+# ---------- 目标配置（频率 + 相位联合编码） ----------
+FREQS = [float(x) for x in args.freqs.split(",") if x.strip()]
+PHASES = [float(x)*math.pi for x in args.phases.split(",") if x.strip()] or [0.0]*len(FREQS)
+if not 0 < len(FREQS) <= MAX_TARGETS:
+    raise ValueError(f"need 1..{MAX_TARGETS} targets, got {len(FREQS)}")
+if len(PHASES) != len(FREQS):
+    raise ValueError("--phases must have the same length as --freqs")
+if len(set(FREQS)) != len(FREQS):
+    raise ValueError("--freqs must be unique (decoders identify targets by frequency)")
+if args.grid:
+    ROWS, COLS = (int(v) for v in args.grid.lower().split("x"))
+else:
+    COLS = math.ceil(math.sqrt(len(FREQS))); ROWS = math.ceil(len(FREQS) / COLS)
+if ROWS*COLS < len(FREQS):
+    raise ValueError(f"grid {ROWS}x{COLS} has fewer cells than {len(FREQS)} targets")
+
+# ---------- 逐帧亮度表 ----------
+def is_divisor(f, refresh=SCREEN_REFRESH):
+    """f 的半周期是否为整数帧（方波可精确表示）"""
+    half = refresh / (2.0*f)
+    return abs(half - round(half)) < 1e-9
+
+def lum_table(f, n_frames, refresh=SCREEN_REFRESH, mode=MODULATION, phase=0.0):
+    """目标 f 在第 0..n_frames-1 帧的灰度值（整数）"""
+    square = mode == "square" or (mode == "auto" and is_divisor(f, refresh))
+    tab = []
+    for k in range(n_frames):
+        if square:
+            pos = (k*f/refresh + phase/(2*math.pi)) % 1.0
+            v = 1.0 if pos < DUTY else 0.0
+        else:
+            # 采样正弦（sampled sinusoidal stimulation）：非整除频率也能在 60Hz 屏上准确呈现
+            v = 0.5 * (1.0 + math.sin(2*math.pi*f*k/refresh + phase + math.pi/2))  # 第 0 帧为最亮，与方波一致
+        tab.append(int(round(LUM_MIN + (LUM_MAX - LUM_MIN)*v)))
+    return tab
+
+N_FRAMES = int(round(TRIAL_LEN * SCREEN_REFRESH))
+LUM_TABLES = [lum_table(f, N_FRAMES, phase=ph) for f, ph in zip(FREQS, PHASES)]
+
+# ---------- LSL 标记（CUE / TRIAL_START / TRIAL_END 载荷为 "事件|频率|目标序号"） ----------
 info = StreamInfo(name='SSVEPMarkers', type='Markers', channel_count=1,
                   channel_format='string', source_id='markers_001')
 outlet = StreamOutlet(info)
 
+# 帧遥测：每次翻转一个样本 [trial, frame, 与上一帧间隔(ms), 漏帧数]，时间戳为翻转完成时刻
+frame_info = StreamInfo(name='SSVEPFrames', type='FrameTiming', channel_count=4, nominal_srate=0.0,
+                        channel_format='double64', source_id='frames_001')
+frame_outlet = StreamOutlet(frame_info)
+FRAME_DT = 1.0 / SCREEN_REFRESH
+
+class FrameLog:
+    """逐帧记录翻转时刻并检测漏帧（间隔 >1.5 帧即视为错过 vsync），推送 LSL 并写入 run 目录"""
+    def __init__(self, run_dir):
+        self.f = open(os.path.join(run_dir, "frames.csv"), "w", newline="", encoding="utf-8")
+        self.wr = csv.writer(self.f)
+        self.wr.writerow(["trial","frame","lsl_time","interval_ms","missed"])
+        self.fs = open(os.path.join(run_dir, "frames_summary.csv"), "w", newline="", encoding="utf-8")
+        self.ws = csv.writer(self.fs)
+        self.ws.writerow(["trial","target","true_freq","lsl_onset","lsl_end","n_flips","n_frames","dropped","max_interval_ms"])
+        self.total_dropped = 0
+
+    def start(self, trial, target, freq, t):
+        self.trial, self.target, self.freq, self.t_on = trial, target, freq, t
+        self.prev, self.n_flips, self.dropped, self.max_dt = None, 0, 0, 0.0
+        self.flip(t, 0)
+
+    def flip(self, t, frame):
+        """记录一次翻转（frame 为本次呈现的亮度表帧序号）；返回检测到的漏帧数"""
+        dt = (t - self.prev) if self.prev is not None else float("nan")
+        missed = max(0, int(round(dt / FRAME_DT)) - 1) if self.prev is not None else 0
+        self.prev = t
+        self.n_flips += 1
+        self.dropped += missed
+        if dt == dt: self.max_dt = max(self.max_dt, dt)
+        self.wr.writerow([self.trial, frame, f"{t:.6f}", f"{dt*1000:.3f}", missed])
+        frame_outlet.push_sample([self.trial, frame, dt*1000, missed], t)
+        return missed
+
+    def end(self, t):
+        n_frames = int(round((t - self.t_on) / FRAME_DT))
+        self.ws.writerow([self.trial, self.target, self.freq, f"{self.t_on:.6f}", f"{t:.6f}", self.n_flips, n_frames, self.dropped, f"{self.max_dt*1000:.3f}"])
+        self.f.flush(); self.fs.flush()
+        self.total_dropped += self.dropped
+        if self.dropped:
+            print(f"[FRAMES] trial {self.trial}: dropped {self.dropped} frame(s), max interval {self.max_dt*1000:.1f} ms", flush=True)
+
+    def close(self):
+        self.f.close(); self.fs.close()
+
 # ---------- pygame 初始化 ----------
 pygame.init()
 flags = pygame.FULLSCREEN if FULLSCREEN else 0
-screen = pygame.display.set_mode((0,0), flags)
+try:
+    screen = pygame.display.set_mode((0,0), flags, vsync=1 if VSYNC else 0)
+except pygame.error:
+    print("WARN: vsync not available; frame timing falls back to clock.tick()")
+    screen = pygame.display.set_mode((0,0), flags)
 w, h = screen.get_size()
 clock = pygame.time.Clock()
 font = pygame.font.SysFont(None, 64)
 
-# 四个目标位置（屏幕四象限）
-rect_size = min(w, h)//6
-positions = [
-    (w//4 - rect_size//2, h//4 - rect_size//2),         # 左上 -> 10Hz
-    (3*w//4 - rect_size//2, h//4 - rect_size//2),       # 右上 -> 12Hz
-    (w//4 - rect_size//2, 3*h//4 - rect_size//2),       # 左下 -> 15Hz
-    (3*w//4 - rect_size//2, 3*h//4 - rect_size//2)      # 右下 -> 20Hz
-]
+# 目标位置：ROWS x COLS 网格按行排布，目标序号 = 行*COLS + 列（默认 4 目标即屏幕四象限）
+rect_size = int(min(w//COLS, h//ROWS) * args.size + 1e-6)
+positions = []
+for idx in range(len(FREQS)):
+    r, c = divmod(idx, COLS)
+    cx, cy = (2*c+1)*w//(2*COLS), (2*r+1)*h//(2*ROWS)
+    positions.append((cx - rect_size//2, cy - rect_size//2))
+target_rects = [pygame.Rect(x, y, rect_size, rect_size) for (x, y) in positions]
 
-# 每个目标的半周期帧数（按 60Hz 屏计算）
-half_period_frames = [max(1, round(SCREEN_REFRESH/(2*f))) for f in FREQS]
+# 预渲染：亮度表中出现的每个灰度各一张方块 surface（刺激期只做 blit，不再逐帧绘制）
+surfaces = {}
+for lv in sorted({v for tab in LUM_TABLES for v in tab} | {LUM_MIN}):
+    s = pygame.Surface((rect_size, rect_size)).convert()
+    s.fill((lv, lv, lv))
+    surfaces[lv] = s
 
-def draw_targets(states, highlight_idx=None):
+def draw_background(levels, highlight_idx=None):
+    """整屏重画一次（仅在阶段切换时调用）：黑底 + 高亮框 + 各方块当前灰度；返回翻转完成时刻"""
     screen.fill((0,0,0))
     for i, (x, y) in enumerate(positions):
-        on = states[i]
-        color = (255,255,255) if on else (80,80,80)
         if highlight_idx == i:
             pygame.draw.rect(screen, (0,255,0), (x-8,y-8,rect_size+16,rect_size+16), 4)
-        pygame.draw.rect(screen, color, (x,y,rect_size,rect_size))
+        screen.blit(surfaces[levels[i]], target_rects[i])
     pygame.display.flip()
+    return local_clock()
+
+def draw_targets(levels, prev):
+    """只更新灰度变化的方块（dirty rects）；返回翻转完成时刻"""
+    dirty = []
+    for i, lv in enumerate(levels):
+        if lv != prev[i]:
+            screen.blit(surfaces[lv], target_rects[i])
+            dirty.append(target_rects[i])
+    pygame.display.update(dirty)
+    return local_clock()
+
+def wait_frames(dur):
+    """静态画面保持 dur 秒：只处理事件、按刷新率节拍，不重画"""
+    t0 = time.time()
+    while time.time() - t0 < dur:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT: pygame.quit(); sys.exit(0)
+        clock.tick(SCREEN_REFRESH)
 
 # Trial 列表：每个目标重复 BLOCK_TRIALS 次并打乱
 trials = []
-for idx in range(4):
-    trials += [idx]*BLOCK_TRIALS
+for idx in range(len(FREQS)):
+    trials += [idx]*args.trials
 random.shuffle(trials)
 
-# 主循环
+# 帧时序日志
+run_dir = os.path.join(args.outdir, args.runname or datetime.now().strftime('%Y%m%d-%H%M%S'))
+os.makedirs(run_dir, exist_ok=True)
+frames = FrameLog(run_dir)
+print(f"[INFO] Frame log: {run_dir}", flush=True)
+
+# 主循环（所有标记都以对应画面实际翻转完成的时刻打时间戳）
 try:
+    off = [LUM_MIN]*len(FREQS)
     for t_idx, target in enumerate(trials, 1):
         # 显示提示
-        cue_text = font.render(f"Focus target freq: {int(FREQS[target])} Hz", True, (255,255,0))
+        cue_text = font.render(f"Focus target {target+1}: {FREQS[target]:g} Hz", True, (255,255,0))
         screen.fill((0,0,0)); screen.blit(cue_text, (w//2 - cue_text.get_width()//2, h//2))
         pygame.display.flip()
-        outlet.push_sample([f"CUE|{FREQS[target]}"], local_clock())
-        cue_t0 = time.time()
-        while time.time() - cue_t0 < CUE_LEN:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT: pygame.quit(); sys.exit(0)
-            clock.tick(SCREEN_REFRESH)
+        outlet.push_sample([f"CUE|{FREQS[target]}|{target}"], local_clock())  # flip 返回即为提示画面上屏时刻
+        wait_frames(CUE_LEN)
 
-        # 刺激期
-        states = [True, True, True, True]
-        counters = [0,0,0,0]
-        outlet.push_sample([f"TRIAL_START|{FREQS[target]}"], local_clock())
-        trial_t0 = time.time()
+        # 刺激期：按帧序号查亮度表（帧数固定为 TRIAL_LEN*刷新率）；TRIAL_START 取首帧翻转时刻
+        levels = [tab[0] for tab in LUM_TABLES]
+        t_on = draw_background(levels, highlight_idx=target)  # 研究阶段：高亮真值目标
+        outlet.push_sample([f"TRIAL_START|{FREQS[target]}|{target}"], t_on)
+        frames.start(t_idx, target, FREQS[target], t_on)
+        clock.tick(SCREEN_REFRESH)
 
-        while time.time() - trial_t0 < TRIAL_LEN:
+        k = 0
+        while k + 1 < N_FRAMES:
             for event in pygame.event.get():
                 if event.type == pygame.QUIT: pygame.quit(); sys.exit(0)
-            # 更新每个方块的闪烁
-            for i in range(4):
-                counters[i] += 1
-                if counters[i] >= half_period_frames[i]:
-                    states[i] = not states[i]
-                    counters[i] = 0
-            draw_targets(states, highlight_idx=target)  # 研究阶段：高亮真值目标
+            prev, levels = levels, [tab[k+1] for tab in LUM_TABLES]
+            t = draw_targets(levels, prev)
+            k += 1 + frames.flip(t, k + 1)  # 漏帧后跳过相应帧序号，保持调制相位
             clock.tick(SCREEN_REFRESH)
 
-        outlet.push_sample([f"TRIAL_END|{FREQS[target]}"], local_clock())
-
-        # 休息期
-        outlet.push_sample(["REST_START"], local_clock())
-        rest_t0 = time.time()
-        while time.time() - rest_t0 < REST_LEN:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT: pygame.quit(); sys.exit(0)
-            draw_targets([False, False, False, False])
-            clock.tick(SCREEN_REFRESH)
+        # 休息期：TRIAL_END / REST_START 取刺激熄灭画面的翻转时刻
+        t_off = draw_background(off)
+        frames.end(t_off)
+        outlet.push_sample([f"TRIAL_END|{FREQS[target]}|{target}"], t_off)
+        outlet.push_sample(["REST_START"], t_off)
+        wait_frames(REST_LEN)
         outlet.push_sample(["REST_END"], local_clock())
 
     pygame.quit()
 except KeyboardInterrupt:
     pygame.quit()
-
-
+finally:
+    frames.close()
+    print(f"[FRAMES] total dropped frames: {frames.total_dropped}", flush=True)
@@ -0,0 +1,51 @@
+# tests/test_sliding_cca.py
+# 增量 CCA 与直接 QR/SVD CCA 的一致性：混合块长（含 >= 窗长的大块）下逐块比较 corr()
+import os, sys
+import numpy as np
+import pytest
+from scipy.signal import butter, sosfilt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "online"))
+from sliding_cca import SlidingCCA, ref_block  # noqa: E402
+
+FS, C, WIN = 250, 4, 200  # 窗长不是各频率周期的整数倍，错位会直接体现在相关系数上
+FREQS = [8.0, 10.0, 12.0, 15.0]
+
+
+def direct_corr(X, Y):
+    """中心化后用 QR + SVD 求最大典型相关系数"""
+    qx, _ = np.linalg.qr(X - X.mean(axis=0))
+    qy, _ = np.linalg.qr(Y - Y.mean(axis=0))
+    return np.linalg.svd(qx.T @ qy, compute_uv=False)[0]
+
+
+def signal(n, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) / FS
+    x = rng.standard_normal((n, C))
+    x[:, :2] += np.sin(2*np.pi*10.0*t + 0.3)[:, None]
+    return x
+
+
+@pytest.mark.parametrize("chunks", [
+    [13, 250],
+    [13, 200],
+    [100, 300, 10, 10, 10, 37, 260, 5, 5, 5],
+    [7] * 80,
+    [999, 1, 2, 3, 251, 4],
+])
+def test_matches_direct_cca(chunks):
+    sos = butter(4, [6/(FS/2), 40/(FS/2)], btype='band', output='sos')
+    x = signal(sum(chunks))
+    y = sosfilt(sos, x, axis=0)  # 与 SlidingCCA 相同的因果滤波
+    sc = SlidingCCA(FS, C, FREQS, WIN, sos, refresh=3)
+    n = 0
+    for m in chunks:
+        sc.update(x[n:n+m])
+        n += m
+        c = min(n, WIN)
+        if c < 4*C:
+            continue
+        ref = ref_block(n - c, c, FS, FREQS)
+        want = [direct_corr(y[n-c:n], ref[k]) for k in range(len(FREQS))]
+        np.testing.assert_allclose(sc.corr(), want, atol=1e-6)